@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, Request, Response
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from app.core.config import config
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.metrics import TTS_BYTES, audio_format, voice_label
+from app.core.tracing import exporter as trace_exporter, query_traces, span
 from app.services.xf_service import xf_service
-from app.core.logger import log_queue, logger
+from app.services.batch_service import BatchItem, run_batch, zip_stream
+from app.services.job_queue import job_queue
+from app.services.stream_service import StreamSession
+from app.services.warmup import warmup_service
+from app.core.logger import log_queue, logger, pipeline_stats
 import os
+import logging
 import json
 import asyncio
 
@@ -29,6 +37,7 @@ class SettingsUpdate(BaseModel):
     default_volume: Optional[int] = None
     default_audio_type: Optional[str] = None
     cache_limit: Optional[int] = None
+    cache_limit_bytes: Optional[int] = None
     log_level: Optional[str] = None
     key: Optional[str] = None
 
@@ -49,12 +58,13 @@ def verify_key(key: Optional[str] = None):
     raise HTTPException(status_code=401, detail="Unauthorized")
 
 @router.post("/tts")
-async def generate_tts(req: TTSRequest):
+async def generate_tts(req: TTSRequest, request: Request):
     verify_key(req.key)
-    return await _process_tts(req)
+    return await _process_tts(req, request)
 
 @router.get("/tts")
 async def generate_tts_get(
+    request: Request,
     text: str,
     voice: Optional[str] = None,
     speed: Optional[int] = None,
@@ -73,45 +83,61 @@ async def generate_tts_get(
         key=key
     )
     verify_key(key)
-    return await _process_tts(req)
+    return await _process_tts(req, request)
 
-async def _process_tts(req: TTSRequest):
-    import time
-    api_start = time.time()
-    
+def _resolve_params(voice: Optional[str], speed: Optional[int], volume: Optional[int], audio_type: Optional[str]):
+    """用默认设置补全请求参数,并将发音人解析为代码"""
     settings = config.get_settings()
     
-    voice = req.voice or settings.get("default_speaker", "聪小糖")
-    speed = req.speed if req.speed is not None else settings.get("default_speed", 100)
-    volume = req.volume if req.volume is not None else settings.get("default_volume", 100)
-    audio_type = req.audio_type or settings.get("default_audio_type", "audio/mp3")
+    voice = voice or settings.get("default_speaker", "聪小糖")
+    speed = speed if speed is not None else settings.get("default_speed", 100)
+    volume = volume if volume is not None else settings.get("default_volume", 100)
+    audio_type = audio_type or settings.get("default_audio_type", "audio/mp3")
     
     # 如果需要，将发音人名称解析为代码
     # API 需要 'param' (代码)，但用户可能会传递 'name'，或者默认值可能是一个名称。
-    speakers = config.get_speakers()
-    found_speaker = next((s for s in speakers if s.get("name") == voice), None)
-    if found_speaker:
-        param = found_speaker.get("param")
-        if param == '@style':
-            try:
-                extend_ui = json.loads(found_speaker.get("extendUI", "[]"))
-                if isinstance(extend_ui, list):
-                    style_item = next((item for item in extend_ui if item.get("code") == "style"), None)
-                    if style_item and style_item.get("value"):
-                        voice = style_item["value"]
-            except Exception as e:
-                logger.error(f"解析发音人 {voice} 的 extendUI 时出错: {e}")
-                # 回退到 param (即 @style，很可能会失败，但总比在这里崩溃要好)
-                voice = param
-        else:
-            voice = param
+    voice = config.resolve_voice(voice)
+    return voice, speed, volume, audio_type
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 是否命中 (弱比较,忽略 W/ 前缀)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+def _cached_response(request: Request, cache_key: str, media_type: str,
+                     path: Optional[str] = None, data: Optional[bytes] = None) -> Response:
+    """缓存命中的响应: 带 Content-Length 和由缓存键生成的强 ETag
+    
+    磁盘文件交给 FileResponse 发送 (支持单段/多段 Range 和 If-Range),
+    内存数据整段返回;内存命中的 Range 请求在磁盘副本存在时改由文件发送。
+    """
+    etag = f'"{cache_key}"'
+    headers = {"ETag": etag}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if data is not None and not (request.headers.get("range") and path and os.path.exists(path)):
+        return Response(content=data, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+async def _process_tts(req: TTSRequest, request: Request):
+    import time
+    api_start = time.time()
+    
+    voice, speed, volume, audio_type = _resolve_params(req.voice, req.speed, req.volume, req.audio_type)
+    request.state.tts_labels = {"voice": voice_label(voice), "format": audio_format(audio_type)}
     
     try:
         # 使用队列处理方法
         logger.debug(f"[API] 开始请求TTS服务")
         tts_call_start = time.time()
         
-        resp = await xf_service.process_tts_request(req.text, voice, speed, volume, audio_type=audio_type)
+        with span("tts", voice=voice, format=audio_type, speed=speed, volume=volume, chars=len(req.text)):
+            resp = await xf_service.process_tts_request(req.text, voice, speed, volume, audio_type=audio_type)
         
         tts_call_time = (time.time() - tts_call_start) * 1000
         logger.debug(f"[API] TTS服务返回: {tts_call_time:.0f}ms")
@@ -119,17 +145,245 @@ async def _process_tts(req: TTSRequest):
         api_total = (time.time() - api_start) * 1000
         logger.debug(f"[API] 请求处理总耗时: {api_total:.0f}ms")
         
+        # 缓存命中直接返回完整文件/数据,其余 (上游流、分段合成) 以流式输出
+        if isinstance(resp, xf_service.FileStreamResponse):
+            return _cached_response(request, resp.cache_key, audio_type, path=resp.path)
+        if isinstance(resp, xf_service.MemoryStreamResponse) and resp.cache_key:
+            return _cached_response(request, resp.cache_key, audio_type, path=resp.path, data=resp.data)
+        
+        # 上游流为异步迭代器,缓存文件为同步迭代器 (由 Starlette 放入线程池读取)
+        if hasattr(resp, "aiter_content"):
+            content = resp.aiter_content(chunk_size=4096)
+        else:
+            content = resp.iter_content(chunk_size=4096)
+        
         if req.stream:
-            return StreamingResponse(resp.iter_content(chunk_size=4096), media_type=audio_type)
+            return StreamingResponse(content, media_type=audio_type)
         else:
-            return StreamingResponse(resp.iter_content(chunk_size=4096), media_type=audio_type)
+            return StreamingResponse(content, media_type=audio_type)
             
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.websocket("/tts/stream")
+async def tts_stream(
+    websocket: WebSocket,
+    voice: Optional[str] = None,
+    speed: Optional[int] = None,
+    volume: Optional[int] = None,
+    audio_type: Optional[str] = None,
+    key: Optional[str] = None
+):
+    """增量文本流式合成 (WebSocket)
+
+    客户端发送 JSON 文本消息: {"type": "text", "text": "片段"} 追加文本,
+    {"type": "flush"} 立即合成未完整的句子, {"type": "end"} 结束输入。
+    服务端按句子顺序返回 sentence_start 事件、二进制音频帧、sentence_end 事件,
+    全部输出后发送 done 事件并关闭连接。
+    """
+    try:
+        verify_key(key)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    
+    voice, speed, volume, audio_type = _resolve_params(voice, speed, volume, audio_type)
+    session = StreamSession(voice, speed, volume, audio_type)
+    labels = {"voice": voice_label(voice), "format": audio_format(audio_type)}
+    logger.info(f"[流式] 连接建立: 发音人={voice}")
+    
+    async def receive() -> bool:
+        """读取客户端消息,正常结束输入时返回 True,客户端断开时返回 False"""
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                session.finish()
+                return False
+            raw = message.get("text")
+            if raw is None:
+                raw = (message.get("bytes") or b"").decode("utf-8", errors="replace")
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                data = None
+            kind = data.get("type") if isinstance(data, dict) else None
+            if kind == "text":
+                session.push(str(data.get("text") or ""))
+            elif kind == "flush":
+                session.flush()
+            elif kind == "end":
+                session.finish()
+                return True
+            else:
+                session.notify({"type": "error", "message": "Invalid message, expected type text/flush/end"})
+    
+    receiver = asyncio.create_task(receive())
+    try:
+        async for event in session.events():
+            if isinstance(event, bytes):
+                await websocket.send_bytes(event)
+                TTS_BYTES.inc(len(event), **labels)
+            else:
+                await websocket.send_json(event)
+        if await receiver:
+            await websocket.send_json({
+                "type": "done",
+                "sentences": session.sentences,
+                "first_audio_ms": session.first_audio_ms,
+            })
+            await websocket.close()
+        logger.info(
+            f"[流式] 会话结束: {session.sentences} 句, {session.characters} 字, "
+            f"首段音频 {session.first_audio_ms}ms"
+        )
+    except Exception as e:
+        # 客户端中途断开时发送失败
+        logger.debug(f"[流式] 连接中断: {e}")
+    finally:
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
+        await session.close()
+
+class BatchTTSItem(BaseModel):
+    text: str
+    voice: Optional[str] = None
+    speed: Optional[int] = None
+    volume: Optional[int] = None
+    audio_type: Optional[str] = None
+    id: Optional[str] = None
+
+class BatchTTSRequest(BaseModel):
+    items: List[BatchTTSItem]
+    format: Optional[str] = "ndjson"
+    concurrency: Optional[int] = None
+    key: Optional[str] = None
+
+@router.post("/tts/batch")
+async def generate_tts_batch(req: BatchTTSRequest):
+    """批量合成: 并发处理所有条目,按完成顺序流式返回
+
+    format=ndjson 时每行一个 JSON 结果 (含缓存地址),format=zip 时返回包含所有音频的 ZIP
+    """
+    verify_key(req.key)
+    if req.format not in ("ndjson", "zip"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'zip'")
+    
+    items = []
+    for index, item in enumerate(req.items):
+        voice, speed, volume, audio_type = _resolve_params(item.voice, item.speed, item.volume, item.audio_type)
+        items.append(BatchItem(index, item.text, voice, speed, volume, audio_type, item.id))
+    logger.info(f"[批量] 收到批量请求: {len(items)} 条, 格式={req.format}")
+    
+    results = run_batch(items, req.concurrency)
+    if req.format == "zip":
+        return StreamingResponse(
+            zip_stream(results),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="tts_batch.zip"'},
+        )
+    
+    async def ndjson_lines():
+        async for result in results:
+            for item in result.items:
+                line = {"index": item.index, "id": item.item_id, "text": item.text}
+                if result.error is None:
+                    line.update({"status": "success", "cache_key": result.cache_key, "url": f"/api/cache/{result.cache_key}"})
+                else:
+                    line.update({"status": "error", "error": result.error})
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+class JobSubmitRequest(BaseModel):
+    text: str
+    voice: Optional[str] = None
+    speed: Optional[int] = None
+    volume: Optional[int] = None
+    audio_type: Optional[str] = None
+    key: Optional[str] = None
+
+@router.post("/jobs")
+async def submit_job(req: JobSubmitRequest):
+    """提交异步合成任务,立即返回任务 ID"""
+    verify_key(req.key)
+    voice, speed, volume, audio_type = _resolve_params(req.voice, req.speed, req.volume, req.audio_type)
+    job = await job_queue.submit(req.text, voice, speed, volume, audio_type)
+    return job_queue.describe(job)
+
+@router.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 100, key: Optional[str] = None):
+    verify_key(key)
+    jobs = await asyncio.to_thread(job_queue.store.list, status, min(max(limit, 1), 1000))
+    counts = await asyncio.to_thread(job_queue.store.counts)
+    return {"counts": counts, "jobs": [job_queue.describe(job) for job in jobs]}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, key: Optional[str] = None):
+    verify_key(key)
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_queue.describe(job)
+
+@router.get("/jobs/{job_id}/audio")
+async def get_job_audio(job_id: str, request: Request, key: Optional[str] = None):
+    """下载已完成任务的音频"""
+    verify_key(key)
+    job = await asyncio.to_thread(job_queue.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return await get_cached_audio(job["cache_key"], request, key)
+
+def _negotiate_encoding(accept_encoding: Optional[str], available) -> str:
+    """按 Accept-Encoding 选择压缩格式 (br 优先于 gzip),不接受压缩时返回 identity"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            k, _, v = param.strip().partition("=")
+            if k.strip() == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
 @router.get("/speakers")
-async def get_speakers():
-    return config.get_speakers()
+async def get_speakers(
+    request: Request,
+    fields: Optional[str] = None,
+    locale: Optional[str] = None,
+    gender: Optional[str] = None,
+    type: Optional[str] = None,
+):
+    """发音人列表
+    
+    每个配置版本下,同一字段/筛选组合只序列化、压缩一次;
+    支持 If-None-Match (304)、gzip/br 压缩和字段投影 (fields=name,param,...)。
+    """
+    field_names = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else None
+    filters = tuple((k, v) for k, v in (("locale", locale), ("gender", gender), ("type", type)) if v is not None)
+    variant = config.speaker_index.encoded(field_names, filters)
+    
+    encoding = _negotiate_encoding(request.headers.get("accept-encoding"), variant)
+    etag = f'"{variant["etag"]}"' if encoding == "identity" else f'"{variant["etag"]}-{encoding}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=variant[encoding], media_type="application/json", headers=headers)
 
 @router.get("/settings")
 async def get_settings(key: Optional[str] = None):
@@ -137,7 +391,7 @@ async def get_settings(key: Optional[str] = None):
     # 但是前端需要看到它才能进行编辑。
     # 如果启用了身份验证，则需要密钥。
     verify_key(key)
-    settings = config.get_settings().copy()
+    settings = dict(config.get_settings())
     settings["has_avatars"] = os.path.exists("data/multitts/xfpeiyin/avatar")
     return settings
 
@@ -145,28 +399,12 @@ async def get_settings(key: Optional[str] = None):
 async def update_settings(req: SettingsUpdate):
     verify_key(req.key)
     
-    current_settings = config.get_settings()
-    
-    if req.auth_enabled is not None:
-        config.update_setting("auth_enabled", req.auth_enabled)
-    if req.admin_password is not None:
-        config.update_setting("admin_password", req.admin_password)
-    if req.special_symbol_mapping is not None:
-        config.update_setting("special_symbol_mapping", req.special_symbol_mapping)
-    if req.default_speaker is not None:
-        config.update_setting("default_speaker", req.default_speaker)
-    if req.default_speed is not None:
-        config.update_setting("default_speed", req.default_speed)
-    if req.default_volume is not None:
-        config.update_setting("default_volume", req.default_volume)
-    if req.default_audio_type is not None:
-        config.update_setting("default_audio_type", req.default_audio_type)
-    if req.cache_limit is not None:
-        config.update_setting("cache_limit", req.cache_limit)
-    if req.log_level is not None:
-        config.update_setting("log_level", req.log_level)
+    # 只写入请求中提供的字段,一次性写入文件
+    changes = {k: v for k, v in vars(req).items() if k != "key" and v is not None}
+    if changes:
+        await config.update_settings(changes)
         
-    return {"status": "success", "settings": config.get_settings()}
+    return {"status": "success", "settings": dict(config.get_settings())}
 
 @router.post("/login")
 async def login(req: dict):
@@ -182,41 +420,167 @@ async def reload_config(req: dict):
     try:
         config.reload_config()
         logger.info("配置已通过 API 请求重新加载。")
-        return {"status": "success", "message": "Configuration reloaded"}
+        return {"status": "success", "message": "Configuration reloaded", "catalog": config.catalog_report}
     except Exception as e:
         logger.error(f"通过 API 重新加载配置失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class CachePurgeRequest(BaseModel):
+    voice: Optional[str] = None
+    older_than_days: Optional[float] = None
+    key: Optional[str] = None
+
+@router.get("/cache/stats")
+async def cache_stats(key: Optional[str] = None):
+    verify_key(key)
+    return await xf_service.cache_stats()
+
+@router.post("/cache/purge")
+async def cache_purge(req: CachePurgeRequest):
+    """按发音人和/或缓存时间清理缓存,两者都不传时清空全部缓存"""
+    verify_key(req.key)
+    voice_code = config.resolve_voice(req.voice) if req.voice else None
+    older_than = req.older_than_days * 86400 if req.older_than_days is not None else None
+    removed = await xf_service.purge_cache(voice_code, older_than)
+    logger.info(f"[缓存] 通过 API 清理缓存: 发音人={req.voice or '全部'}, 清理 {removed} 个文件")
+    return {"status": "success", "removed": removed}
+
+@router.get("/upstream/status")
+async def upstream_status(key: Optional[str] = None):
+    """上游并发上限、排队数量与重试预算"""
+    verify_key(key)
+    return xf_service.upstream_stats()
+
+@router.get("/warmup")
+async def warmup_status(key: Optional[str] = None):
+    """缓存预热进度,以及按当前清单估算的待生成条数、字数和上游请求数"""
+    verify_key(key)
+    return await warmup_service.status()
+
+@router.post("/warmup/run")
+async def warmup_run(req: dict):
+    """立即按清单执行一次预热"""
+    verify_key(req.get("key"))
+    try:
+        run = warmup_service.trigger("manual")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info("[预热] 通过 API 触发预热")
+    return {"status": "success", "run": run}
+
+@router.post("/warmup/cancel")
+async def warmup_cancel(req: dict):
+    verify_key(req.get("key"))
+    cancelled = await warmup_service.cancel()
+    return {"status": "success", "cancelled": cancelled}
+
+@router.get("/traces")
+async def list_traces(
+    min_ms: float = 0,
+    name: Optional[str] = None,
+    request_id: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = 20,
+    key: Optional[str] = None
+):
+    """查询已导出的请求追踪 (按耗时从高到低),如 ?min_ms=3000&name=/api/tts"""
+    verify_key(key)
+    traces = await asyncio.to_thread(query_traces, min_ms, name, request_id, status, min(max(limit, 1), 200))
+    return {"exporter": trace_exporter.stats(), "traces": traces}
+
+@router.get("/cache/{cache_key}")
+async def get_cached_audio(cache_key: str, request: Request, key: Optional[str] = None):
+    """按缓存键获取已生成的音频 (批量、异步任务结果中的 url)"""
+    verify_key(key)
+    path = xf_service.get_cached_path(cache_key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Cached audio not found")
+    media_type = "audio/" + cache_key.rsplit(".", 1)[-1]
+    request.state.tts_labels = {"voice": "", "format": audio_format(media_type)}
+    return _cached_response(request, cache_key, media_type, path=path)
+
+@router.get("/logs/stats")
+async def log_stats(key: Optional[str] = None):
+    """日志管道状态 (入口队列积压、丢弃的日志条数、实时查看端数量)"""
+    verify_key(key)
+    return pipeline_stats()
+
+# 日志流: 一帧最多合并的日志条数、收到日志后等待后续日志合并发送的时间、无新日志时发送心跳的间隔 (秒)
+LOG_BATCH_MAX = 200
+LOG_BATCH_DELAY = 0.05
+LOG_HEARTBEAT_SECONDS = 15
+
 @router.get("/logs")
-async def stream_logs(request: Request):
+async def stream_logs(
+    request: Request,
+    level: Optional[str] = None,
+    q: Optional[str] = None,
+    tail: Optional[int] = None,
+    last_event_id: Optional[int] = None
+):
+    """以 SSE 推送日志
+
+    每条日志的事件 ID 递增,断线重连时浏览器自动带上 Last-Event-ID 请求头,
+    只补发断开之后的日志;首次连接发送历史日志 (tail 限制条数)。
+    level 为最低级别 (如 WARNING),q 为关键字,均在服务端过滤。
+    """
+    min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+    if not isinstance(min_level, int):
+        raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+
     async def log_generator():
-        queue = asyncio.Queue()
-        # 将队列放入日志处理程序，以便新日志进入此特定队列
-        log_queue.subscribe(queue)
+        # 先订阅再取历史,两者重叠的日志按序号去重
+        # 订阅有界队列: 查看端跟不上时丢弃最旧的日志,不会无限占用内存
+        subscription = log_queue.subscribe(min_level, q)
+        queue = subscription.queue
+        sent = last_event_id or 0
         
         try:
-            # 首先，发送所有历史日志
-            initial_logs = list(log_queue)
-            for log_record in initial_logs:
-                yield f"data: {json.dumps(log_record)}\n\n"
+            # 首先，发送历史日志 (重连时只发送断开后的部分)
+            history = log_queue.snapshot(last_event_id)
+            if last_event_id is not None and last_event_id <= log_queue.last_seq:
+                if history and history[0].seq > last_event_id + 1:
+                    yield f"event: gap\ndata: {history[0].seq - last_event_id - 1}\n\n".encode("utf-8")
+            else:
+                sent = 0
+            history = [entry for entry in history if subscription.accepts(entry)]
+            if last_event_id is None and tail is not None:
+                history = history[-tail:] if tail > 0 else []
+            for i in range(0, len(history), LOG_BATCH_MAX):
+                batch = history[i:i + LOG_BATCH_MAX]
+                sent = batch[-1].seq
+                yield b"".join(entry.frame for entry in batch)
 
-            # 然后，监听新日志
+            # 然后，监听新日志 (突发时把队列中已有的日志合并为一帧发送)
             while True:
                 try:
-                    # 等待新日志，设置超时以定期检查连接状态
-                    log_record = await asyncio.wait_for(queue.get(), timeout=1.0)
-                    yield f"data: {json.dumps(log_record)}\n\n"
-                    queue.task_done()
+                    entry = await asyncio.wait_for(queue.get(), timeout=LOG_HEARTBEAT_SECONDS)
                 except asyncio.TimeoutError:
-                    # 超时后，检查客户端是否已断开连接
+                    # 心跳: 保持连接,并检查客户端是否已断开连接
                     if await request.is_disconnected():
                         break
+                    yield b": ping\n\n"
+                    continue
+                batch = [entry]
+                if queue.empty():
+                    await asyncio.sleep(LOG_BATCH_DELAY)
+                while len(batch) < LOG_BATCH_MAX and not queue.empty():
+                    batch.append(queue.get_nowait())
+                frames = [entry.frame for entry in batch if entry.seq > sent]
+                if frames:
+                    sent = batch[-1].seq
+                    yield b"".join(frames)
         except asyncio.CancelledError:
             # 当服务器关闭时，Uvicorn 会取消任务，捕获此异常
             logger.debug("日志流任务被取消。")
         finally:
             # 确保我们取消订阅队列以避免内存泄漏
-            log_queue.unsubscribe(queue)
+            log_queue.unsubscribe(subscription)
+            if subscription.dropped:
+                logger.debug(f"日志流客户端处理过慢,共丢弃 {subscription.dropped} 条日志。")
             logger.debug("日志流客户端已断开连接并已取消订阅。")
 
     return StreamingResponse(log_generator(), media_type="text/event-stream")
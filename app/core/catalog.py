@@ -0,0 +1,182 @@
+"""
+发音人目录快照模块
+
+解析 data/config.yaml 与 data/multitts/config.yaml (纯 Python YAML 解析较慢) 的结果
+以 JSON 快照保存在 data/catalog.json 中,按源文件的 mtime、大小和内容哈希判断是否有效:
+- 快照有效时直接读取,启动和重载只需几毫秒
+- 源文件已变更时先使用旧快照,在后台线程中重新解析并替换
+- 没有可用快照时同步解析并生成快照
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from app.core.logger import logger
+
+SNAPSHOT_PATH = "data/catalog.json"
+# 快照格式版本,格式或解析逻辑变化时递增,使旧快照失效
+SNAPSHOT_VERSION = 1
+
+# (路径, 是否必需): 必需的源文件缺失时给出警告
+SOURCES = [
+    ("data/config.yaml", True),
+    ("data/multitts/config.yaml", False),
+]
+
+JAVA_SPEAKER_TAG = 'tag:yaml.org,2002:org.nobody.multitts.tts.speaker.Speaker'
+
+# 优先使用 libyaml 的 C 实现
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _speaker_constructor(loader, node):
+    # 为 Java 标签注册构造函数
+    return loader.construct_mapping(node, deep=True)
+
+
+yaml.add_constructor(JAVA_SPEAKER_TAG, _speaker_constructor, Loader=yaml.SafeLoader)
+if _Loader is not yaml.SafeLoader:
+    yaml.add_constructor(JAVA_SPEAKER_TAG, _speaker_constructor, Loader=_Loader)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path: str, with_hash: bool = True) -> Optional[Dict[str, Any]]:
+    """源文件的指纹 (文件不存在时返回 None)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    result = {"mtime": st.st_mtime, "size": st.st_size}
+    if with_hash:
+        result["sha256"] = _file_hash(path)
+    return result
+
+
+def parse_sources() -> List[Dict[str, Any]]:
+    """解析全部 YAML 源文件,返回发音人列表"""
+    speakers: List[Dict[str, Any]] = []
+    for path, required in SOURCES:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = yaml.load(f, Loader=_Loader)
+            if data and "xfpeiyin" in data:
+                speakers.extend(data["xfpeiyin"])
+        except FileNotFoundError:
+            # 扩展配置是可选的,找不到是正常行为,无需提示
+            if required:
+                logger.warning(f"未找到配置文件 {os.path.basename(path)}。")
+        except Exception as e:
+            logger.error(f"加载 {path} 出错: {e}")
+    return speakers
+
+
+def read_snapshot() -> Optional[Dict[str, Any]]:
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"[目录] 读取发音人目录快照失败,将重新解析: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def is_fresh(snapshot: Dict[str, Any]) -> bool:
+    """快照是否与当前源文件一致
+
+    mtime 和大小一致时直接视为有效;仅 mtime 变化 (如文件被 touch) 时再比较内容哈希。
+    """
+    recorded = snapshot.get("sources", {})
+    for path, _ in SOURCES:
+        old = recorded.get(path)
+        current = _fingerprint(path, with_hash=False)
+        if old is None or current is None:
+            if old is not current:
+                return False
+            continue
+        if old["size"] != current["size"]:
+            return False
+        if old["mtime"] != current["mtime"] and old.get("sha256") != _file_hash(path):
+            return False
+    return True
+
+
+def build_snapshot() -> List[Dict[str, Any]]:
+    """解析源文件并写入快照 (先记录指纹再解析,解析期间的修改会在下次加载时被发现)"""
+    sources = {path: _fingerprint(path) for path, _ in SOURCES}
+    speakers = parse_sources()
+    snapshot = {"version": SNAPSHOT_VERSION, "sources": sources, "speakers": speakers}
+    try:
+        os.makedirs(os.path.dirname(SNAPSHOT_PATH), exist_ok=True)
+        temp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, default=str)
+        # 多个 worker 同时重建时,原子替换保证读到的快照总是完整的
+        os.replace(temp_path, SNAPSHOT_PATH)
+    except Exception as e:
+        logger.warning(f"[目录] 写入发音人目录快照失败: {e}")
+    return speakers
+
+
+_rebuild_lock = threading.Lock()
+
+
+def load_speakers():
+    """加载发音人列表
+
+    Returns:
+        (发音人列表, 加载报告);报告中 source 为 stale_snapshot 时,
+        调用方应在启用旧列表后调用 rebuild_in_background
+    """
+    start = time.perf_counter()
+    snapshot = read_snapshot()
+    if snapshot is not None and is_fresh(snapshot):
+        speakers, source = snapshot["speakers"], "snapshot"
+    elif snapshot is not None:
+        # 源文件已变更: 先使用旧快照,后台重新解析
+        speakers, source = snapshot["speakers"], "stale_snapshot"
+    else:
+        speakers, source = build_snapshot(), "parsed"
+
+    report = {
+        "source": source,
+        "speakers": len(speakers),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return speakers, report
+
+
+def rebuild_in_background(on_rebuilt: Callable[[List[Dict[str, Any]]], None]):
+    """在后台线程中重新解析源文件并写入快照,完成后以新的发音人列表调用 on_rebuilt"""
+    if not _rebuild_lock.acquire(blocking=False):
+        # 已有重建在进行中
+        return
+
+    def run():
+        try:
+            start = time.perf_counter()
+            speakers = build_snapshot()
+            on_rebuilt(speakers)
+            logger.info(f"[目录] 发音人目录已在后台重建: {len(speakers)} 个, {(time.perf_counter() - start) * 1000:.0f}ms")
+        except Exception as e:
+            logger.error(f"[目录] 后台重建发音人目录失败: {e}")
+        finally:
+            _rebuild_lock.release()
+
+    threading.Thread(target=run, name="catalog-rebuild", daemon=True).start()
@@ -0,0 +1,115 @@
+"""
+熔断器模块
+
+上游错误率超过阈值时熔断,在冷却期内直接拒绝请求 (快速失败),
+冷却结束后放行少量探测请求,探测成功则恢复,失败则继续熔断。
+"""
+
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+from app.core.config import config
+from app.core.logger import logger
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态,请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """基于滑动窗口错误率的熔断器"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _settings():
+        settings = config.get_settings()
+        return (
+            float(settings.get("circuit_failure_rate", 0.5)),
+            int(settings.get("circuit_min_requests", 20)),
+            float(settings.get("circuit_window", 30)),
+            float(settings.get("circuit_cooldown", 30)),
+            int(settings.get("circuit_half_open_probes", 1)),
+        )
+
+    def before_call(self):
+        """请求前检查,熔断时抛出 CircuitOpenError"""
+        _, _, _, cooldown, max_probes = self._settings()
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < cooldown:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name}熔断中,请稍后再试")
+            self.state = self.HALF_OPEN
+            self._probes = 0
+            logger.info(f"[熔断] {self.name} 进入半开状态,放行探测请求")
+        if self.state == self.HALF_OPEN:
+            if self._probes >= max_probes:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name}熔断探测中,请稍后再试")
+            self._probes += 1
+
+    def available(self) -> bool:
+        """before_call 此时是否会放行 (打开状态下冷却已结束也算,下一次调用即为探测请求)"""
+        _, _, _, cooldown, max_probes = self._settings()
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= cooldown
+        if self.state == self.HALF_OPEN:
+            return self._probes < max_probes
+        return True
+
+    def record(self, success: bool):
+        """记录一次请求结果"""
+        failure_rate, min_requests, window, _, _ = self._settings()
+        now = time.monotonic()
+
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if success:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                logger.info(f"[熔断] {self.name} 探测成功,已恢复")
+            else:
+                self._trip(now, "探测失败")
+            return
+
+        self._outcomes.append((now, success))
+        while self._outcomes and now - self._outcomes[0][0] > window:
+            self._outcomes.popleft()
+
+        if self.state == self.CLOSED and not success and len(self._outcomes) >= min_requests:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            rate = failures / len(self._outcomes)
+            if rate >= failure_rate:
+                self._trip(now, f"错误率 {rate:.0%}")
+
+    def release(self):
+        """请求被取消 (无结果) 时归还探测名额"""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _trip(self, now: float, reason: str):
+        self.state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        _, _, _, cooldown, _ = self._settings()
+        logger.error(f"[熔断] {self.name} 已熔断 ({reason}),{cooldown:.0f} 秒内快速失败")
+
+    def stats(self) -> dict:
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_requests": len(self._outcomes),
+            "window_failures": failures,
+            "rejected": self.rejected,
+        }
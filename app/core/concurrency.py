@@ -0,0 +1,203 @@
+"""
+自适应并发控制模块
+
+基于 AIMD (加性增、乘性减) 的上游并发限制器:
+- 请求成功且延迟正常时,并发上限缓慢增加 (每完成一个窗口的请求 +1)
+- 请求失败或延迟明显升高时,并发上限按比例下降
+- 超过上限的请求在本地排队,而不是继续压向上游
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional
+
+from app.core.config import config
+from app.core.logger import logger
+from app.core.retry import is_retryable
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发限制器"""
+
+    # 两次下调之间的最小间隔(秒),避免同一次故障引发的一批失败把上限连续砍到底
+    DECREASE_COOLDOWN = 1.0
+    # 短期/长期延迟均值的平滑系数
+    SHORT_ALPHA = 0.2
+    LONG_ALPHA = 0.02
+
+    def __init__(self, name: str):
+        self.name = name
+        self._limit = None
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._short_latency = None
+        self._long_latency = None
+        self._last_decrease = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    @staticmethod
+    def _settings():
+        settings = config.get_settings()
+        return (
+            float(settings.get("upstream_limit_initial", 8)),
+            float(settings.get("upstream_limit_min", 1)),
+            float(settings.get("upstream_limit_max", 64)),
+            float(settings.get("upstream_latency_tolerance", 2.0)),
+        )
+
+    @property
+    def limit(self) -> float:
+        if self._limit is None:
+            initial, low, high, _ = self._settings()
+            self._limit = min(max(initial, low), high)
+        return self._limit
+
+    def _capacity(self) -> int:
+        return max(1, int(self.limit))
+
+    async def _acquire(self):
+        if self._inflight < self._capacity() and not self._waiters:
+            self._inflight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配到名额但随即被取消,归还名额
+                self._inflight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def _wake(self):
+        while self._waiters and self._inflight < self._capacity():
+            future = self._waiters.popleft()
+            if not future.done():
+                self._inflight += 1
+                future.set_result(None)
+
+    def has_headroom(self) -> bool:
+        """当前没有排队且仍有空闲名额 (供低优先级的后台任务判断是否让路)"""
+        return not self._waiters and self._inflight < self._capacity()
+
+    def _record(self, success: bool, latency: float):
+        _, low, high, tolerance = self._settings()
+        limit = self.limit
+        if success:
+            self.successes += 1
+            if self._long_latency is None:
+                self._short_latency = self._long_latency = latency
+            else:
+                self._short_latency += self.SHORT_ALPHA * (latency - self._short_latency)
+                self._long_latency += self.LONG_ALPHA * (latency - self._long_latency)
+            overloaded = self._short_latency > self._long_latency * tolerance
+        else:
+            self.failures += 1
+            overloaded = True
+
+        now = time.monotonic()
+        if overloaded:
+            if now - self._last_decrease >= self.DECREASE_COOLDOWN:
+                self._last_decrease = now
+                self._limit = max(low, limit * 0.5)
+                reason = "请求失败" if not success else f"延迟升高 ({self._short_latency * 1000:.0f}ms)"
+                logger.warning(f"[并发控制] {self.name} 上限 {limit:.1f} -> {self._limit:.1f} ({reason})")
+        elif self._inflight >= int(limit) - 1:
+            # 只有在上限接近被用满时才增加,避免空闲时上限无意义地增长
+            self._limit = min(high, limit + 1 / limit)
+
+    async def acquire(self) -> "LimiterPermit":
+        """占用一个并发名额,返回的许可由调用方在请求真正结束时释放 (可跨越多个步骤持有)"""
+        await self._acquire()
+        return LimiterPermit(self)
+
+    @asynccontextmanager
+    async def slot(self):
+        """占用一个并发名额,并根据结果调整上限
+
+        被取消的请求和请求本身有误 (如 4xx) 不计入成功或失败。
+        """
+        permit = await self.acquire()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            permit.release(outcome(error))
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self._inflight,
+            "queued": len(self._waiters),
+            "latency_ms": round(self._short_latency * 1000) if self._short_latency is not None else None,
+            "baseline_latency_ms": round(self._long_latency * 1000) if self._long_latency is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+def outcome(error: Optional[BaseException]) -> Optional[bool]:
+    """请求结果对应的成功/失败;被取消或请求本身有误 (如 4xx) 时返回 None,不计入统计"""
+    if error is None:
+        return True
+    if isinstance(error, asyncio.CancelledError):
+        return None
+    # 只有超时、5xx、429 等可重试错误才说明上游可能过载
+    return False if is_retryable(error) else None
+
+
+class LimiterPermit:
+    """AdaptiveLimiter 的一个名额"""
+
+    def __init__(self, limiter: AdaptiveLimiter):
+        self._limiter = limiter
+        self._start = time.monotonic()
+        self._latency: Optional[float] = None
+        self.released = False
+
+    def mark_latency(self):
+        """以当前时刻作为延迟采样点 (如收到响应头),名额仍继续占用"""
+        if self._latency is None:
+            self._latency = time.monotonic() - self._start
+
+    def release(self, success: Optional[bool] = None):
+        """归还名额 (重复调用无效);success 为 None 时不计入成功或失败"""
+        if self.released:
+            return
+        self.released = True
+        limiter = self._limiter
+        if success is not None:
+            latency = self._latency if self._latency is not None else time.monotonic() - self._start
+            limiter._record(success, latency)
+        limiter._inflight -= 1
+        limiter._wake()
+
+
+class LatencyWindow:
+    """最近若干次请求耗时的滑动窗口,用于估算分位数 (如对冲请求的触发阈值)"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float):
+        """返回第 q 分位数 (0~1),无样本时返回 None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
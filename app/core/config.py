@@ -1,57 +1,106 @@
+import asyncio
 import yaml
 import os
-import time
-from typing import List, Dict, Any
+from types import MappingProxyType
+from typing import List, Dict, Any, Mapping
+from app.core.file_watcher import FileWatcher
 from app.core.logger import logger, set_log_level
+from app.core.speakers import SpeakerIndex
+from app.core import catalog
 
 class Config:
     _instance = None
 
+    SETTINGS_PATH = "data/settings.yaml"
+
+    # settings.yaml 中键的写入顺序
+    ORDERED_KEYS = [
+        "port",
+        "log_level",
+        "auth_enabled",
+        "admin_password",
+        "default_speaker",
+        "default_speed",
+        "default_volume",
+        "cache_limit",
+        "cache_limit_bytes",
+        "generation_interval",
+        "default_audio_type",
+        "special_symbol_mapping",
+        "upstream_pool_size",
+        "upstream_base_url",
+        "retry_max_attempts",
+        "retry_base_delay",
+        "retry_max_delay",
+        "retry_budget_ratio",
+        "sign_cache_ttl",
+        "sign_cache_size",
+        "presign_concurrency",
+        "memory_cache_bytes",
+        "memory_cache_max_item_bytes",
+        "memory_cache_promote_hits",
+        "long_text_threshold",
+        "long_text_chunk_chars",
+        "long_text_concurrency",
+        "batch_concurrency",
+        "job_workers",
+        "job_rate_limit",
+        "job_max_attempts",
+        "job_retention_days",
+        "upstream_limit_initial",
+        "upstream_limit_min",
+        "upstream_limit_max",
+        "upstream_latency_tolerance",
+        "hedge_enabled",
+        "hedge_percentile",
+        "hedge_min_delay",
+        "circuit_failure_rate",
+        "circuit_min_requests",
+        "circuit_window",
+        "circuit_cooldown",
+        "circuit_half_open_probes",
+        "cache_policy",
+        "cache_window_ratio",
+        "cache_protected_ratio",
+        "cache_voice_quota",
+        "cache_voice_quotas",
+        "cache_access_log",
+        "warmup_on_startup",
+        "warmup_time",
+        "warmup_concurrency",
+        "trace_enabled",
+        "trace_sample_ratio",
+        "trace_slow_ms",
+        "trace_file_max_bytes",
+        "trace_file_backups",
+        "trace_otlp_endpoint"
+    ]
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(Config, cls).__new__(cls)
             # 不再自动加载配置，将其移至 lifespan 中手动调用
             # cls._instance.load_config()
-            cls._instance.speakers = []
-            cls._instance.settings = {}
-            cls._instance._settings_mtime = 0
-            cls._instance._last_check_time = 0
+            cls._instance.speaker_index = SpeakerIndex([])
+            cls._instance.catalog_report = {}
+            cls._instance.settings = MappingProxyType({})
+            # 首次读取设置时才从文件加载 (模块导入阶段创建的对象也能读到已配置的值)
+            cls._instance._settings_loaded = False
+            cls._instance._loaded_signature = None
+            cls._instance._watcher = None
+            cls._instance._write_lock = None
         return cls._instance
 
     def load_config(self):
-        self.speakers = []
-        self.settings = {}
-
-        # 为 Java 标签注册构造函数
-        def speaker_constructor(loader, node):
-            fields = loader.construct_mapping(node, deep=True)
-            return fields
-
-        yaml.add_constructor('tag:yaml.org,2002:org.nobody.multitts.tts.speaker.Speaker', speaker_constructor, Loader=yaml.SafeLoader)
-
-        # 加载根目录下的 config.yaml
-        try:
-            with open("data/config.yaml", "r", encoding="utf-8") as f:
-                root_config = yaml.safe_load(f)
-                if root_config and "xfpeiyin" in root_config:
-                    self.speakers.extend(root_config["xfpeiyin"])
-
-        except FileNotFoundError:
-            logger.warning("未找到配置文件 config.yaml。")
-        except Exception as e:
-            logger.error(f"加载 config.yaml 出错: {e}")
-
-        # 加载 multitts/config.yaml
-        try:
-            with open("data/multitts/config.yaml", "r", encoding="utf-8") as f:
-                multitts_config = yaml.safe_load(f)
-                if multitts_config and "xfpeiyin" in multitts_config:
-                    self.speakers.extend(multitts_config["xfpeiyin"])
-        except FileNotFoundError:
-            # 这是可选的扩展配置，找不到是正常行为，无需提示
-            pass
-        except Exception as e:
-            logger.error(f"加载 multitts/config.yaml 出错: {e}")
+        # 发音人目录优先从编译好的快照读取,源文件变更时在后台重新解析后整体替换索引
+        speakers, self.catalog_report = catalog.load_speakers()
+        self.speaker_index = SpeakerIndex(speakers)
+        if self.catalog_report["source"] == "stale_snapshot":
+            catalog.rebuild_in_background(self._on_catalog_rebuilt)
+        logger.info(
+            f"[目录] 已加载 {self.catalog_report['speakers']} 个发音人 "
+            f"({self.catalog_report['source']}, {self.catalog_report['elapsed_ms']:.0f}ms)"
+        )
 
         # 加载 settings.yaml
         if not os.path.exists("data/settings.yaml"):
@@ -90,81 +139,116 @@ class Config:
 
         self._load_settings_from_file()
 
+    def _on_catalog_rebuilt(self, speakers):
+        self.speaker_index = SpeakerIndex(speakers)
+
     def _load_settings_from_file(self):
         try:
-            settings_path = "data/settings.yaml"
-            if os.path.exists(settings_path):
-                with open(settings_path, "r", encoding="utf-8") as f:
-                    self.settings = yaml.safe_load(f) or {}
-                self._settings_mtime = os.path.getmtime(settings_path)
+            if os.path.exists(self.SETTINGS_PATH):
+                signature = self._settings_signature()
+                with open(self.SETTINGS_PATH, "r", encoding="utf-8") as f:
+                    settings = yaml.safe_load(f) or {}
+                self._loaded_signature = signature
             else:
-                self.settings = {}
+                settings = {}
         except Exception as e:
             logger.error(f"加载 settings.yaml 时出错: {e}")
-            self.settings = {}
-            
+            settings = {}
+        self._swap_settings(settings)
+
+    def _swap_settings(self, settings: Dict[str, Any]):
+        """用新的只读快照整体替换当前设置"""
+        self.settings = MappingProxyType(dict(settings))
+        self._settings_loaded = True
         # 设置日志级别
         set_log_level(self.settings.get("log_level", "INFO"))
 
+    def _settings_signature(self):
+        try:
+            st = os.stat(self.SETTINGS_PATH)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
     def get_speakers(self) -> List[Dict[str, Any]]:
-        return self.speakers
-
-    def get_settings(self) -> Dict[str, Any]:
-        # 检查配置文件是否更新 (每5秒检查一次)
-        now = time.time()
-        if now - self._last_check_time > 5:
-            self._last_check_time = now
-            settings_path = "data/settings.yaml"
-            if os.path.exists(settings_path):
-                try:
-                    mtime = os.path.getmtime(settings_path)
-                    if mtime > self._settings_mtime:
-                        logger.info("检测到配置文件变更，正在重新加载...")
-                        self._load_settings_from_file()
-                except Exception as e:
-                    logger.error(f"检查配置文件更新时出错: {e}")
-        
+        return self.speaker_index.speakers
+
+    def resolve_voice(self, voice: str) -> str:
+        """将发音人名称 (或 param、code) 解析为上游使用的代码,未找到时原样返回"""
+        return self.speaker_index.resolve(voice)
+
+    def get_settings(self) -> Mapping[str, Any]:
+        """当前设置的只读快照
+
+        首次调用时 (如 lifespan 之前的模块导入、main 读取端口) 从文件加载一次;
+        之后的变更由后台监听线程负责重新加载,请求路径上不访问文件系统。
+        """
+        if not self._settings_loaded:
+            self._load_settings_from_file()
         return self.settings
 
-    def update_setting(self, key: str, value: Any):
-        self.settings[key] = value
-        
-        # 如果更新了日志级别，立即生效
-        if key == "log_level":
-            set_log_level(value)
+    def start_watcher(self):
+        """监听 settings.yaml 的变更 (需在事件循环中调用)
+
+        所有 worker 进程都监听同一文件,任一进程修改设置后其他进程会立即重新加载。
+        """
+        if self._watcher is None:
+            self._watcher = FileWatcher(self.SETTINGS_PATH, self._on_settings_file_changed)
+            self._watcher.start()
+            logger.debug(f"[配置] 正在监听 settings.yaml ({self._watcher.mode})")
+
+    def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
+    def _on_settings_file_changed(self):
+        signature = self._settings_signature()
+        if signature is None or signature == self._loaded_signature:
+            # 本进程刚写入的变更已生效,无需重新加载
+            return
+        logger.info("检测到配置文件变更，正在重新加载...")
+        self._load_settings_from_file()
+
+    async def update_settings(self, changes: Dict[str, Any]):
+        """修改设置: 立即替换内存快照,并在线程池中原子写入 settings.yaml"""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            settings = await asyncio.to_thread(self._write_settings, changes)
+            self._swap_settings(settings)
+
+    def _write_settings(self, changes: Dict[str, Any]) -> Dict[str, Any]:
+        # 以文件中的最新内容为基础合并,避免覆盖其他 worker 刚写入的修改
+        try:
+            with open(self.SETTINGS_PATH, "r", encoding="utf-8") as f:
+                current = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            current = dict(self.settings)
+        current.update(changes)
         
         # 强制排序
-        ordered_keys = [
-            "port",
-            "log_level",
-            "auth_enabled",
-            "admin_password",
-            "default_speaker",
-            "default_speed",
-            "default_volume",
-            "cache_limit",
-            "generation_interval",
-            "default_audio_type",
-            "special_symbol_mapping"
-        ]
-        
         ordered_settings = {}
         # 按顺序添加键
-        for k in ordered_keys:
-            if k in self.settings:
-                ordered_settings[k] = self.settings[k]
+        for k in self.ORDERED_KEYS:
+            if k in current:
+                ordered_settings[k] = current[k]
         
         # 添加任何剩余的键
-        for k, v in self.settings.items():
-            if k not in ordered_keys:
+        for k, v in current.items():
+            if k not in self.ORDERED_KEYS:
                 ordered_settings[k] = v
                 
         # 写入前确保目录存在
-        settings_path = "data/settings.yaml"
-        os.makedirs(os.path.dirname(settings_path), exist_ok=True)
+        os.makedirs(os.path.dirname(self.SETTINGS_PATH), exist_ok=True)
         
-        with open(settings_path, "w", encoding="utf-8") as f:
+        # 先写临时文件再原子替换,其他进程不会读到写了一半的文件
+        temp_path = f"{self.SETTINGS_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
             yaml.dump(ordered_settings, f, allow_unicode=True, sort_keys=False)
+        os.replace(temp_path, self.SETTINGS_PATH)
+        self._loaded_signature = self._settings_signature()
+        return ordered_settings
 
     def reload_config(self):
         self.load_config()
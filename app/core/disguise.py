@@ -12,12 +12,76 @@
 
 import random
 import time
+import asyncio
 from typing import Optional, Dict, Any
+from curl_cffi import CurlHttpVersion
 from curl_cffi import requests as curl_requests
+from curl_cffi.requests import AsyncSession
 from fake_useragent import UserAgent
+from app.core.config import config
 from app.core.logger import logger
 
 
+class SessionPool:
+    """长连接会话池
+
+    按 impersonate 指纹维护常驻的 curl_cffi AsyncSession,
+    同一指纹的请求复用 TCP/TLS 连接 (keep-alive + HTTP/2 多路复用),
+    每个指纹的并发连接数受 max_clients 限制。
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, AsyncSession] = {}
+        self._loop = None
+
+    def get(self, impersonate: str, enable_http2: bool = True) -> AsyncSession:
+        """获取指定指纹的会话 (不存在则创建)
+
+        Args:
+            impersonate: curl_cffi 的 impersonate 参数
+            enable_http2: 是否启用 HTTP/2
+
+        Returns:
+            AsyncSession 实例
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 会话绑定事件循环,循环变化(如热重载)后旧会话不可再用
+            self._sessions = {}
+            self._loop = loop
+
+        key = f"{impersonate}:{'h2' if enable_http2 else 'h1'}"
+        session = self._sessions.get(key)
+        if session is None:
+            max_clients = int(config.get_settings().get("upstream_pool_size", 10))
+            session = AsyncSession(
+                impersonate=impersonate,
+                max_clients=max(1, max_clients),
+                # 使用枚举常量: 字符串形式 ("v2") 只有较新的 curl_cffi 才支持
+                http_version=CurlHttpVersion.V2_0 if enable_http2 else CurlHttpVersion.V1_1,
+            )
+            self._sessions[key] = session
+            logger.debug(f"[连接池] 已创建会话: {key}, 最大连接数={max_clients}")
+        return session
+
+    async def close(self):
+        """关闭所有会话,释放连接"""
+        sessions = list(self._sessions.values())
+        self._sessions = {}
+        self._loop = None
+        for session in sessions:
+            try:
+                await session.close()
+            except Exception as e:
+                logger.error(f"关闭上游会话时出错: {e}")
+        if sessions:
+            logger.info(f"[连接池] 已关闭 {len(sessions)} 个上游会话")
+
+
+# 全局会话池实例
+session_pool = SessionPool()
+
+
 class DisguiseClient:
     """伪装访问客户端,提供浏览器指纹伪装功能"""
     
@@ -29,6 +93,9 @@ class DisguiseClient:
         "safari": ["safari15_5", "safari15_3"]
     }
     
+    # User-Agent 生成器加载数据较慢,所有客户端共享一个实例
+    _shared_ua = None
+    
     def __init__(self, browser: str = "chrome", version: Optional[str] = None, 
                  enable_http2: bool = True, timeout: int = 30):
         """初始化伪装客户端
@@ -55,7 +122,9 @@ class DisguiseClient:
                 self.impersonate = random.choice(self.BROWSER_VERSIONS["chrome"])
         
         # 初始化 User-Agent 生成器
-        self.ua = UserAgent()
+        if DisguiseClient._shared_ua is None:
+            DisguiseClient._shared_ua = UserAgent()
+        self.ua = DisguiseClient._shared_ua
         
         # Cookie 存储
         self.cookies = {}
@@ -167,6 +236,11 @@ class DisguiseClient:
         delay = random.uniform(min_delay, max_delay)
         time.sleep(delay)
     
+    async def _add_random_delay_async(self, min_delay: float = 0.1, max_delay: float = 0.5):
+        """添加随机延迟(异步版本,不阻塞事件循环)"""
+        delay = random.uniform(min_delay, max_delay)
+        await asyncio.sleep(delay)
+    
     def post(self, url: str, data=None, json=None, headers: Optional[Dict[str, str]] = None,
              request_type: str = "api", add_delay: bool = False, **kwargs) -> Any:
         """发送 POST 请求
@@ -270,6 +344,85 @@ class DisguiseClient:
             logger.error(f"GET 请求失败: {url}, 错误: {e}")
             raise
     
+    async def apost(self, url: str, data=None, json=None, headers: Optional[Dict[str, str]] = None,
+                    request_type: str = "api", add_delay: bool = False, **kwargs) -> Any:
+        """发送 POST 请求 (异步版本,复用连接池中的长连接会话)
+        
+        参数同 post()
+        """
+        content_type = None
+        if json is not None:
+            content_type = "application/json;charset=UTF-8"
+        elif data is not None:
+            content_type = "application/x-www-form-urlencoded"
+        
+        disguise_headers = self.get_headers(url, request_type, content_type=content_type)
+        if headers:
+            disguise_headers.update(headers)
+        
+        if add_delay:
+            await self._add_random_delay_async()
+        
+        session = session_pool.get(self.impersonate, self.enable_http2)
+        try:
+            response = await session.post(
+                url,
+                data=data,
+                json=json,
+                headers=disguise_headers,
+                cookies=self.cookies,
+                timeout=self.timeout,
+                **kwargs
+            )
+            
+            if response.cookies:
+                self.cookies.update(response.cookies)
+            
+            return response
+        except Exception as e:
+            logger.error(f"POST 请求失败: {url}, 错误: {e}")
+            raise
+    
+    async def aget(self, url: str, headers: Optional[Dict[str, str]] = None,
+                   request_type: str = "resource", stream: bool = False,
+                   add_delay: bool = False, **kwargs) -> Any:
+        """发送 GET 请求 (异步版本,复用连接池中的长连接会话)
+        
+        参数同 get()。stream=True 时调用方需在读取完毕后 await response.aclose()
+        """
+        disguise_headers = self.get_headers(url, request_type)
+        if headers:
+            disguise_headers.update(headers)
+        
+        if add_delay:
+            await self._add_random_delay_async()
+        
+        session = session_pool.get(self.impersonate, self.enable_http2)
+        try:
+            response = await session.get(
+                url,
+                headers=disguise_headers,
+                cookies=self.cookies,
+                timeout=self.timeout,
+                stream=stream,
+                **kwargs
+            )
+            
+            if response.cookies:
+                self.cookies.update(response.cookies)
+            
+            return response
+        except Exception as e:
+            logger.error(f"GET 请求失败: {url}, 错误: {e}")
+            raise
+    
+    def fork(self) -> "DisguiseClient":
+        """创建一个同类型浏览器但指纹不同的客户端 (用于对冲请求)"""
+        versions = self.BROWSER_VERSIONS.get(self.browser, self.BROWSER_VERSIONS["chrome"])
+        others = [v for v in versions if v != self.impersonate] or versions
+        return DisguiseClient(browser=self.browser, version=random.choice(others),
+                              enable_http2=self.enable_http2, timeout=self.timeout)
+    
     def clear_cookies(self):
         """清除所有 cookies"""
         self.cookies.clear()
@@ -0,0 +1,136 @@
+"""
+文件变更监听模块
+
+Linux 上通过 inotify (ctypes 调用 libc,无额外依赖) 监听文件所在目录,
+其他平台或 inotify 不可用时退化为定时检查 mtime。
+多个 worker 进程各自监听同一文件,任一进程写入后所有进程都会立即收到通知。
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from typing import Callable, Optional
+
+from app.core.logger import logger
+
+# inotify 常量 (见 <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not hasattr(os, "uname") or os.uname().sysname != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """在后台线程中监听单个文件的变更,变更时在事件循环线程中调用回调"""
+
+    def __init__(self, path: str, callback: Callable[[], None], poll_interval: float = 1.0):
+        self.path = path
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.mode = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动监听 (需在事件循环中调用)"""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stop.clear()
+        fd = self._open_inotify()
+        if fd is not None:
+            self.mode = "inotify"
+            target = lambda: self._run_inotify(fd)
+        else:
+            self.mode = "polling"
+            target = self._run_polling
+        self._thread = threading.Thread(target=target, name=f"watch-{os.path.basename(self.path)}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止监听 (后台线程在下一次超时检查时退出,不阻塞调用方)"""
+        self._stop.set()
+        self._thread = None
+
+    def _notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self.callback)
+        except RuntimeError:
+            # 事件循环已关闭
+            self._stop.set()
+
+    def _open_inotify(self) -> Optional[int]:
+        libc = _load_libc()
+        if libc is None:
+            return None
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        # 监听所在目录: 原子写入 (临时文件 + rename) 会替换文件本身
+        directory = os.path.dirname(os.path.abspath(self.path))
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, directory.encode(), mask) < 0:
+            logger.warning(f"[监听] inotify 监听 {directory} 失败 (errno={ctypes.get_errno()}),改用轮询")
+            os.close(fd)
+            return None
+        return fd
+
+    def _run_inotify(self, fd: int):
+        name = os.path.basename(self.path).encode()
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd], [], [], self.poll_interval)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                changed = False
+                offset = 0
+                while offset + _EVENT_HEADER.size <= len(data):
+                    _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size
+                    event_name = data[offset:offset + length].rstrip(b"\0")
+                    offset += length
+                    if event_name == name:
+                        changed = True
+                if changed:
+                    self._notify()
+        finally:
+            os.close(fd)
+
+    def _run_polling(self):
+        last = self._signature()
+        while not self._stop.wait(self.poll_interval):
+            current = self._signature()
+            if current != last:
+                last = current
+                self._notify()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
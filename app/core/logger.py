@@ -1,9 +1,14 @@
+import contextvars
 import logging
 import sys
+from typing import Mapping, Optional
 import logging.handlers
 from collections import deque
 from colorama import Fore, Style, init
 
+# 当前请求的 ID (由请求追踪设置),日志行带上它以便区分并发请求
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=None)
+
 # 初始化 colorama
 # 初始化 colorama
 # init(autoreset=True)  # 移除此行以修复 Ctrl+C 无法退出的问题
@@ -12,6 +17,7 @@ from colorama import Fore, Style, init
 class ColoredFormatter(logging.Formatter):
     """
     一个带有颜色的日志格式化器，可以根据日志级别显示不同的颜色。
+    每个级别的格式化器在初始化时创建一次，格式化时直接复用。
     """
     LOG_COLORS = {
         logging.DEBUG: Style.DIM + Fore.WHITE,
@@ -21,50 +27,165 @@ class ColoredFormatter(logging.Formatter):
         logging.CRITICAL: Style.BRIGHT + Fore.RED,
     }
 
-    def format(self, record):
-        log_color = self.LOG_COLORS.get(record.levelno)
-        
+    def __init__(self):
+        super().__init__()
         # 设置基础格式
-        # [时间] | [级别] | 消息
+        # [时间] | [级别] | [请求ID] 消息
         # 使用 '{' 风格的格式化，它支持更丰富的对齐选项
-        base_format = f"{Style.DIM + Fore.CYAN}{{asctime}}{Style.RESET_ALL} | " \
-                      f"{log_color}{{levelname:^9}}{Style.RESET_ALL} | " \
-                      f"{log_color}{{message}}{Style.RESET_ALL}"
-        
-        formatter = logging.Formatter(base_format, datefmt='%Y-%m-%d %H:%M:%S', style='{')
-        
-        # 对齐处理：INFO 级别前的空格
-        if record.levelno == logging.INFO:
-            # 获取当前格式化后的消息
-            original_message = super().format(record)
-            # 为了对齐，我们可以在这里调整，但由于levelname已经左对齐，所以通常不需要额外处理
-            # 这里主要是为了演示如何处理特殊情况
-            pass
+        self._formatters = {
+            levelno: logging.Formatter(
+                f"{Style.DIM + Fore.CYAN}{{asctime}}{Style.RESET_ALL} | "
+                f"{log_color}{{levelname:^9}}{Style.RESET_ALL} | "
+                f"{log_color}{{request_tag}}{{message}}{Style.RESET_ALL}",
+                datefmt='%Y-%m-%d %H:%M:%S',
+                style='{',
+            )
+            for levelno, log_color in self.LOG_COLORS.items()
+        }
 
+    def format(self, record):
+        request_id = getattr(record, "request_id", None)
+        record.request_tag = f"[{request_id[:8]}] " if request_id else ""
+        # 非标准级别按 INFO 的颜色显示
+        formatter = self._formatters.get(record.levelno) or self._formatters[logging.INFO]
         return formatter.format(record)
 
 import asyncio
+import json
+import queue
+import re
+import threading
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class LogEntry:
+    """一条已格式化的日志
+
+    SSE 帧 (带递增的事件 ID) 在追加时编码一次,所有订阅者共享。
+    """
+
+    __slots__ = ("seq", "levelno", "text", "search", "frame")
+
+    def __init__(self, seq: int, levelno: int, text: str):
+        self.seq = seq
+        self.levelno = levelno
+        self.text = text
+        # 去掉颜色代码的小写文本,用于关键字过滤
+        self.search = _ANSI_RE.sub("", text).lower()
+        self.frame = f"id: {seq}\ndata: {json.dumps(text)}\n\n".encode("utf-8")
+
+
+class LogSubscription:
+    """一个日志查看端的订阅 (有界队列,查看端跟不上时丢弃最旧的日志)
+
+    Args:
+        min_level: 只接收不低于该级别的日志
+        keyword: 只接收包含该关键字的日志 (不区分大小写)
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int,
+                 min_level: int = logging.NOTSET, keyword: Optional[str] = None):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.min_level = min_level
+        self.keyword = keyword.lower() if keyword else None
+        # 因队列已满而丢弃的日志条数
+        self.dropped = 0
+
+    def accepts(self, entry: LogEntry) -> bool:
+        if entry.levelno < self.min_level:
+            return False
+        return self.keyword is None or self.keyword in entry.search
+
+    def put(self, entry: LogEntry):
+        """在事件循环线程中调用"""
+        if not self.accepts(entry):
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(entry)
+
 
 class LogQueue:
-    def __init__(self, maxlen=2000):
+    """最近日志的历史记录及实时订阅
+
+    append 可在任意线程调用 (通常是日志监听线程),
+    通过 call_soon_threadsafe 把日志投递到订阅者所在的事件循环。
+    每条日志有递增的序号,查看端重连时可只获取断开后的日志。
+    """
+
+    def __init__(self, maxlen=2000, subscriber_maxsize=1000):
         self._history = deque(maxlen=maxlen)
         self._subscribers = set()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.subscriber_maxsize = subscriber_maxsize
+        # 已断开的订阅者累计丢弃的日志条数
+        self._closed_dropped = 0
+
+    def append(self, text: str, levelno: int = logging.INFO):
+        with self._lock:
+            self._seq += 1
+            entry = LogEntry(self._seq, levelno, text)
+            self._history.append(entry)
+            loops = {sub.loop for sub in self._subscribers}
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop, entry)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _deliver(self, loop, entry: LogEntry):
+        for sub in list(self._subscribers):
+            if sub.loop is loop:
+                sub.put(entry)
+
+    def subscribe(self, min_level: int = logging.NOTSET, keyword: Optional[str] = None) -> LogSubscription:
+        """在事件循环中调用,返回订阅 (其 queue 接收之后的新日志)"""
+        sub = LogSubscription(asyncio.get_running_loop(), self.subscriber_maxsize, min_level, keyword)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: LogSubscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.discard(sub)
+                self._closed_dropped += sub.dropped
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
 
-    def append(self, record):
-        self._history.append(record)
-        for queue in self._subscribers:
-            # 使用 put_nowait 是因为我们不希望日志记录器阻塞
-            # 如果队列满了，它会引发异常，但这在 asyncio.Queue 中很少见
-            queue.put_nowait(record)
+    def snapshot(self, after: Optional[int] = None) -> list:
+        """历史日志的副本 (可与 append 并发调用)
 
-    def subscribe(self, queue: asyncio.Queue):
-        self._subscribers.add(queue)
+        Args:
+            after: 只返回序号大于它的日志;为 None 或大于当前序号 (服务已重启) 时返回全部
+        """
+        with self._lock:
+            entries = list(self._history)
+            seq = self._seq
+        if after is None or after > seq or not entries:
+            return entries
+        start = after + 1 - entries[0].seq
+        return entries[max(0, start):]
 
-    def unsubscribe(self, queue: asyncio.Queue):
-        self._subscribers.discard(queue)
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            "history": len(self._history),
+            "last_id": self._seq,
+            "subscribers": len(subscribers),
+            "subscriber_dropped": self._closed_dropped + sum(sub.dropped for sub in subscribers),
+        }
 
     def __iter__(self):
-        return iter(self._history)
+        return iter(self.snapshot())
 
     def __len__(self):
         return len(self._history)
@@ -74,26 +195,93 @@ log_queue = LogQueue(maxlen=2000)
 
 class QueueHandler(logging.Handler):
     """
-    一个将日志记录放入我们自定义 LogQueue 的处理器。
+    一个将日志记录放入我们自定义 LogQueue 的处理器 (在日志监听线程中执行格式化)。
     """
     def __init__(self, log_queue_instance: LogQueue):
         super().__init__()
         self.log_queue = log_queue_instance
 
     def emit(self, record):
-        self.log_queue.append(self.format(record))
+        self.log_queue.append(self.format(record), record.levelno)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """日志入口: 只把记录放入有界队列,格式化和输出由后台监听线程完成
+
+    队列已满时丢弃新记录并计数,记录日志的线程永远不会被阻塞。
+    """
+
+    # 可以原样交给监听线程、之后不会被修改的参数类型
+    _IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        """只做安全交接所需的最少工作,不在记录日志的线程中格式化
+
+        消息和参数都是不可变值时原样入队,由监听线程合并;含可变对象时
+        (调用方之后可能修改它) 先合并为字符串。异常堆栈由监听线程渲染,记录也不再复制。
+        """
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, Mapping) else args
+            if not all(isinstance(value, self._IMMUTABLE_ARGS) for value in values):
+                record.msg = record.getMessage()
+                record.args = None
+        if not isinstance(record.msg, str):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class _LogListener(logging.handlers.QueueListener):
+    """后台监听线程 (入口队列有界,停止时阻塞等待空位放入结束标记)"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class RequestIdFilter(logging.Filter):
+    """给日志记录附加当前请求的 ID
+
+    需在记录日志的线程中执行 (请求 ID 保存在 contextvar 中,监听线程中不可见)。
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
 
 from .log_translator import UvicornLogTranslator
 
+# 日志入口队列的容量 (超过时丢弃新记录)
+LOG_QUEUE_SIZE = 10000
+
+_entry_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[_LogListener] = None
+
+
 def setup_logger():
     """
     配置并获取根日志记录器。
     这个函数应该在应用程序启动时只调用一次。
+
+    根日志记录器只挂一个入队处理器,控制台输出和 Web 日志队列
+    由后台监听线程格式化和写入,记录日志的线程 (包括 to_thread 工作线程) 不会被阻塞。
     """
+    global _entry_handler, _listener
+
     # 获取根 logger
     logger = logging.getLogger()
     
     # 检查是否已经有处理器，防止重复添加
+    shutdown_logger()
     if logger.hasHandlers():
         logger.handlers.clear()
 
@@ -102,23 +290,24 @@ def setup_logger():
     # 1. 控制台处理器 (带颜色)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(ColoredFormatter())
-    
-    # 添加翻译过滤器
-    console_handler.addFilter(UvicornLogTranslator())
-    
-    logger.addHandler(console_handler)
 
     # 2. 内存队列处理器 (用于Web界面)
-    # 我们需要一个不带颜色的格式化器给Web界面
-    # web_formatter = logging.Formatter(
-    #     '{asctime} | {levelname:^9} | {message}',
-    #     datefmt='%Y-%m-%d %H:%M:%S',
-    #     style='{'
-    # )
     queue_handler = QueueHandler(log_queue)
     # 使用带颜色的格式化器，以便前端可以解析
     queue_handler.setFormatter(ColoredFormatter())
-    logger.addHandler(queue_handler)
+
+    # 3. 入队处理器: 过滤器在记录日志的线程中执行
+    # (翻译需要读取原始参数,请求 ID 保存在 contextvar 中)
+    entry_handler = BoundedQueueHandler(LOG_QUEUE_SIZE)
+    entry_handler.addFilter(UvicornLogTranslator())
+    entry_handler.addFilter(RequestIdFilter())
+    logger.addHandler(entry_handler)
+
+    _entry_handler = entry_handler
+    _listener = _LogListener(
+        entry_handler.queue, console_handler, queue_handler, respect_handler_level=True
+    )
+    _listener.start()
     
     # 禁用 uvicorn 的默认访问日志，因为我们将使用自己的格式
     # logging.getLogger("uvicorn.access").propagate = False
@@ -126,6 +315,26 @@ def setup_logger():
     # logging.getLogger("uvicorn").propagate = False
 
 
+def shutdown_logger():
+    """停止后台监听线程 (先输出完队列中剩余的日志)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def pipeline_stats() -> dict:
+    """日志管道的状态: 入口队列积压、因队列已满丢弃的记录数、各订阅者丢弃的条数"""
+    stats = log_queue.stats()
+    if _entry_handler is not None:
+        stats["queued"] = _entry_handler.queue.qsize()
+        stats["dropped"] = _entry_handler.dropped
+    else:
+        stats["queued"] = 0
+        stats["dropped"] = 0
+    return stats
+
+
 # 在模块加载时就获取一个 logger 实例，以便其他模块可以直接导入使用
 # setup_logger() 将在 main.py 中被显式调用
 logger = logging.getLogger("XFAPI")
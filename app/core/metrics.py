@@ -0,0 +1,354 @@
+"""
+运行指标模块 (Prometheus 文本格式)
+
+每个 worker 进程在内存中累计计数器、仪表和直方图,并定期把快照原子写入
+data/metrics/<pid>.json;/metrics 读取所有进程的快照汇总输出,
+因此在 gunicorn -w N / uvicorn --workers N 下结果覆盖全部 worker。
+
+- 计数器、直方图: 所有进程相加;已退出进程的快照合并进 archive.json 后删除,
+  worker 重启不会使计数器回退
+- 仪表 (如进行中的请求数): 只统计仍在运行的进程
+"""
+
+import asyncio
+import glob
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import config
+from app.core.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台不做跨进程互斥
+    fcntl = None
+
+LabelValues = Tuple[str, ...]
+
+# 耗时直方图的默认分桶(秒)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[LabelValues, object] = {}
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def snapshot(self) -> list:
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """直方图: 每组标签保存 [各分桶计数..., 总和, 总数] (分桶计数不累加,输出时再累加)"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self.values.get(key)
+        if data is None:
+            data = [0] * (len(self.buckets) + 2)
+            self.values[key] = data
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[i] += 1
+                break
+        data[-2] += value
+        data[-1] += 1
+
+
+def _merge(target: Dict[str, dict], name: str, kind: str, samples: list):
+    merged = target.setdefault(name, {"type": kind, "samples": {}})["samples"]
+    for labels, value in samples:
+        key = tuple(labels)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            if len(current) == len(value):
+                merged[key] = [a + b for a, b in zip(current, value)]
+        else:
+            merged[key] = current + value
+
+
+class MetricsRegistry:
+    """进程内指标注册表 + 基于文件的多进程汇总"""
+
+    DIR = "data/metrics"
+    ARCHIVE_FILE = "archive.json"
+    LOCK_FILE = ".lock"
+    # 快照写入间隔(秒)
+    FLUSH_INTERVAL = 5.0
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    # ---- 多进程快照 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.DIR, name)
+
+    def _snapshot(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "updated": time.time(),
+            "metrics": {
+                metric.name: {"type": metric.type, "samples": metric.snapshot()}
+                for metric in self._metrics.values()
+            },
+        }
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self):
+        """把本进程的指标快照写入文件"""
+        os.makedirs(self.DIR, exist_ok=True)
+        self._write_json(self._path(f"{os.getpid()}.json"), self._snapshot())
+
+    def _archive_dead(self, include_self: bool = False):
+        """把已退出进程的计数器和直方图合并进归档文件 (需持有锁)"""
+        stale = []
+        for path in glob.glob(self._path("[0-9]*.json")):
+            try:
+                pid = int(os.path.basename(path).split(".")[0])
+            except ValueError:
+                continue
+            if (pid == os.getpid() and include_self) or (pid != os.getpid() and not _pid_alive(pid)):
+                stale.append(path)
+        if not stale:
+            return
+
+        merged: Dict[str, dict] = {}
+        archive = self._read_json(self._path(self.ARCHIVE_FILE)) or {"metrics": {}}
+        for data in [archive] + [self._read_json(path) or {"metrics": {}} for path in stale]:
+            for name, metric in data["metrics"].items():
+                if metric["type"] != "gauge":
+                    _merge(merged, name, metric["type"], metric["samples"])
+        self._write_json(self._path(self.ARCHIVE_FILE), {"metrics": {
+            name: {"type": metric["type"], "samples": [[list(k), v] for k, v in metric["samples"].items()]}
+            for name, metric in merged.items()
+        }})
+        for path in stale:
+            os.remove(path)
+
+    def _locked(self, func, *args):
+        os.makedirs(self.DIR, exist_ok=True)
+        with open(self._path(self.LOCK_FILE), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            return func(*args)
+
+    def start(self):
+        """启动定期写入快照 (应用启动时在每个 worker 中调用)
+
+        同一 PID 的旧快照 (如容器重启后 PID 被复用) 先归档,避免被覆盖丢失。
+        """
+        try:
+            self._locked(self._archive_dead, True)
+        except OSError as e:
+            logger.warning(f"[指标] 归档旧指标快照失败: {e}")
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+            except OSError as e:
+                logger.warning(f"[指标] 写入指标快照失败: {e}")
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning(f"[指标] 写入指标快照失败: {e}")
+
+    # ---- 汇总输出 ----
+
+    def collect(self) -> Dict[str, dict]:
+        """汇总所有进程的指标 (会读写文件,应在线程中调用)"""
+        own = self._snapshot()
+        self._locked(self._archive_dead)
+        os.makedirs(self.DIR, exist_ok=True)
+        self._write_json(self._path(f"{os.getpid()}.json"), own)
+
+        merged: Dict[str, dict] = {}
+        sources = [self._read_json(self._path(self.ARCHIVE_FILE))]
+        sources += [
+            own if path == self._path(f"{os.getpid()}.json") else self._read_json(path)
+            for path in glob.glob(self._path("[0-9]*.json"))
+        ]
+        for data in sources:
+            if not data:
+                continue
+            for name, metric in data["metrics"].items():
+                if name in self._metrics:
+                    _merge(merged, name, metric["type"], metric["samples"])
+        return merged
+
+    def render(self) -> str:
+        """以 Prometheus 文本格式输出所有进程汇总后的指标"""
+        merged = self.collect()
+        lines: List[str] = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            samples = merged.get(name, {}).get("samples", {})
+            for key in sorted(samples):
+                value = samples[key]
+                pairs = [f'{label}="{_escape(v)}"' for label, v in zip(metric.labelnames, key)]
+                if isinstance(metric, Histogram):
+                    if len(value) != len(metric.buckets) + 2:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, value):
+                        cumulative += count
+                        labels = ",".join(pairs + [f'le="{_format_value(bound)}"'])
+                        lines.append(f"{name}_bucket{{{labels}}} {_format_value(cumulative)}")
+                    labels = "{" + ",".join(pairs) + "}" if pairs else ""
+                    lines.append(f"{name}_sum{labels} {_format_value(value[-2])}")
+                    lines.append(f"{name}_count{labels} {_format_value(value[-1])}")
+                else:
+                    labels = "{" + ",".join(pairs) + "}" if pairs else ""
+                    lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# ---- 指标定义 ----
+
+SIGN_SECONDS = metrics.histogram(
+    "xfapi_sign_seconds", "签名阶段耗时 (含签名缓存命中)", ("voice", "format"))
+DOWNLOAD_TTFB_SECONDS = metrics.histogram(
+    "xfapi_download_ttfb_seconds", "音频下载收到响应头的耗时", ("voice", "format"))
+SYNTH_TOTAL_SECONDS = metrics.histogram(
+    "xfapi_synth_total_seconds", "未命中缓存时从收到请求到上游音频流就绪的总耗时", ("voice", "format"))
+CACHE_HITS = metrics.counter(
+    "xfapi_cache_hits_total", "缓存命中次数 (tier=memory/disk)", ("voice", "format", "tier"))
+CACHE_MISSES = metrics.counter(
+    "xfapi_cache_misses_total", "缓存未命中次数", ("voice", "format"))
+UPSTREAM_ATTEMPTS = metrics.counter(
+    "xfapi_upstream_attempts_total", "上游请求尝试次数 (attempt 为第几次尝试,大于 1 即重试)", ("stage", "attempt"))
+UPSTREAM_ERRORS = metrics.counter(
+    "xfapi_upstream_errors_total", "上游请求失败次数 (按错误类型)", ("stage", "type"))
+HTTP_REQUESTS = metrics.counter(
+    "xfapi_http_requests_total", "HTTP 请求数", ("method", "route", "status"))
+HTTP_SECONDS = metrics.histogram(
+    "xfapi_http_request_seconds", "HTTP 请求处理耗时 (含响应体发送)", ("route",))
+HTTP_INFLIGHT = metrics.gauge(
+    "xfapi_http_inflight_requests", "进行中的 HTTP 请求数")
+TTS_INFLIGHT = metrics.gauge(
+    "xfapi_tts_inflight_responses", "正在发送的音频响应数", ("voice", "format"))
+TTS_BYTES = metrics.counter(
+    "xfapi_tts_bytes_served_total", "已发送的音频字节数", ("voice", "format"))
+
+
+def voice_label(voice: str) -> str:
+    """发音人标签: 解析为上游代码,不在发音人列表中的值统一记为 other,避免客户端传入的任意字符串扩大标签基数"""
+    if not voice:
+        return ""
+    code = config.resolve_voice(voice)
+    return code if code in config.speaker_index.codes else "other"
+
+
+# format 标签允许的取值,其余音频类型统一记为 other
+AUDIO_FORMATS = frozenset({"mp3", "mpeg", "wav", "pcm", "ogg", "opus", "aac", "flac", "m4a", "amr", "speex"})
+
+
+def audio_format(audio_type: str) -> str:
+    """音频类型的简写标签 (audio/mp3 -> mp3),未知类型记为 other,避免客户端传入的值扩大标签基数"""
+    if not audio_type:
+        return ""
+    name = audio_type.rsplit("/", 1)[-1].lower()
+    return name if name in AUDIO_FORMATS else "other"
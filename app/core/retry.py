@@ -0,0 +1,184 @@
+"""
+异步重试模块
+
+提供基于 asyncio 的重试与退避功能,包括:
+- 全抖动 (full jitter) 指数退避
+- 单次尝试超时与整体截止时间
+- 重试预算 (重试次数不超过流量的一定比例)
+- 可重试错误分类
+"""
+
+import asyncio
+import random
+import time
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Optional, TypeVar
+from curl_cffi.requests.exceptions import HTTPError, RequestException
+from app.core.logger import logger
+from app.core.metrics import UPSTREAM_ATTEMPTS, UPSTREAM_ERRORS
+from app.core.tracing import span
+
+T = TypeVar("T")
+
+
+class UpstreamResponseError(Exception):
+    """上游返回了无法解析的响应 (格式错误、缺少字段等),通常是暂时性问题"""
+
+
+class RetryBudgetExhausted(Exception):
+    """重试预算耗尽,放弃重试以免放大上游故障"""
+
+
+class RetryPolicy:
+    """重试策略"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 8.0,
+                 attempt_timeout: Optional[float] = None, deadline: Optional[float] = None):
+        """
+        Args:
+            max_attempts: 最大尝试次数 (包含首次)
+            base_delay: 退避基准时间(秒)
+            max_delay: 单次退避上限(秒)
+            attempt_timeout: 单次尝试超时(秒),None 表示不限制
+            deadline: 整体截止时间(秒),None 表示不限制
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """计算第 attempt 次失败后的退避时间 (全抖动: [0, min(上限, 基准*2^n)] 均匀分布)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RetryBudget:
+    """重试预算 (令牌桶)
+
+    每次首次请求存入 ratio 个令牌,每次重试消耗 1 个令牌,
+    使重试量长期不超过请求量的 ratio 倍。min_tokens 保证低流量时仍可重试。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self._tokens = min_tokens
+
+    def deposit(self):
+        """记录一次首次请求"""
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """尝试为一次重试支付令牌,预算不足时返回 False"""
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断错误是否值得重试
+
+    - 超时、连接错误、上游响应格式错误: 可重试
+    - HTTP 429 与 5xx: 可重试
+    - 其他 HTTP 4xx: 请求本身有问题,不重试
+    """
+    if isinstance(exc, (asyncio.TimeoutError, UpstreamResponseError, ConnectionError)):
+        return True
+    if isinstance(exc, HTTPError):
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+        if status is None:
+            return True
+        return status == 429 or status >= 500
+    if isinstance(exc, RequestException):
+        return True
+    # 解密失败、JSON 解析失败等,通常是上游偶发返回异常内容
+    if isinstance(exc, (ValueError, KeyError)):
+        return True
+    return False
+
+
+def classify_error(exc: BaseException) -> str:
+    """错误类型标签 (用于指标): timeout / http_429 / http_4xx / http_5xx / connection / invalid_response / 异常类名"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, HTTPError):
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+        if status is None:
+            return "http"
+        if status == 429:
+            return "http_429"
+        return "http_5xx" if status >= 500 else "http_4xx"
+    if isinstance(exc, (ConnectionError, RequestException)):
+        return "connection"
+    if isinstance(exc, (UpstreamResponseError, ValueError, KeyError)):
+        return "invalid_response"
+    return type(exc).__name__
+
+
+async def retry_call(func: Callable[[int], Awaitable[T]], policy: RetryPolicy,
+                     budget: Optional[RetryBudget] = None, label: str = "请求", stage: Optional[str] = None) -> T:
+    """按策略异步重试调用
+
+    Args:
+        func: 被调用的协程函数,参数为当前尝试序号(从0开始)
+        policy: 重试策略
+        budget: 重试预算,None 表示不限制
+        label: 日志中使用的名称
+        stage: 指标和追踪中的阶段标签,None 表示不记录指标,也不记录每次尝试的 span
+
+    Returns:
+        func 的返回值
+    """
+    start = time.monotonic()
+    if budget is not None:
+        budget.deposit()
+
+    attempt = 0
+    while True:
+        timeout = policy.attempt_timeout
+        if policy.deadline is not None:
+            remaining = policy.deadline - (time.monotonic() - start)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        if stage is not None:
+            UPSTREAM_ATTEMPTS.inc(stage=stage, attempt=attempt + 1)
+        try:
+            with span(f"{stage}.attempt", attempt=attempt + 1) if stage is not None else nullcontext():
+                if timeout is None:
+                    return await func(attempt)
+                return await asyncio.wait_for(func(attempt), timeout=max(timeout, 0.001))
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = asyncio.TimeoutError(f"第 {attempt + 1} 次尝试超时 ({timeout:.1f}s)")
+            if stage is not None:
+                UPSTREAM_ERRORS.inc(stage=stage, type=classify_error(e))
+
+            logger.warning(f"{label}尝试 {attempt + 1}/{policy.max_attempts} 次失败: {e}")
+
+            if not is_retryable(e):
+                logger.error(f"{label}遇到不可重试的错误,放弃重试。")
+                raise e
+            if attempt + 1 >= policy.max_attempts:
+                logger.error(f"{label}在多次重试后失败。")
+                raise e
+
+            sleep_time = policy.backoff(attempt)
+            if policy.deadline is not None:
+                remaining = policy.deadline - (time.monotonic() - start)
+                if remaining <= sleep_time:
+                    logger.error(f"{label}已超过整体截止时间 {policy.deadline:.0f}s,放弃重试。")
+                    raise e
+            if budget is not None and not budget.withdraw():
+                logger.error(f"{label}重试预算已耗尽,放弃重试。")
+                raise RetryBudgetExhausted(str(e)) from e
+
+            logger.info(f"{label}将在 {sleep_time:.2f} 秒后重试...")
+            await asyncio.sleep(sleep_time)
+            attempt += 1
@@ -0,0 +1,112 @@
+"""
+发音人索引模块
+
+在加载/重载配置时把发音人列表编译为查找表 (按 name、param、code),
+@style 发音人的风格值在编译时解析完成,请求路径上只做字典查找。
+"""
+
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.logger import logger
+
+try:
+    import brotli
+except ImportError:  # 可选依赖,未安装时只提供 gzip
+    brotli = None
+
+
+def _resolve_code(speaker: Dict[str, Any]) -> Optional[str]:
+    """发音人对应的上游代码: 普通发音人为 param,@style 发音人为 extendUI 中的风格值"""
+    param = speaker.get("param")
+    if param != '@style':
+        return param
+    try:
+        extend_ui = speaker.get("extendUI") or "[]"
+        if isinstance(extend_ui, str):
+            extend_ui = json.loads(extend_ui)
+        if isinstance(extend_ui, list):
+            style_item = next((item for item in extend_ui if isinstance(item, dict) and item.get("code") == "style"), None)
+            if style_item and style_item.get("value"):
+                return style_item["value"]
+    except Exception as e:
+        logger.error(f"解析发音人 {speaker.get('name')} 的 extendUI 时出错: {e}")
+    # 回退到 param (即 @style，很可能会失败，但总比在这里崩溃要好)
+    return param
+
+
+class SpeakerIndex:
+    """只读的发音人查找表,重载配置时整体替换"""
+
+    # 每个版本缓存的序列化结果 (字段/筛选组合) 数量上限
+    MAX_ENCODED_VARIANTS = 64
+
+    def __init__(self, speakers: List[Dict[str, Any]]):
+        self.speakers = speakers
+        self._encoded: Dict[tuple, Dict[str, Any]] = {}
+        self.by_name: Dict[str, str] = {}
+        self.by_param: Dict[str, str] = {}
+        self.by_code: Dict[str, str] = {}
+        # 全部上游代码 (用于判断请求中的发音人是否已知)
+        self.codes = set()
+        for speaker in speakers:
+            code = _resolve_code(speaker)
+            if code is None:
+                continue
+            code = str(code)
+            self.codes.add(code)
+            # 同名时保留先出现的发音人,与原先按顺序查找的行为一致
+            name = speaker.get("name")
+            if name is not None:
+                self.by_name.setdefault(str(name), code)
+            param = speaker.get("param")
+            if param is not None and param != '@style':
+                self.by_param.setdefault(str(param), code)
+            short_code = speaker.get("code")
+            if short_code is not None:
+                self.by_code.setdefault(str(short_code), code)
+
+    def resolve(self, voice: str) -> str:
+        """将发音人名称、param 或 code 解析为上游使用的代码,未找到时原样返回"""
+        return self.by_name.get(voice) or self.by_param.get(voice) or self.by_code.get(voice) or voice
+
+    def encoded(self, fields: Optional[Tuple[str, ...]] = None,
+                filters: Tuple[Tuple[str, str], ...] = ()) -> Dict[str, Any]:
+        """序列化后的发音人列表 (按字段投影和筛选),每种组合只序列化、压缩一次
+
+        Args:
+            fields: 只保留的字段,None 表示全部字段
+            filters: (字段, 值) 筛选条件,值按字符串忽略大小写比较
+
+        Returns:
+            {"etag": 内容哈希, "identity": JSON, "gzip": ..., "br": ... (安装了 brotli 时)}
+        """
+        key = (fields, filters)
+        variant = self._encoded.get(key)
+        if variant is not None:
+            return variant
+
+        items = [
+            speaker for speaker in self.speakers
+            if all(str(speaker.get(name)).lower() == value.lower() for name, value in filters)
+        ]
+        if fields:
+            items = [{name: speaker[name] for name in fields if name in speaker} for speaker in items]
+        body = json.dumps(items, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        variant = {
+            "etag": hashlib.sha1(body).hexdigest(),
+            "identity": body,
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            variant["br"] = brotli.compress(body)
+
+        if len(self._encoded) >= self.MAX_ENCODED_VARIANTS:
+            self._encoded.clear()
+        self._encoded[key] = variant
+        return variant
+
+    def __len__(self) -> int:
+        return len(self.speakers)
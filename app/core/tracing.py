@@ -0,0 +1,380 @@
+"""
+请求追踪模块
+
+LoggingMiddleware 为每个请求开启一条追踪 (请求 ID 取自 X-Request-ID 请求头或随机生成),
+通过 contextvars 在 API、缓存、签名、下载各层记录嵌套的 span (耗时、属性、重试事件),
+同一请求的日志行也带上请求 ID。
+
+请求结束后按采样规则决定是否保留整条追踪: 按 trace_sample_ratio 采样,
+出错或耗时超过 trace_slow_ms 的请求总是保留。保留的 span 由后台线程导出到
+data/traces/ 下按大小轮转的 JSONL 文件,设置了 trace_otlp_endpoint 时同时以
+OTLP/HTTP JSON 格式发送到收集器。
+"""
+
+import contextvars
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from app.core.config import config
+from app.core.logger import logger, request_id_var
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """一次请求的追踪,收集其中已结束的 span"""
+
+    def __init__(self, request_id: str):
+        self.trace_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.spans: List["Span"] = []
+        # None: 请求尚未结束;True/False: 是否保留
+        self.kept: Optional[bool] = None
+
+    def _decide(self, root: "Span") -> bool:
+        settings = config.get_settings()
+        if root.status == "error":
+            return True
+        slow_ms = float(settings.get("trace_slow_ms", 3000))
+        if slow_ms > 0 and root.duration_ms >= slow_ms:
+            return True
+        return random.random() < float(settings.get("trace_sample_ratio", 1.0))
+
+    def on_span_end(self, span: "Span"):
+        if self.kept is None:
+            self.spans.append(span)
+            if span.parent_id is None:
+                self.kept = self._decide(span)
+                if self.kept:
+                    exporter.export(self.spans)
+                self.spans = []
+        elif self.kept:
+            # 请求结束后才完成的 span (如后台继续的下载) 单独导出
+            exporter.export([span])
+
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.events: List[dict] = []
+        self.start = time.time()
+        self._start_monotonic = time.monotonic()
+        self.duration_ms = 0.0
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({"name": name, "time": time.time(), "attributes": attributes})
+
+    def fail(self, error: BaseException):
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        self.duration_ms = (time.monotonic() - self._start_monotonic) * 1000
+        self.trace.on_span_end(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace.trace_id,
+            "request_id": self.trace.request_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 2),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+            "events": self.events,
+            "pid": os.getpid(),
+        }
+
+
+def _enabled() -> bool:
+    return bool(config.get_settings().get("trace_enabled", True))
+
+
+@contextmanager
+def start_trace(name: str, request_id: Optional[str] = None, **attributes):
+    """开启一条追踪并进入根 span;未启用追踪时只设置请求 ID"""
+    request_id = request_id or uuid.uuid4().hex[:16]
+    id_token = request_id_var.set(request_id)
+    if not _enabled():
+        try:
+            yield None
+        finally:
+            request_id_var.reset(id_token)
+        return
+    root = Span(Trace(request_id), name, None, attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        request_id_var.reset(id_token)
+        root.finish()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """在当前追踪中记录一个子 span;不在追踪中 (如后台预热、任务队列) 时不记录"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """给当前 span 添加属性"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def add_event(name: str, **attributes):
+    """给当前 span 添加事件 (如对冲请求)"""
+    current = _current_span.get()
+    if current is not None:
+        current.add_event(name, **attributes)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def to_otlp(records: List[dict]) -> dict:
+    """把 span 记录转换为 OTLP/HTTP JSON 请求体"""
+    spans = []
+    for r in records:
+        start_ns = int(r["start"] * 1e9)
+        item = {
+            "traceId": r["trace_id"],
+            "spanId": r["span_id"],
+            "name": r["name"],
+            "kind": 2 if r["parent_id"] is None else 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(r["duration_ms"] * 1e6)),
+            "attributes": _otlp_attributes(dict(r["attributes"], request_id=r["request_id"])),
+            "events": [
+                {"name": e["name"], "timeUnixNano": str(int(e["time"] * 1e9)), "attributes": _otlp_attributes(e["attributes"])}
+                for e in r["events"]
+            ],
+            "status": {"code": 2, "message": r["error"]} if r["status"] == "error" else {"code": 1},
+        }
+        if r["parent_id"]:
+            item["parentSpanId"] = r["parent_id"]
+        spans.append(item)
+    return {"resourceSpans": [{
+        "resource": {"attributes": _otlp_attributes({"service.name": "xfapi", "process.pid": os.getpid()})},
+        "scopeSpans": [{"scope": {"name": "xfapi"}, "spans": spans}],
+    }]}
+
+
+class TraceExporter:
+    """后台线程批量导出 span,请求路径上只做入队"""
+
+    DIR = "data/traces"
+    # 队列上限,导出跟不上时丢弃新的 span 而不是占用更多内存
+    MAX_QUEUE = 10000
+    BATCH_SIZE = 512
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self):
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(self.MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self._last_otlp_error = 0.0
+
+    def export(self, spans: List[Span]):
+        self._ensure_thread()
+        for item in spans:
+            try:
+                self._queue.put_nowait(item.to_dict())
+            except queue.Full:
+                self.dropped += 1
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+
+    @property
+    def path(self) -> str:
+        # 每个 worker 进程写自己的文件,避免多进程同时轮转同一文件
+        return os.path.join(self.DIR, f"traces-{os.getpid()}.jsonl")
+
+    def _run(self):
+        while True:
+            batch = []
+            stop = False
+            deadline = time.monotonic() + self.FLUSH_INTERVAL
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[dict]):
+        settings = config.get_settings()
+        try:
+            self._write_file(batch, int(settings.get("trace_file_max_bytes", 10 * 1024 * 1024)),
+                             int(settings.get("trace_file_backups", 3)))
+        except OSError as e:
+            logger.warning(f"[追踪] 写入追踪文件失败: {e}")
+        endpoint = settings.get("trace_otlp_endpoint")
+        if endpoint:
+            self._post_otlp(endpoint, batch)
+        self.exported += len(batch)
+
+    def _write_file(self, batch: List[dict], max_bytes: int, backups: int):
+        os.makedirs(self.DIR, exist_ok=True)
+        path = self.path
+        if max_bytes > 0 and os.path.exists(path) and os.path.getsize(path) >= max_bytes:
+            for i in range(backups - 1, 0, -1):
+                if os.path.exists(f"{path}.{i}"):
+                    os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+            if backups > 0:
+                os.replace(path, f"{path}.1")
+            else:
+                os.remove(path)
+        with open(path, "a", encoding="utf-8") as f:
+            for item in batch:
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+
+    def _post_otlp(self, endpoint: str, batch: List[dict]):
+        body = json.dumps(to_otlp(batch), default=str).encode("utf-8")
+        request = urllib.request.Request(endpoint, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as resp:
+                resp.read()
+        except Exception as e:
+            # 收集器不可用时每分钟最多提示一次
+            now = time.monotonic()
+            if now - self._last_otlp_error > 60:
+                self._last_otlp_error = now
+                logger.warning(f"[追踪] 发送到 {endpoint} 失败: {e}")
+
+    def close(self, timeout: float = 2.0):
+        """导出队列中剩余的 span 后停止后台线程"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"exported": self.exported, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+exporter = TraceExporter()
+
+
+def query_traces(min_duration_ms: float = 0, name: Optional[str] = None, request_id: Optional[str] = None,
+                 status: Optional[str] = None, limit: int = 20) -> List[dict]:
+    """从导出的 JSONL 文件中查询追踪 (会读取文件,应在线程中调用)
+
+    Args:
+        min_duration_ms: 请求 (根 span) 的最短耗时
+        name: 根 span 名称包含的文本,如 "/api/tts"
+        request_id: 只返回该请求 ID 的追踪
+        status: ok / error
+        limit: 最多返回的条数
+
+    Returns:
+        按耗时从高到低排列的追踪,每条包含根 span 和按开始时间排序的全部 span
+    """
+    spans_by_trace: Dict[str, List[dict]] = {}
+    pattern = os.path.join(TraceExporter.DIR, "traces-*.jsonl*")
+    for path in glob.glob(pattern):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if request_id and record.get("request_id") != request_id:
+                        continue
+                    spans_by_trace.setdefault(record["trace_id"], []).append(record)
+        except OSError:
+            continue
+
+    traces = []
+    for trace_id, records in spans_by_trace.items():
+        root = next((r for r in records if r["parent_id"] is None), None)
+        if root is None or root["duration_ms"] < min_duration_ms:
+            continue
+        if name and name not in root["name"]:
+            continue
+        if status and root["status"] != status:
+            continue
+        records.sort(key=lambda r: r["start"])
+        traces.append({
+            "trace_id": trace_id,
+            "request_id": root["request_id"],
+            "name": root["name"],
+            "start": root["start"],
+            "duration_ms": root["duration_ms"],
+            "status": root["status"],
+            "spans": records,
+        })
+    traces.sort(key=lambda t: t["duration_ms"], reverse=True)
+    return traces[:limit]
@@ -0,0 +1,136 @@
+import asyncio
+import io
+import zipfile
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core.config import config
+from app.core.logger import logger
+from app.services.xf_service import xf_service
+
+
+class BatchItem:
+    """批量合成中的一条 (参数已解析为上游使用的发音人代码和默认值)"""
+
+    def __init__(self, index: int, text: str, voice_code: str, speed: int, volume: int,
+                 audio_type: str, item_id: Optional[str] = None):
+        self.index = index
+        self.text = text
+        self.voice_code = voice_code
+        self.speed = speed
+        self.volume = volume
+        self.audio_type = audio_type
+        self.item_id = item_id
+
+    @property
+    def cache_key(self) -> str:
+        return xf_service._get_cache_key(self.text, self.voice_code, self.speed, self.volume, 50, self.audio_type)
+
+
+class BatchResult:
+    def __init__(self, items: List[BatchItem], cache_key: Optional[str] = None, error: Optional[str] = None):
+        self.items = items
+        self.cache_key = cache_key
+        self.error = error
+
+
+async def run_batch(items: List[BatchItem], concurrency: Optional[int] = None) -> AsyncIterator[BatchResult]:
+    """并发合成一批文本,按完成顺序逐个产出结果
+
+    相同参数的条目只合成一次,其结果对应所有重复条目。
+
+    Args:
+        items: 待合成条目
+        concurrency: 并发上限,不超过设置中的 batch_concurrency
+    """
+    limit = int(config.get_settings().get("batch_concurrency", 4))
+    if concurrency:
+        limit = min(limit, concurrency)
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    # 按缓存键去重
+    groups: Dict[str, List[BatchItem]] = {}
+    for item in items:
+        groups.setdefault(item.cache_key, []).append(item)
+    if len(groups) < len(items):
+        logger.info(f"[批量] 共 {len(items)} 条, 去重后 {len(groups)} 条")
+
+    async def synth(group: List[BatchItem]) -> BatchResult:
+        first = group[0]
+        async with semaphore:
+            try:
+                cache_key = await xf_service.ensure_cached(
+                    first.text, first.voice_code, first.speed, first.volume, audio_type=first.audio_type
+                )
+                return BatchResult(group, cache_key=cache_key)
+            except Exception as e:
+                logger.error(f"[批量] 第 {first.index} 条合成失败: {e}")
+                return BatchResult(group, error=str(e))
+
+    tasks = [asyncio.create_task(synth(group)) for group in groups.values()]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # 客户端断开时取消剩余条目
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class _ZipStream(io.RawIOBase):
+    """只写的内存缓冲,供 zipfile 以流式方式写入 (不支持 seek)"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        return len(data)
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _entry_name(item: BatchItem, used: set) -> str:
+    """ZIP 中的文件名: 优先使用条目 id,否则使用序号
+
+    清理字符后重名 (包括与 errors.txt 重名) 时追加 -2、-3 等后缀,名称记入 used。
+    """
+    ext = item.cache_key.rsplit(".", 1)[-1]
+    name = item.item_id or f"{item.index:05d}"
+    name = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
+    entry = f"{name}.{ext}"
+    suffix = 1
+    while entry in used:
+        suffix += 1
+        entry = f"{name}-{suffix}.{ext}"
+    used.add(entry)
+    return entry
+
+
+async def zip_stream(results: AsyncIterator[BatchResult]) -> AsyncIterator[bytes]:
+    """把批量结果以 ZIP 格式流式输出,失败的条目记录在 errors.txt 中"""
+    stream = _ZipStream()
+    errors = []
+    used = {"errors.txt"}
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        async for result in results:
+            if result.error is not None:
+                errors.extend(f"{item.index}\t{item.item_id or ''}\t{result.error}" for item in result.items)
+                continue
+            path = xf_service.get_cached_path(result.cache_key)
+            if path is None:
+                errors.extend(f"{item.index}\t{item.item_id or ''}\tcache evicted" for item in result.items)
+                continue
+            data = await asyncio.to_thread(xf_service._read_file, path)
+            for item in result.items:
+                zf.writestr(_entry_name(item, used), data)
+                yield stream.take()
+        if errors:
+            zf.writestr("errors.txt", "\n".join(errors) + "\n")
+    yield stream.take()
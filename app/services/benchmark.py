@@ -0,0 +1,297 @@
+"""
+压测 /api/tts
+
+按设定的并发数、缓存命中比例和长短文本比例请求运行中的服务,
+统计吞吐量、响应耗时与首字节耗时 (TTFB) 的 p50/p95/p99。
+配合上游模拟服务 (app.services.upstream_simulator) 使用,不访问真实上游:
+
+    python -m app.services.benchmark --url http://127.0.0.1:8501 --concurrency 1,8,32 --requests 200
+    python -m app.services.benchmark --hit-ratio 0.8 --long-ratio 0.1 --simulator http://127.0.0.1:9100 --output bench.json
+    python -m app.services.benchmark --baseline bench.json --max-regression 0.2
+
+指定 --baseline 时与之前保存的结果比较,p95 耗时或吞吐量退化超过阈值时以退出码 1 结束。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from curl_cffi.requests import AsyncSession
+
+SHORT_TEMPLATE = "第{index}号测试语句，编号{tag}，欢迎使用语音合成服务。"
+LONG_SENTENCE = "这是一段用于压力测试的长文本，服务会把它拆分成多个片段并发合成后按顺序拼接。"
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _summary(values: List[float]) -> dict:
+    """毫秒为单位的分位数"""
+    return {
+        name: round(value * 1000, 1) if value is not None else None
+        for name, value in (("p50", _percentile(values, 0.5)), ("p95", _percentile(values, 0.95)),
+                            ("p99", _percentile(values, 0.99)))
+    }
+
+
+class Workload:
+    """生成压测请求的文本
+
+    命中请求从预热过的文本池中选取,未命中请求每次生成新文本 (带本次运行的随机标记)。
+    """
+
+    def __init__(self, hit_ratio: float, long_ratio: float, long_chars: int, pool_size: int, seed: Optional[int] = None):
+        self.hit_ratio = hit_ratio
+        self.long_ratio = long_ratio
+        self.long_chars = long_chars
+        self.rng = random.Random(seed)
+        self.tag = uuid.uuid4().hex[:8]
+        self.counter = 0
+        self.pool = [self._new_text() for _ in range(pool_size)] if hit_ratio > 0 else []
+
+    def _new_text(self):
+        self.counter += 1
+        is_long = self.rng.random() < self.long_ratio
+        text = SHORT_TEMPLATE.format(index=self.counter, tag=self.tag)
+        if is_long:
+            while len(text) < self.long_chars:
+                text += LONG_SENTENCE
+        return text, "long" if is_long else "short"
+
+    def next(self):
+        """返回 (文本, 长短, 是否预期命中)"""
+        if self.pool and self.rng.random() < self.hit_ratio:
+            text, length = self.rng.choice(self.pool)
+            return text, length, True
+        text, length = self._new_text()
+        return text, length, False
+
+
+class Benchmark:
+    def __init__(self, url: str, key: Optional[str] = None, voice: Optional[str] = None,
+                 audio_type: str = "audio/mp3", timeout: float = 300):
+        self.endpoint = url.rstrip("/") + "/api/tts"
+        self.params = {"audio_type": audio_type}
+        if key:
+            self.params["key"] = key
+        if voice:
+            self.params["voice"] = voice
+        self.timeout = timeout
+
+    async def request(self, session: AsyncSession, text: str) -> dict:
+        """发起一次请求,返回状态码、首字节耗时、总耗时、字节数和是否命中缓存"""
+        result = {"status": 0, "ttfb": None, "total": None, "bytes": 0, "hit": False, "error": None}
+        start = time.perf_counter()
+        resp = None
+        try:
+            resp = await session.get(self.endpoint, params=dict(self.params, text=text), stream=True, timeout=self.timeout)
+            result["status"] = resp.status_code
+            # 整段命中缓存的响应带 ETag,边下载边返回和长文本分段合成的响应没有
+            result["hit"] = "etag" in {k.lower() for k in resp.headers.keys()}
+            async for chunk in resp.aiter_content():
+                if result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - start
+                result["bytes"] += len(chunk)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            if resp is not None:
+                await resp.aclose()
+        result["total"] = time.perf_counter() - start
+        return result
+
+    async def warm(self, workload: Workload, concurrency: int):
+        """预先请求文本池,使之后的命中请求确实命中缓存"""
+        semaphore = asyncio.Semaphore(concurrency)
+        async with AsyncSession() as session:
+            async def one(text):
+                async with semaphore:
+                    return await self.request(session, text)
+            results = await asyncio.gather(*(one(text) for text, _ in workload.pool))
+        return sum(1 for r in results if r["status"] != 200 or r["error"])
+
+    async def run(self, workload: Workload, concurrency: int, requests: int) -> dict:
+        """以固定并发发起 requests 个请求,返回统计结果"""
+        jobs = [workload.next() for _ in range(requests)]
+        records = []
+        it = iter(jobs)
+
+        async def worker(session):
+            for text, length, expect_hit in it:
+                result = await self.request(session, text)
+                result["kind"] = f"{'hit' if expect_hit else 'miss'}/{length}"
+                records.append(result)
+
+        start = time.perf_counter()
+        async with AsyncSession(max_clients=concurrency) as session:
+            await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return summarize(records, elapsed, concurrency)
+
+
+def summarize(records: List[dict], elapsed: float, concurrency: int) -> dict:
+    ok = []
+    errors: Dict[str, int] = {}
+    for r in records:
+        if r["status"] == 200 and not r["error"]:
+            ok.append(r)
+        else:
+            reason = r["error"] or f"HTTP {r['status']}"
+            errors[reason] = errors.get(reason, 0) + 1
+    kinds = {}
+    for kind in sorted({r["kind"] for r in ok}):
+        group = [r for r in ok if r["kind"] == kind]
+        kinds[kind] = {
+            "requests": len(group),
+            "latency_ms": _summary([r["total"] for r in group]),
+            "ttfb_ms": _summary([r["ttfb"] for r in group if r["ttfb"] is not None]),
+        }
+    total_bytes = sum(r["bytes"] for r in ok)
+    return {
+        "concurrency": concurrency,
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "error_reasons": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0,
+        "throughput_kbps": round(total_bytes / 1024 / elapsed, 1) if elapsed > 0 else 0,
+        "cache_hit_ratio": round(sum(1 for r in ok if r["hit"]) / len(ok), 3) if ok else 0,
+        "latency_ms": _summary([r["total"] for r in ok]),
+        "ttfb_ms": _summary([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "kinds": kinds,
+    }
+
+
+def compare(results: List[dict], baseline: dict, max_regression: float) -> List[str]:
+    """与基准结果比较,返回退化项的说明"""
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    problems = []
+    for level in results:
+        base = previous.get(level["concurrency"])
+        if not base:
+            continue
+        c = level["concurrency"]
+        for metric in ("latency_ms", "ttfb_ms"):
+            old, new = base[metric].get("p95"), level[metric].get("p95")
+            if old and new and new > old * (1 + max_regression):
+                problems.append(f"并发 {c}: {metric} p95 {old} -> {new}")
+        old, new = base["throughput_rps"], level["throughput_rps"]
+        if old and new < old * (1 - max_regression):
+            problems.append(f"并发 {c}: 吞吐量 {old} -> {new} req/s")
+        if level["errors"] > base["errors"]:
+            problems.append(f"并发 {c}: 错误数 {base['errors']} -> {level['errors']}")
+    return problems
+
+
+async def _simulator_stats(session: AsyncSession, url: Optional[str]) -> Optional[dict]:
+    if not url:
+        return None
+    try:
+        resp = await session.get(url.rstrip("/") + "/__stats", timeout=10)
+        return resp.json()
+    except Exception:
+        return None
+
+
+def _print_level(level: dict):
+    lat, ttfb = level["latency_ms"], level["ttfb_ms"]
+    print(
+        f"{level['concurrency']:>6}{level['requests']:>8}{level['errors']:>8}{level['throughput_rps']:>10}"
+        f"{level['cache_hit_ratio']:>8.0%}{str(lat['p50']):>10}{str(lat['p95']):>10}{str(lat['p99']):>10}"
+        f"{str(ttfb['p50']):>10}{str(ttfb['p95']):>10}{str(ttfb['p99']):>10}"
+    )
+    for kind, item in level["kinds"].items():
+        print(f"{'':>6}  {kind:<12}{item['requests']:>6} 次  耗时 p50/p95 {item['latency_ms']['p50']}/"
+              f"{item['latency_ms']['p95']}ms  TTFB p50/p95 {item['ttfb_ms']['p50']}/{item['ttfb_ms']['p95']}ms")
+    for reason, count in level["error_reasons"].items():
+        print(f"{'':>6}  错误 {count} 次: {reason}")
+
+
+async def run_suite(args) -> int:
+    bench = Benchmark(args.url, args.key, args.voice, args.audio_type, args.timeout)
+    workload = Workload(args.hit_ratio, args.long_ratio, args.long_chars, args.hit_pool, args.seed)
+    if workload.pool:
+        failed = await bench.warm(workload, max(args.concurrency))
+        print(f"已预热 {len(workload.pool)} 条命中文本" + (f" ({failed} 条失败)" if failed else ""))
+
+    async with AsyncSession() as session:
+        before = await _simulator_stats(session, args.simulator)
+        print(f"{'并发':>4}{'请求':>6}{'错误':>6}{'req/s':>10}{'命中':>6}"
+              f"{'p50':>10}{'p95':>10}{'p99':>10}{'TTFB50':>10}{'TTFB95':>10}{'TTFB99':>10}  (ms)")
+        levels = []
+        for concurrency in args.concurrency:
+            level = await bench.run(workload, concurrency, args.requests)
+            levels.append(level)
+            _print_level(level)
+        after = await _simulator_stats(session, args.simulator)
+
+    report = {
+        "url": args.url,
+        "hit_ratio": args.hit_ratio,
+        "long_ratio": args.long_ratio,
+        "long_chars": args.long_chars,
+        "levels": levels,
+    }
+    if before is not None and after is not None:
+        upstream = {k: after[k] - before.get(k, 0) for k in after if isinstance(after[k], int) and k != "active"}
+        report["upstream"] = upstream
+        print(f"上游请求: 签名 {upstream.get('sign_requests', 0)} 次, 下载 {upstream.get('synth_requests', 0)} 次, "
+              f"错误 {upstream.get('errors', 0)} 次, 限流 {upstream.get('throttled', 0)} 次")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(levels, baseline, args.max_regression)
+        if problems:
+            print(f"与基准 {args.baseline} 相比出现退化 (阈值 {args.max_regression:.0%}):")
+            for problem in problems:
+                print(f"  {problem}")
+            return 1
+        print(f"与基准 {args.baseline} 相比无明显退化")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="压测 /api/tts,统计吞吐量与耗时分位数")
+    parser.add_argument("--url", default="http://127.0.0.1:8501", help="服务地址")
+    parser.add_argument("--key", default=None, help="API 密钥 (开启鉴权时)")
+    parser.add_argument("--voice", default=None, help="发音人 (默认使用服务的默认发音人)")
+    parser.add_argument("--audio-type", default="audio/mp3")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发数,依次压测")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发等级的请求数")
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="命中缓存的请求比例")
+    parser.add_argument("--hit-pool", type=int, default=20, help="命中请求使用的文本数")
+    parser.add_argument("--long-ratio", type=float, default=0.1, help="长文本比例")
+    parser.add_argument("--long-chars", type=int, default=600, help="长文本字数")
+    parser.add_argument("--timeout", type=float, default=300, help="单个请求超时 (秒)")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    parser.add_argument("--simulator", default=None, help="上游模拟服务地址,用于统计上游请求数")
+    parser.add_argument("--output", default=None, help="把结果保存为 JSON")
+    parser.add_argument("--baseline", default=None, help="与之前保存的结果比较")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的退化比例")
+    args = parser.parse_args(argv)
+    try:
+        args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    except ValueError:
+        parser.error(f"无效的并发数: {args.concurrency}")
+    if not args.concurrency or min(args.concurrency) < 1:
+        parser.error("并发数必须为正整数")
+    sys.exit(asyncio.run(run_suite(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+磁盘缓存策略模块
+
+- lru: 按最后访问时间淘汰 (原有策略)
+- tinylfu: 频率感知的准入 + 分段淘汰
+    * 用 Count-Min Sketch 估计每个缓存键近期的请求频率 (定期减半,使旧热点逐渐冷却)
+    * 缓存已满时,新文件的频率不低于将被淘汰的文件才准入,一次性的长文本无法挤掉热点
+    * 最新写入的一小部分文件构成窗口,不参与淘汰,给新文件积累命中的机会
+    * 窗口之外分为试用段 (写入后从未命中) 和保护段 (命中过);优先淘汰试用段中
+      频率最低、体积最大的文件,保护段超过配额时才按最久未访问淘汰保护段
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import config
+
+
+class FrequencySketch:
+    """Count-Min Sketch 频率估计 (计数上限 15,累计一定次数后所有计数减半)"""
+
+    DEPTH = 4
+    MAX_COUNT = 15
+    _HALVE = bytes(i >> 1 for i in range(256))
+
+    def __init__(self, width: int = 1 << 16):
+        self.width = max(64, 1 << (max(1, width) - 1).bit_length())
+        self._mask = self.width - 1
+        self._rows = [bytearray(self.width) for _ in range(self.DEPTH)]
+        self._additions = 0
+        # 累计次数达到宽度的 10 倍时减半 (TinyLFU 的重置机制)
+        self._sample_size = self.width * 10
+
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        for i in range(self.DEPTH):
+            yield int.from_bytes(digest[i * 4:i * 4 + 4], "little") & self._mask
+
+    def increment(self, key: str):
+        indexes = list(self._indexes(key))
+        current = min(row[i] for row, i in zip(self._rows, indexes))
+        if current >= self.MAX_COUNT:
+            return
+        # 保守更新: 只增加等于最小值的计数器,降低哈希冲突带来的高估
+        for row, i in zip(self._rows, indexes):
+            if row[i] == current:
+                row[i] = current + 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._reset()
+
+    def estimate(self, key: str) -> int:
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def _reset(self):
+        for row in self._rows:
+            row[:] = row.translate(self._HALVE)
+        self._additions //= 2
+
+
+class CachePolicy:
+    """缓存策略接口
+
+    victims 返回的候选按淘汰优先级排序,由 CacheStore 依次删除直到满足容量限制。
+    """
+
+    name = "lru"
+
+    def record_access(self, key: str):
+        """记录一次请求 (无论是否命中)"""
+
+    def admit(self, store, key: str, size: int) -> bool:
+        """缓存已满时是否准入新文件"""
+        return True
+
+    def victims(self, store, limit: int, where: str = "", params: tuple = (), incoming: int = 0) -> List[Tuple[str, int]]:
+        """按淘汰顺序返回至多 limit 条候选 (键, 大小)
+
+        Args:
+            store: CacheStore
+            limit: 最多返回的条数
+            where: 附加的筛选条件 (如按发音人),以 AND 连接
+            params: 筛选条件的参数
+            incoming: 即将写入 (尚未登记) 的文件数
+        """
+        sql = "SELECT key, size FROM entries"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY last_access LIMIT ?"
+        return store.conn.execute(sql, params + (limit,)).fetchall()
+
+    def stats(self) -> dict:
+        return {"name": self.name}
+
+
+class LRUPolicy(CachePolicy):
+    name = "lru"
+
+
+class TinyLFUPolicy(CachePolicy):
+    name = "tinylfu"
+
+    def __init__(self, window_ratio: Optional[float] = None, protected_ratio: Optional[float] = None,
+                 sketch_width: int = 1 << 16):
+        settings = config.get_settings()
+        self.window_ratio = window_ratio if window_ratio is not None else float(settings.get("cache_window_ratio", 0.05))
+        self.protected_ratio = protected_ratio if protected_ratio is not None else float(settings.get("cache_protected_ratio", 0.8))
+        self.sketch = FrequencySketch(sketch_width)
+        self.admitted = 0
+        self.rejected = 0
+
+    def record_access(self, key: str):
+        self.sketch.increment(key)
+
+    def _window_boundary(self, store, where: str, params: tuple, incoming: int) -> Optional[float]:
+        """窗口 (最近访问的若干文件) 的最早访问时间,窗口内的文件不参与淘汰
+
+        incoming 为即将写入的文件数,它们占用窗口的位置。
+        """
+        limit_count, _ = store.limits()
+        window = max(1, int(limit_count * self.window_ratio)) if limit_count > 0 else 1
+        skip = window - incoming
+        if skip <= 0:
+            return float("inf")
+        sql = "SELECT last_access FROM entries"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY last_access DESC LIMIT 1 OFFSET ?"
+        row = store.conn.execute(sql, params + (skip - 1,)).fetchone()
+        return row[0] if row else None
+
+    def victims(self, store, limit: int, where: str = "", params: tuple = (), incoming: int = 0) -> List[Tuple[str, int]]:
+        boundary = self._window_boundary(store, where, params, incoming)
+        if boundary is None:
+            # 文件数不超过窗口大小
+            return []
+        base = "last_access < ?"
+        base_params = (boundary,)
+        if where:
+            base = f"{where} AND {base}"
+            base_params = params + base_params
+
+        limit_count, _ = store.limits()
+        protected = store.conn.execute(
+            f"SELECT COUNT(*) FROM entries WHERE {base} AND (hits > 0) = 1", base_params
+        ).fetchone()[0]
+        protected_over = limit_count > 0 and protected > limit_count * self.protected_ratio
+
+        probation = store.conn.execute(
+            f"SELECT key, size FROM entries WHERE {base} AND (hits > 0) = 0 ORDER BY last_access LIMIT ?",
+            base_params + (limit,),
+        ).fetchall()
+        # 试用段中优先淘汰频率低、体积大的文件
+        probation.sort(key=lambda row: (self.sketch.estimate(row[0]), -row[1]))
+        protected_rows = store.conn.execute(
+            f"SELECT key, size FROM entries WHERE {base} AND (hits > 0) = 1 ORDER BY last_access LIMIT ?",
+            base_params + (limit,),
+        ).fetchall()
+
+        ordered = protected_rows + probation if protected_over else probation + protected_rows
+        return ordered[:limit]
+
+    def admit(self, store, key: str, size: int) -> bool:
+        """新文件的频率不低于为它腾出空间需淘汰的文件时才准入"""
+        over_count, over_bytes = store.overflow(extra_count=1, extra_bytes=size)
+        if over_count <= 0 and over_bytes <= 0:
+            self.admitted += 1
+            return True
+        candidate = self.sketch.estimate(key)
+        for victim, victim_size in self.victims(store, store.EVICT_BATCH, incoming=1):
+            if over_count <= 0 and over_bytes <= 0:
+                break
+            if self.sketch.estimate(victim) > candidate:
+                self.rejected += 1
+                return False
+            over_count -= 1
+            over_bytes -= victim_size
+        self.admitted += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "window_ratio": self.window_ratio,
+            "protected_ratio": self.protected_ratio,
+        }
+
+
+POLICIES: Dict[str, type] = {
+    LRUPolicy.name: LRUPolicy,
+    TinyLFUPolicy.name: TinyLFUPolicy,
+}
+
+
+def create_policy(name: str) -> CachePolicy:
+    """按名称创建缓存策略,未知名称回退为 lru"""
+    return POLICIES.get(name, LRUPolicy)()
@@ -0,0 +1,116 @@
+"""
+缓存策略离线模拟
+
+回放磁盘缓存的访问记录 (设置 cache_access_log: true 后写入 data/cache/access.log),
+用与线上相同的 CacheStore 和缓存策略在内存中模拟,比较不同策略的命中率:
+
+    python -m app.services.cache_simulator data/cache/access.log --limit 1000
+    python -m app.services.cache_simulator data/cache/access.log --policy lru,tinylfu --limit-bytes 104857600
+"""
+
+import argparse
+import statistics
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.cache_policy import POLICIES, TinyLFUPolicy
+from app.services.cache_store import CacheStore
+
+# (时间, 事件, 缓存键, 大小, 发音人)
+AccessRecord = Tuple[float, str, str, Optional[int], Optional[str]]
+
+
+def read_access_log(path: str) -> Iterator[AccessRecord]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 3:
+                continue
+            try:
+                ts = float(parts[0])
+            except ValueError:
+                continue
+            size = int(parts[3]) if len(parts) > 3 and parts[3] else None
+            voice = parts[4] if len(parts) > 4 and parts[4] else None
+            yield ts, parts[1], parts[2], size, voice
+
+
+def simulate(records: List[AccessRecord], policy_name: str, limit_count: int, limit_bytes: int = 0,
+             window_ratio: Optional[float] = None, protected_ratio: Optional[float] = None) -> dict:
+    """按访问记录回放一种策略,返回命中统计
+
+    记录中的每次请求 (H 命中 / M 未命中) 都按模拟缓存的状态重新判断是否命中,
+    未命中时以记录中出现过的文件大小写入模拟缓存。
+    """
+    sizes: Dict[str, int] = {}
+    voices: Dict[str, str] = {}
+    for _, _, key, size, voice in records:
+        if size:
+            sizes[key] = max(size, sizes.get(key, 0))
+        if voice:
+            voices[key] = voice
+    default_size = int(statistics.median(sizes.values())) if sizes else 1
+
+    if policy_name == TinyLFUPolicy.name:
+        policy = TinyLFUPolicy(window_ratio=window_ratio, protected_ratio=protected_ratio)
+    else:
+        policy = POLICIES[policy_name]()
+    now = [0.0]
+    store = CacheStore(None, policy=policy, limits=(limit_count, limit_bytes), clock=lambda: now[0])
+
+    requests = hit_bytes = total_bytes = 0
+    for ts, event, key, _, _ in records:
+        if event not in ("H", "M"):
+            continue
+        now[0] = ts
+        requests += 1
+        size = sizes.get(key, default_size)
+        total_bytes += size
+        if store.conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+            store.touch(key, size)
+            hit_bytes += size
+        else:
+            store.record_miss(key)
+            store.add(key, size, voices.get(key))
+
+    store.flush()
+    count, cached_bytes = store.totals()
+    result = {
+        "policy": policy_name,
+        "requests": requests,
+        "hits": store.hits,
+        "hit_ratio": store.hits / requests if requests else 0.0,
+        "byte_hit_ratio": hit_bytes / total_bytes if total_bytes else 0.0,
+        "files": count,
+        "bytes": cached_bytes,
+    }
+    result.update({k: v for k, v in policy.stats().items() if k in ("admitted", "rejected")})
+    store.close()
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="回放缓存访问记录,比较缓存策略的命中率")
+    parser.add_argument("log", help="访问记录文件 (data/cache/access.log)")
+    parser.add_argument("--policy", default=",".join(POLICIES), help="逗号分隔的策略名称")
+    parser.add_argument("--limit", type=int, default=100, help="文件数上限")
+    parser.add_argument("--limit-bytes", type=int, default=0, help="总字节数上限 (0 表示不限)")
+    parser.add_argument("--window-ratio", type=float, default=0.05, help="tinylfu 窗口占比")
+    parser.add_argument("--protected-ratio", type=float, default=0.8, help="tinylfu 保护段占比")
+    args = parser.parse_args(argv)
+
+    records = list(read_access_log(args.log))
+    print(f"访问记录: {len(records)} 条, 文件数上限 {args.limit}, 字节数上限 {args.limit_bytes or '不限'}")
+    print(f"{'策略':<10}{'请求':>10}{'命中':>10}{'命中率':>10}{'字节命中率':>12}{'未准入':>10}")
+    for name in args.policy.split(","):
+        name = name.strip()
+        if name not in POLICIES:
+            parser.error(f"未知策略: {name} (可选: {', '.join(POLICIES)})")
+        result = simulate(records, name, args.limit, args.limit_bytes, args.window_ratio, args.protected_ratio)
+        print(
+            f"{name:<10}{result['requests']:>10}{result['hits']:>10}"
+            f"{result['hit_ratio']:>10.1%}{result['byte_hit_ratio']:>12.1%}{result.get('rejected', 0):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
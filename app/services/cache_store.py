@@ -0,0 +1,405 @@
+import functools
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import config
+from app.core.logger import logger
+from app.services.cache_policy import CachePolicy, create_policy
+
+
+def _locked(method):
+    """在存储的锁内执行 (索引连接和访问统计不是线程安全的)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class CacheStore:
+    """带索引的磁盘缓存
+
+    - 文件按缓存键前两位分片存放: data/cache/ab/abcdef....mp3
+    - SQLite 索引记录键、大小、发音人、创建时间、最后访问时间和命中次数
+    - 总数与总字节数由触发器维护,淘汰时只取少量候选记录,无需遍历目录
+    - 准入与淘汰顺序由可替换的缓存策略决定 (见 cache_policy),并支持按发音人限额
+    - WAL 模式,多个 worker 进程共享同一索引
+    - 索引读写可能因其他进程持有写锁而等待 (最长 5 秒),事件循环中应通过 asyncio.to_thread 调用;
+      各方法由同一把锁串行执行,可在任意线程中使用
+    """
+
+    INDEX_FILE = "index.db"
+    # 访问记录 (供 cache_simulator 离线回放),cache_access_log 开启时写入
+    ACCESS_LOG_FILE = "access.log"
+    # 累积多少次访问后批量写入索引
+    TOUCH_FLUSH_SIZE = 200
+    # 距上次写入超过多少秒后批量写入索引
+    TOUCH_FLUSH_INTERVAL = 10
+    # 每次淘汰查询取出的记录数
+    EVICT_BATCH = 64
+
+    # 使用 UPSERT 而不是 INSERT OR REPLACE: 后者隐式删除旧行时不会触发删除触发器
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY,
+        voice TEXT,
+        audio_type TEXT,
+        size INTEGER NOT NULL,
+        created REAL NOT NULL,
+        last_access REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access);
+    CREATE INDEX IF NOT EXISTS idx_entries_voice ON entries(voice);
+    CREATE INDEX IF NOT EXISTS idx_entries_segment ON entries((hits > 0), last_access);
+    CREATE TABLE IF NOT EXISTS totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        count INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO totals (id, count, bytes) VALUES (0, 0, 0);
+    CREATE TRIGGER IF NOT EXISTS trg_entries_insert AFTER INSERT ON entries BEGIN
+        UPDATE totals SET count = count + 1, bytes = bytes + NEW.size WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_entries_delete AFTER DELETE ON entries BEGIN
+        UPDATE totals SET count = count - 1, bytes = bytes - OLD.size WHERE id = 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_entries_update AFTER UPDATE OF size ON entries BEGIN
+        UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0;
+    END;
+    """
+
+    def __init__(self, cache_dir: str, policy: Optional[CachePolicy] = None,
+                 limits: Optional[Tuple[int, int]] = None, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            cache_dir: 缓存目录;为 None 时只在内存中维护索引,不读写文件 (供离线模拟使用)
+            policy: 固定使用的缓存策略,None 表示按设置中的 cache_policy 选择
+            limits: 固定的 (文件数, 字节数) 限制,None 表示读取设置
+            clock: 时间来源 (回放访问记录时使用记录中的时间)
+        """
+        self.cache_dir = cache_dir
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending_touches: Dict[str, int] = {}
+        self._fixed_policy = policy
+        self._policy: Optional[CachePolicy] = policy
+        self._fixed_limits = limits
+        self._clock = clock
+        self._access_log = None
+        self._lock = threading.RLock()
+        self._last_flush = clock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """延迟打开索引 (首次使用时迁移旧的平铺缓存文件)"""
+        if self._conn is None:
+            if self.cache_dir is None:
+                conn = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+                conn.executescript(self.SCHEMA)
+                self._conn = conn
+                return conn
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.cache_dir, self.INDEX_FILE), timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+            self._migrate_flat_files()
+        return self._conn
+
+    @property
+    def policy(self) -> CachePolicy:
+        """当前缓存策略 (设置中的 cache_policy 变化时重新创建)"""
+        if self._fixed_policy is not None:
+            return self._fixed_policy
+        name = config.get_settings().get("cache_policy", "tinylfu")
+        if self._policy is None or self._policy.name != name:
+            self._policy = create_policy(name)
+        return self._policy
+
+    def limits(self) -> Tuple[int, int]:
+        """返回 (文件数上限, 字节数上限),字节数为 0 表示不限"""
+        if self._fixed_limits is not None:
+            return self._fixed_limits
+        settings = config.get_settings()
+        return settings.get("cache_limit", 100), settings.get("cache_limit_bytes", 0)
+
+    def overflow(self, extra_count: int = 0, extra_bytes: int = 0) -> Tuple[int, int]:
+        """再加入 extra_count 个、共 extra_bytes 字节的文件后,超出限制的 (文件数, 字节数)"""
+        limit_count, limit_bytes = self.limits()
+        count, total_bytes = self.totals()
+        over_count = count + extra_count - limit_count
+        over_bytes = total_bytes + extra_bytes - limit_bytes if limit_bytes > 0 else 0
+        return over_count, over_bytes
+
+    @_locked
+    def open(self):
+        """打开索引并完成旧缓存迁移 (应用启动时调用)"""
+        count, total_bytes = self.totals()
+        logger.info(f"[缓存] 磁盘缓存索引已加载: {count} 个文件, {total_bytes / 1024 / 1024:.1f} MB")
+
+    def path_for(self, key: str) -> str:
+        """缓存键对应的分片文件路径"""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _migrate_flat_files(self):
+        """把旧版本直接放在 data/cache 下的缓存文件移入分片目录并建立索引 (索引和访问记录文件除外)"""
+        migrated = 0
+        for name in os.listdir(self.cache_dir):
+            src = os.path.join(self.cache_dir, name)
+            if not os.path.isfile(src) or name.startswith(self.INDEX_FILE) or name == self.ACCESS_LOG_FILE:
+                continue
+            if name.endswith(".tmp"):
+                os.remove(src)
+                continue
+            dst = self.path_for(name)
+            try:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(src, dst)
+                stat = os.stat(dst)
+                self._conn.execute(
+                    "INSERT INTO entries (key, voice, audio_type, size, created, last_access, hits) "
+                    "VALUES (?, NULL, NULL, ?, ?, ?, 0) "
+                    "ON CONFLICT(key) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+                    (name, stat.st_size, stat.st_mtime, stat.st_mtime),
+                )
+                migrated += 1
+            except Exception as e:
+                logger.error(f"[缓存] 迁移缓存文件 {name} 时出错: {e}")
+        if migrated:
+            logger.info(f"[缓存] 已将 {migrated} 个旧缓存文件迁移到分片目录")
+
+    @_locked
+    def admit(self, key: str, size: int, voice: Optional[str] = None, force: bool = False) -> bool:
+        """写入前的准入判断 (记录一次写入访问)
+
+        已登记、未设上限或 force 时总是准入;缓存已满时由策略决定。
+        调用方应在文件放入缓存路径之前判断,未准入的数据由调用方自行保留或丢弃。
+
+        Args:
+            force: 跳过准入判断 (批量、异步任务的结果需要保留到被下载)
+        """
+        self._log_access("A", key, size, voice)
+        if force or self.limits()[0] <= 0:
+            return True
+        if self.conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None:
+            return True
+        self.flush()
+        if not self.policy.admit(self, key, size):
+            logger.debug(f"[缓存] 未准入 (访问频率低于淘汰候选): {key}")
+            return False
+        return True
+
+    @_locked
+    def add(self, key: str, size: int, voice: Optional[str] = None, audio_type: Optional[str] = None,
+            force: bool = False) -> bool:
+        """登记已写入缓存路径的文件,并按需淘汰
+
+        缓存已满时由策略决定是否准入,未准入的文件会被删除
+        (文件可能仍被读取时应先调用 admit,准入后再放入缓存路径并调用 register)。
+
+        Args:
+            force: 跳过准入判断 (批量、异步任务的结果需要保留到被下载)
+
+        Returns:
+            是否已登记
+        """
+        if not self.admit(key, size, voice, force):
+            self._delete_file(key)
+            return False
+        self.register(key, size, voice, audio_type)
+        return True
+
+    @_locked
+    def register(self, key: str, size: int, voice: Optional[str] = None, audio_type: Optional[str] = None):
+        """登记已准入的缓存文件,并按需淘汰"""
+        now = self._clock()
+        self.conn.execute(
+            "INSERT INTO entries (key, voice, audio_type, size, created, last_access, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, 0) "
+            "ON CONFLICT(key) DO UPDATE SET voice = COALESCE(excluded.voice, voice), "
+            "audio_type = COALESCE(excluded.audio_type, audio_type), size = excluded.size, "
+            "last_access = excluded.last_access",
+            (key, voice, audio_type, size, now, now),
+        )
+        self.evict(voice)
+
+    @_locked
+    def touch(self, key: str, size: Optional[int] = None):
+        """记录一次命中 (批量写入索引)"""
+        self.hits += 1
+        self.policy.record_access(key)
+        self._log_access("H", key, size)
+        self._pending_touches[key] = self._pending_touches.get(key, 0) + 1
+        if len(self._pending_touches) >= self.TOUCH_FLUSH_SIZE or self._clock() - self._last_flush > self.TOUCH_FLUSH_INTERVAL:
+            self.flush()
+
+    @_locked
+    def record_miss(self, key: Optional[str] = None):
+        self.misses += 1
+        if key is not None:
+            self.policy.record_access(key)
+            self._log_access("M", key)
+
+    def _log_access(self, event: str, key: str, size: Optional[int] = None, voice: Optional[str] = None):
+        """追加一条访问记录: 时间 事件(H 命中/M 未命中/A 写入) 键 大小 发音人"""
+        if self.cache_dir is None or not config.get_settings().get("cache_access_log", False):
+            if self._access_log is not None:
+                self._access_log.close()
+                self._access_log = None
+            return
+        if self._access_log is None:
+            self._access_log = open(os.path.join(self.cache_dir, self.ACCESS_LOG_FILE), "a", encoding="utf-8")
+        size_text = "" if size is None else str(size)
+        self._access_log.write(f"{self._clock():.3f}\t{event}\t{key}\t{size_text}\t{voice or ''}\n")
+
+    @_locked
+    def flush(self):
+        """把累积的访问记录写入索引"""
+        self._last_flush = self._clock()
+        if self._access_log is not None:
+            self._access_log.flush()
+        if not self._pending_touches:
+            return
+        touches = self._pending_touches
+        self._pending_touches = {}
+        now = self._clock()
+        try:
+            self.conn.executemany(
+                "UPDATE entries SET last_access = ?, hits = hits + ? WHERE key = ?",
+                [(now, count, key) for key, count in touches.items()],
+            )
+        except Exception as e:
+            logger.error(f"[缓存] 写入访问记录时出错: {e}")
+
+    @_locked
+    def totals(self):
+        """返回 (文件数, 总字节数)"""
+        row = self.conn.execute("SELECT count, bytes FROM totals WHERE id = 0").fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    @_locked
+    def evict(self, voice: Optional[str] = None):
+        """按策略淘汰文件,直到文件数和总字节数都不超过限制;指定发音人时同时检查其限额"""
+        limit_count, _ = self.limits()
+        if limit_count <= 0:
+            return
+
+        self.flush()
+        while True:
+            over_count, over_bytes = self.overflow()
+            if over_count <= 0 and over_bytes <= 0:
+                break
+            if not self._evict_batch(self.policy.victims(self, self.EVICT_BATCH), over_count, over_bytes):
+                break
+
+        quota = self._voice_quota(voice)
+        while quota > 0:
+            count = self.conn.execute("SELECT COUNT(*) FROM entries WHERE voice = ?", (voice,)).fetchone()[0]
+            if count <= quota:
+                break
+            victims = self.policy.victims(self, self.EVICT_BATCH, "voice = ?", (voice,))
+            if not self._evict_batch(victims, count - quota, 0):
+                break
+
+    def _evict_batch(self, rows: List[Tuple[str, int]], over_count: int, over_bytes: int) -> bool:
+        """按顺序删除候选直到不再超出,返回是否删除了文件"""
+        victims = []
+        for key, size in rows:
+            if over_count <= 0 and over_bytes <= 0:
+                break
+            victims.append(key)
+            over_count -= 1
+            over_bytes -= size
+        if victims:
+            self._delete(victims)
+        return bool(victims)
+
+    def _voice_quota(self, voice: Optional[str]) -> int:
+        """发音人的文件数限额: cache_voice_quotas 中的单独设置,否则为 cache_voice_quota (0 表示不限)"""
+        if voice is None or self._fixed_limits is not None:
+            return 0
+        settings = config.get_settings()
+        quotas = settings.get("cache_voice_quotas") or {}
+        return int(quotas.get(voice, settings.get("cache_voice_quota", 0)) or 0)
+
+    def _delete(self, keys: List[str]):
+        """删除缓存文件及其索引记录"""
+        for key in keys:
+            self._delete_file(key)
+            self._pending_touches.pop(key, None)
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in keys])
+
+    def _delete_file(self, key: str):
+        if self.cache_dir is None:
+            return
+        path = self.path_for(key)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.error(f"清理缓存文件 {path} 时出错: {e}")
+
+    @_locked
+    def purge(self, voice: Optional[str] = None, older_than: Optional[float] = None) -> List[str]:
+        """按发音人和/或创建时间清理缓存
+
+        Args:
+            voice: 发音人代码,None 表示不限
+            older_than: 只清理创建时间早于该秒数之前的文件,None 表示不限
+
+        Returns:
+            被清理的缓存键列表
+        """
+        self.flush()
+        conditions = []
+        params = []
+        if voice is not None:
+            conditions.append("(voice = ? OR voice LIKE ? ESCAPE '\\')")
+            params.extend([voice, f"{voice}\\_%"])
+        if older_than is not None:
+            conditions.append("created < ?")
+            params.append(time.time() - older_than)
+        sql = "SELECT key FROM entries"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        keys = [row[0] for row in self.conn.execute(sql, params).fetchall()]
+        if keys:
+            self._delete(keys)
+            logger.info(f"[缓存] 已清理 {len(keys)} 个缓存文件")
+        return keys
+
+    @_locked
+    def stats(self) -> dict:
+        self.flush()
+        count, total_bytes = self.totals()
+        total_hits = self.conn.execute("SELECT COALESCE(SUM(hits), 0) FROM entries").fetchone()[0]
+        requests = self.hits + self.misses
+        limit_count, limit_bytes = self.limits()
+        return {
+            "files": count,
+            "bytes": total_bytes,
+            "limit_files": limit_count,
+            "limit_bytes": limit_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "indexed_hits": total_hits,
+            "policy": self.policy.stats(),
+        }
+
+    @_locked
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+        if self._access_log is not None:
+            self._access_log.close()
+            self._access_log = None
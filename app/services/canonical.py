@@ -0,0 +1,72 @@
+"""
+缓存键规范化模块
+
+缓存键基于上游实际收到的参数计算 (特殊符号映射和标签处理之后的文本、映射后的语速音量),
+只在空白、全角/半角等上游听起来相同的地方存在差异的请求会命中同一条缓存。
+"""
+
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Set
+
+# 全角 ASCII 字符 (！～ 及全角字母数字) 与全角空格转为半角
+_WIDTH_TABLE = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_WIDTH_TABLE[0x3000] = 0x20
+
+# 含换行的空白保留为一个换行 (停顿),其余连续空白合并为一个空格
+_NEWLINE_RE = re.compile(r"\s*\n\s*")
+_SPACE_RE = re.compile(r"[^\S\n]+")
+
+
+def normalize_text(text: str) -> str:
+    """把文本规范化为上游听起来相同的形式 (全角转半角、合并空白、去除首尾空白)"""
+    text = text.translate(_WIDTH_TABLE)
+    text = _NEWLINE_RE.sub("\n", text)
+    text = _SPACE_RE.sub(" ", text)
+    return text.strip()
+
+
+def raw_fingerprint(text: str, voice_code: str, speed, volume, pitch, audio_type: str) -> str:
+    """未经规范化的原始请求参数指纹 (即规范化之前的缓存键算法)"""
+    raw = f"{text}_{voice_code}_{speed}_{volume}_{pitch}_{audio_type}"
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+class CanonicalStats:
+    """统计规范化带来的额外命中
+
+    记录每个缓存键最近出现过的原始请求指纹;命中缓存的请求若其原始指纹与该键之前的
+    所有请求都不同,说明按原始参数计算缓存键时这次会未命中,计为一次额外命中。
+    只统计本进程内观察到的请求,重启后从零开始 (只会少计,不会多计)。
+    """
+
+    MAX_KEYS = 100000
+    MAX_VARIANTS = 8
+
+    def __init__(self):
+        self._variants: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self.requests = 0
+        self.extra_hits = 0
+
+    def observe(self, cache_key: str, fingerprint: str, hit: bool):
+        self.requests += 1
+        variants = self._variants.get(cache_key)
+        if variants is None:
+            variants = set()
+            self._variants[cache_key] = variants
+            if len(self._variants) > self.MAX_KEYS:
+                self._variants.popitem(last=False)
+        else:
+            self._variants.move_to_end(cache_key)
+            if hit and fingerprint not in variants:
+                self.extra_hits += 1
+        if fingerprint not in variants and len(variants) < self.MAX_VARIANTS:
+            variants.add(fingerprint)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "extra_hits": self.extra_hits,
+            "tracked_keys": len(self._variants),
+        }
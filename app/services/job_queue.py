@@ -0,0 +1,313 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from app.core.config import config
+from app.core.logger import logger
+from app.services.xf_service import xf_service
+
+
+def _pid_alive(pid: int) -> bool:
+    """判断本机上的进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class JobStore:
+    """异步合成任务的持久化存储 (SQLite)
+
+    任务状态: pending -> running -> done / failed。
+    running 状态带租约,进程崩溃或重启后租约过期的任务会被重新领取。
+    各方法会阻塞 (其他进程持有写锁时最长等待 5 秒),事件循环中应通过 asyncio.to_thread 调用;
+    同一连接上的操作由锁串行执行。
+    """
+
+    DB_PATH = "data/jobs.db"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        text TEXT NOT NULL,
+        voice TEXT NOT NULL,
+        speed INTEGER NOT NULL,
+        volume INTEGER NOT NULL,
+        audio_type TEXT NOT NULL,
+        cache_key TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        lease_until REAL,
+        owner INTEGER,
+        created REAL NOT NULL,
+        updated REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created);
+    """
+
+    COLUMNS = ["id", "status", "text", "voice", "speed", "volume", "audio_type",
+               "cache_key", "error", "attempts", "created", "updated"]
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _row_to_dict(self, row) -> dict:
+        return dict(zip(self.COLUMNS, row))
+
+    def create(self, text: str, voice: str, speed: int, volume: int, audio_type: str) -> dict:
+        with self._lock:
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            self.conn.execute(
+                "INSERT INTO jobs (id, status, text, voice, speed, volume, audio_type, created, updated) "
+                "VALUES (?, 'pending', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, text, voice, speed, volume, audio_type, now, now),
+            )
+            return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            return self._row_to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        with self._lock:
+            sql = f"SELECT {', '.join(self.COLUMNS)} FROM jobs"
+            params = []
+            if status:
+                sql += " WHERE status = ?"
+                params.append(status)
+            sql += " ORDER BY created DESC LIMIT ?"
+            params.append(limit)
+            return [self._row_to_dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def claim(self, lease: float) -> Optional[dict]:
+        """领取最早的待处理任务 (包括租约已过期的 running 任务)"""
+        with self._lock:
+            now = time.time()
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'pending' "
+                    "OR (status = 'running' AND lease_until < ?) ORDER BY created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, owner = ?, updated = ? WHERE id = ?",
+                    (now + lease, os.getpid(), now, row[0]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return self.get(row[0])
+
+    def release_orphans(self) -> int:
+        """把所属进程已不存在的 running 任务放回队列 (重启后立即恢复,无需等待租约过期)"""
+        with self._lock:
+            owners = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status = 'running'"
+            ).fetchall()]
+            released = 0
+            for owner in owners:
+                if owner is not None and owner != os.getpid() and _pid_alive(owner):
+                    continue
+                cursor = self.conn.execute(
+                    "UPDATE jobs SET status = 'pending', lease_until = NULL, owner = NULL WHERE status = 'running' AND owner IS ?",
+                    (owner,),
+                )
+                released += cursor.rowcount
+            return released
+
+    def peek_pending(self, limit: int) -> List[dict]:
+        """查看接下来要处理的任务 (用于预签名)"""
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = 'pending' ORDER BY created LIMIT ?",
+                (limit,),
+            ).fetchall()
+            return [self._row_to_dict(row) for row in rows]
+
+    def finish(self, job_id: str, cache_key: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            status = "failed" if error is not None else "done"
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, cache_key = ?, error = ?, lease_until = NULL, updated = ? WHERE id = ?",
+                (status, cache_key, error, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str, error: str):
+        """任务失败但仍可重试时放回队列"""
+        with self._lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'pending', error = ?, lease_until = NULL, updated = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            return {status: count for status, count in rows}
+
+    def cleanup(self, retention: float) -> int:
+        """删除超过保留期的已完成/失败任务"""
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                (time.time() - retention,),
+            )
+            return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class JobQueue:
+    """异步合成任务队列
+
+    客户端提交任务后立即返回任务 ID,由后台工作协程按受控速率从队列中领取并合成,
+    完成的任务直接指向缓存中的音频。任务状态持久化在 data/jobs.db 中,
+    重启后未完成的任务会继续处理。
+    """
+
+    # 空闲时轮询队列的间隔(秒),用于发现其他进程提交的任务
+    POLL_INTERVAL = 2.0
+    # 领取任务的租约时长(秒),超过后视为处理该任务的进程已失效
+    LEASE_SECONDS = 600
+
+    def __init__(self):
+        self.store = JobStore()
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_start = 0.0
+        self._rate_lock: Optional[asyncio.Lock] = None
+
+    def start(self):
+        """启动工作协程 (应用启动时调用)"""
+        settings = config.get_settings()
+        workers = int(settings.get("job_workers", 2))
+        retention = float(settings.get("job_retention_days", 7)) * 86400
+        removed = self.store.cleanup(retention)
+        if removed:
+            logger.info(f"[任务] 已清理 {removed} 个过期任务")
+
+        self.store.release_orphans()
+        counts = self.store.counts()
+        pending = counts.get("pending", 0) + counts.get("running", 0)
+        if pending:
+            logger.info(f"[任务] 恢复 {pending} 个未完成的任务")
+
+        self._wakeup = asyncio.Event()
+        self._rate_lock = asyncio.Lock()
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(max(0, workers))]
+
+    async def submit(self, text: str, voice: str, speed: int, volume: int, audio_type: str) -> dict:
+        job = await asyncio.to_thread(self.store.create, text, voice, speed, volume, audio_type)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def _pace(self):
+        """按 job_rate_limit (每秒任务数) 控制任务启动速率"""
+        rate = float(config.get_settings().get("job_rate_limit", 2))
+        if rate <= 0:
+            return
+        async with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_start = max(now, self._next_start) + 1 / rate
+
+    async def _presign_upcoming(self, limit: int):
+        """为接下来的待处理任务提前签名"""
+        for job in await asyncio.to_thread(self.store.peek_pending, limit):
+            xf_service.presigner.schedule([job["text"]], job["voice"], job["speed"], job["volume"])
+
+    async def _worker(self, worker_id: int):
+        while True:
+            try:
+                await self._pace()
+                job = await asyncio.to_thread(self.store.claim, self.LEASE_SECONDS)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._presign_upcoming(len(self._workers))
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[任务] 工作协程 {worker_id} 出错: {e}")
+                await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def _run_job(self, job: dict):
+        start = time.time()
+        try:
+            cache_key = await xf_service.ensure_cached(
+                job["text"], job["voice"], job["speed"], job["volume"], audio_type=job["audio_type"]
+            )
+        except Exception as e:
+            max_attempts = int(config.get_settings().get("job_max_attempts", 3))
+            if job["attempts"] < max_attempts:
+                logger.warning(f"[任务] {job['id']} 第 {job['attempts']} 次执行失败,将重新排队: {e}")
+                await asyncio.to_thread(self.store.requeue, job["id"], str(e))
+            else:
+                logger.error(f"[任务] {job['id']} 失败: {e}")
+                await asyncio.to_thread(self.store.finish, job["id"], error=str(e))
+            return
+        await asyncio.to_thread(self.store.finish, job["id"], cache_key=cache_key)
+        logger.info(f"[任务] {job['id']} 完成: {(time.time() - start) * 1000:.0f}ms")
+
+    def describe(self, job: dict) -> dict:
+        """任务的对外表示 (完成时附带音频地址)"""
+        result = {k: job[k] for k in ("id", "status", "attempts", "error", "created", "updated")}
+        if job["status"] == "done":
+            result["cache_key"] = job["cache_key"]
+            result["audio_available"] = xf_service.get_cached_path(job["cache_key"]) is not None
+            result["url"] = f"/api/cache/{job['cache_key']}"
+        return result
+
+    async def close(self):
+        """停止工作协程;进行中的任务保持 running 状态,租约过期后重新处理"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.store.close()
+
+
+job_queue = JobQueue()
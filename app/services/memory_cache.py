@@ -0,0 +1,142 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import config
+from app.core.logger import logger
+
+
+class MemoryCache:
+    """内存热点缓存 (位于 data/cache 磁盘缓存之前)
+
+    - 按字节预算而不是文件数量限制容量,超过单条上限的音频不进入内存
+    - 磁盘命中达到一定次数的音频被提升到内存,之后的命中不再访问文件系统
+    - 内存淘汰时若磁盘副本已被清理,则写回磁盘 (降级),避免热点数据直接丢失
+    """
+
+    # 磁盘命中计数表的最大条目数,超过后整体重置,防止无限增长
+    MAX_TRACKED_KEYS = 100000
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._paths: Dict[str, str] = {}
+        self._disk_hits: Dict[str, int] = {}
+        self.size = 0
+        self.hits = 0
+        self.promotions = 0
+        self.demotions = 0
+        # 降级写回磁盘后的回调 (key, size),用于登记到磁盘缓存索引
+        self.on_demote = None
+
+    @staticmethod
+    def _limits():
+        settings = config.get_settings()
+        budget = int(settings.get("memory_cache_bytes", 64 * 1024 * 1024))
+        max_item = int(settings.get("memory_cache_max_item_bytes", 1024 * 1024))
+        promote_hits = int(settings.get("memory_cache_promote_hits", 2))
+        return budget, max_item, promote_hits
+
+    def get(self, key: str) -> Optional[bytes]:
+        """读取内存中的音频,未命中返回 None"""
+        data = self._entries.get(key)
+        if data is None:
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def should_promote(self, key: str, file_size: int) -> bool:
+        """记录一次磁盘命中,并判断是否应提升到内存"""
+        budget, max_item, promote_hits = self._limits()
+        if budget <= 0 or file_size > max_item or file_size > budget:
+            return False
+        if len(self._disk_hits) >= self.MAX_TRACKED_KEYS:
+            self._disk_hits.clear()
+        count = self._disk_hits.get(key, 0) + 1
+        self._disk_hits[key] = count
+        return count >= promote_hits
+
+    async def put(self, key: str, data: bytes, path: str):
+        """将音频放入内存 (提升),因超出预算被淘汰的条目在线程中降级
+
+        Args:
+            key: 缓存键
+            data: 完整的音频数据
+            path: 对应的磁盘缓存路径,用于淘汰时降级
+        """
+        budget, max_item, _ = self._limits()
+        if len(data) > max_item or len(data) > budget:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = data
+        self._paths[key] = path
+        self.size += len(data)
+        self._disk_hits.pop(key, None)
+        self.promotions += 1
+        evicted = self._evict(budget)
+        if evicted:
+            await asyncio.to_thread(self._demote_all, evicted)
+
+    def _evict(self, budget: int) -> List[Tuple[str, Optional[str], bytes]]:
+        """按 LRU 淘汰直到总字节数不超过预算,返回被淘汰的 (键, 磁盘路径, 数据)"""
+        evicted = []
+        while self.size > budget and self._entries:
+            key, data = self._entries.popitem(last=False)
+            path = self._paths.pop(key, None)
+            self.size -= len(data)
+            evicted.append((key, path, data))
+        return evicted
+
+    def _demote_all(self, evicted: List[Tuple[str, Optional[str], bytes]]):
+        """降级被淘汰的条目并登记到磁盘缓存索引 (写文件,应在线程中调用)"""
+        for key, path, data in evicted:
+            if self._demote(path, data) and self.on_demote is not None:
+                self.on_demote(key, len(data))
+
+    def _demote(self, path: Optional[str], data: bytes) -> bool:
+        """降级: 磁盘副本已不存在时写回磁盘,返回是否发生了写回"""
+        if not path or os.path.exists(path):
+            return False
+        temp_path = f"{path}.demote.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self.demotions += 1
+            return True
+        except Exception as e:
+            logger.error(f"[缓存] 内存缓存写回磁盘失败: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+    def discard(self, key: str):
+        """从内存中移除 (不写回磁盘)"""
+        data = self._entries.pop(key, None)
+        self._paths.pop(key, None)
+        if data is not None:
+            self.size -= len(data)
+
+    def clear(self):
+        self._entries.clear()
+        self._paths.clear()
+        self._disk_hits.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        budget, _, _ = self._limits()
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "budget_bytes": budget,
+            "hits": self.hits,
+            "promotions": self.promotions,
+            "demotions": self.demotions,
+        }
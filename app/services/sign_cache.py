@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import config
+from app.core.logger import logger
+
+
+class SignCache:
+    """签名结果缓存
+
+    works_synth_sign 的请求只依赖带标签文本的 MD5 (synth_text_hash_code),
+    因此签名结果可按哈希复用,直到 time_stamp 推算出的有效期结束。
+    同一哈希的并发签名请求合并为一次上游调用。
+    """
+
+    def __init__(self):
+        # 哈希 -> (time_stamp, sign_text, 过期时间)
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _expires_at(time_stamp) -> float:
+        """根据签名时间戳计算本地过期时间 (兼容秒与毫秒时间戳)"""
+        settings = config.get_settings()
+        ttl = float(settings.get("sign_cache_ttl", 300))
+        try:
+            ts = float(time_stamp)
+            if ts > 1e12:
+                ts /= 1000
+        except (TypeError, ValueError):
+            ts = time.time()
+        # 以本地时间为上限,避免上游时钟偏差导致缓存过久
+        return min(ts, time.time()) + ttl
+
+    def get(self, txt_hash: str) -> Optional[Tuple[str, str]]:
+        """读取有效的签名,过期或不存在时返回 None"""
+        entry = self._entries.get(txt_hash)
+        if entry is None:
+            return None
+        time_stamp, sign_text, expires_at = entry
+        if time.time() >= expires_at:
+            del self._entries[txt_hash]
+            return None
+        self._entries.move_to_end(txt_hash)
+        return time_stamp, sign_text
+
+    def put(self, txt_hash: str, time_stamp, sign_text: str):
+        """写入签名结果"""
+        self._entries[txt_hash] = (time_stamp, sign_text, self._expires_at(time_stamp))
+        self._entries.move_to_end(txt_hash)
+        limit = int(config.get_settings().get("sign_cache_size", 10000))
+        while len(self._entries) > max(limit, 0):
+            self._entries.popitem(last=False)
+
+    def invalidate(self, txt_hash: str):
+        """作废签名 (如下载时被上游拒绝)"""
+        self._entries.pop(txt_hash, None)
+
+    async def get_or_fetch(self, txt_hash: str, fetch: Callable[[], Awaitable[Tuple[str, str]]]) -> Tuple[str, str]:
+        """读取签名,未命中时调用 fetch 获取;同一哈希同时只有一个上游请求
+
+        Args:
+            txt_hash: 带标签文本的 MD5
+            fetch: 返回 (time_stamp, sign_text) 的协程函数
+
+        Returns:
+            (time_stamp, sign_text)
+        """
+        cached = self.get(txt_hash)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self._inflight.get(txt_hash)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # 上游请求在独立任务中执行,单个调用方被取消不会影响其他等待者
+            task = asyncio.create_task(self._fetch(txt_hash, fetch))
+            self._inflight[txt_hash] = task
+            # 所有等待者都被取消时,避免出现 "exception was never retrieved" 警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _fetch(self, txt_hash: str, fetch: Callable[[], Awaitable[Tuple[str, str]]]) -> Tuple[str, str]:
+        try:
+            time_stamp, sign_text = await fetch()
+            self.put(txt_hash, time_stamp, sign_text)
+            return time_stamp, sign_text
+        finally:
+            self._inflight.pop(txt_hash, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class PreSigner:
+    """预签名管道
+
+    在文本真正需要下载之前(排队中、分段合成的后续片段等)提前获取签名,
+    使签名步骤离开关键路径。预签名失败只记录日志,真正请求时会再次尝试。
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            concurrency = int(config.get_settings().get("presign_concurrency", 4))
+            self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        return self._semaphore
+
+    def schedule(self, texts, voice_code: str, speed: int, volume: int, pitch: int = 50):
+        """为一组文本安排后台预签名 (立即返回)"""
+        for text in texts:
+            task = asyncio.create_task(self._presign(text, voice_code, speed, volume, pitch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _presign(self, text: str, voice_code: str, speed: int, volume: int, pitch: int):
+        async with self._get_semaphore():
+            try:
+                await self.service.get_audio_url(text, voice_code, speed, volume, pitch)
+            except Exception as e:
+                logger.debug(f"[签名缓存] 预签名失败,将在请求时重试: {e}")
+
+    async def close(self):
+        """取消尚未完成的预签名任务"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+import weakref
+from typing import Awaitable, Callable, Optional
+
+from app.core.logger import logger
+from app.core.tracing import span
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class InflightDownload:
+    """进行中的上游下载 (单飞合并)
+
+    同一缓存键的并发请求只触发一次上游签名和下载:
+    后台任务负责下载并写入临时文件,所有请求方都作为读者,
+    从正在增长的临时文件中按偏移读取已到达的数据,无需等待下载完成。
+    下载完成后临时文件重命名为缓存文件,已打开的读者不受影响。
+    """
+
+    # 读者每次在线程中读取的最大字节数
+    READ_SIZE = 65536
+
+    def __init__(self, cache_path: str, on_saved: Optional[Callable[["InflightDownload"], None]] = None,
+                 on_done: Optional[Callable[["InflightDownload"], None]] = None,
+                 admit: Optional[Callable[["InflightDownload"], bool]] = None):
+        """
+        Args:
+            cache_path: 最终缓存文件路径
+            on_saved: 缓存文件保存成功后的回调 (如登记索引、清理缓存)
+            admit: 下载完成、重命名之前的准入判断;返回 False 时不写入缓存,
+                数据保留在临时文件中供读者读取,不再被引用后删除
+            on_done: 下载结束(无论成功与否)后的回调 (如移出进行中列表)
+        """
+        self.cache_path = cache_path
+        self.temp_path = f"{cache_path}.{str(time.time())}.tmp"
+        self.size = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        # 未准入缓存 (数据只在临时文件中)
+        self.rejected = False
+        self._admit = admit
+        self._on_saved = on_saved
+        self._on_done = on_done
+        loop = asyncio.get_running_loop()
+        self._ready = loop.create_future()
+        self._waiter = loop.create_future()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, opener: Callable[[], Awaitable]):
+        """启动后台下载任务
+
+        Args:
+            opener: 返回上游流式响应的协程函数 (包含签名和下载请求)
+        """
+        self._task = asyncio.create_task(self._run(opener))
+
+    async def wait_ready(self):
+        """等待上游响应就绪;签名或下载请求失败时抛出对应异常"""
+        # shield: 单个请求方被取消不应取消共享的下载
+        await asyncio.shield(self._ready)
+
+    async def wait_done(self):
+        """等待下载结束 (成功或失败都返回,错误由读者读取时抛出)"""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    def _notify(self):
+        """唤醒所有等待新数据的读者"""
+        waiter = self._waiter
+        self._waiter = asyncio.get_running_loop().create_future()
+        if not waiter.done():
+            waiter.set_result(None)
+
+    async def _run(self, opener: Callable[[], Awaitable]):
+        resp = None
+        try:
+            try:
+                resp = await opener()
+                f = await asyncio.to_thread(open, self.temp_path, 'wb')
+            except BaseException as e:
+                self.error = e
+                if not self._ready.done():
+                    if isinstance(e, asyncio.CancelledError):
+                        self._ready.cancel()
+                    else:
+                        self._ready.set_exception(e)
+                        # 避免无人等待时出现 "exception was never retrieved" 警告
+                        self._ready.exception()
+                raise
+
+            self._ready.set_result(None)
+            try:
+                with f, span("cache.write", cache_key=os.path.basename(self.cache_path)) as write_span:
+                    async for chunk in resp.aiter_content(chunk_size=4096):
+                        if chunk:
+                            # 在线程中写入并刷新到文件 (不阻塞事件循环),使读者能读到已到达的数据
+                            await asyncio.to_thread(self._write, f, chunk)
+                            self.size += len(chunk)
+                            self._notify()
+                    if write_span is not None:
+                        write_span.set(bytes=self.size)
+
+                await asyncio.to_thread(self._save)
+            except BaseException as e:
+                self.error = e
+                if not isinstance(e, asyncio.CancelledError):
+                    logger.error(f"流式缓存出错: {e}")
+                await asyncio.to_thread(_remove_quietly, self.temp_path)
+                raise
+        except Exception:
+            # 错误已记录并传递给读者,后台任务本身不再抛出
+            pass
+        finally:
+            # 先标记结束再关闭响应,读者不必等待上游连接关闭
+            self.done = True
+            self._notify()
+            if self._on_done is not None:
+                self._on_done(self)
+            if resp is not None:
+                await resp.aclose()
+
+    def _save(self):
+        """下载完成后先做准入判断,准入后再重命名 (文件操作和回调会阻塞,在线程中执行)
+
+        重命名期间读者可能发现临时文件已不存在而 done 仍为 False,此时 _open_for_read 改为打开缓存文件。
+        """
+        if os.path.exists(self.cache_path):
+            os.remove(self.temp_path)
+        elif self._admit is not None and not self._admit(self):
+            # 正在读取和之后开始读取的读者都还需要这些数据,
+            # 临时文件在本对象不再被引用 (所有读者结束) 后删除
+            self.rejected = True
+            weakref.finalize(self, _remove_quietly, self.temp_path)
+        else:
+            os.replace(self.temp_path, self.cache_path)
+            logger.debug(f"[缓存] 已保存: {os.path.basename(self.cache_path)}")
+            if self._on_saved is not None:
+                self._on_saved(self)
+
+    @staticmethod
+    def _write(f, chunk: bytes):
+        f.write(chunk)
+        f.flush()
+
+    def _open_for_read(self):
+        """打开正在写入的临时文件;临时文件已不存在且没有出错时打开 (已重命名的) 缓存文件"""
+        try:
+            return open(self.temp_path, 'rb')
+        except FileNotFoundError:
+            if self.error is None and not self.rejected:
+                return open(self.cache_path, 'rb')
+            raise self.error
+
+    async def aiter_content(self, chunk_size=4096):
+        """以读者身份流式读取下载数据"""
+        await self.wait_ready()
+        self.readers += 1
+        try:
+            f = await asyncio.to_thread(self._open_for_read)
+            with f:
+                offset = 0
+                while True:
+                    if offset < self.size:
+                        # 在线程中读取 (一次最多读 READ_SIZE,再按 chunk_size 切分输出)
+                        data = await asyncio.to_thread(f.read, min(max(chunk_size, self.READ_SIZE), self.size - offset))
+                        if data:
+                            offset += len(data)
+                            for i in range(0, len(data), chunk_size):
+                                yield data[i:i + chunk_size]
+                            continue
+                    if self.done:
+                        if self.error is not None:
+                            raise self.error
+                        break
+                    await asyncio.shield(self._waiter)
+        finally:
+            self.readers -= 1
+
+    async def cancel(self):
+        """取消后台下载 (服务关闭时使用)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,135 @@
+"""
+增量文本流式合成
+
+客户端逐段推送文本 (如大模型逐 token 输出),句子完整时立即开始合成;
+各句并发签名、下载 (并发数受 long_text_concurrency 限制,排在后面的句子提前签名),
+音频按句子顺序输出,首句的音频无需等待整段文本生成完毕。
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Optional, Union
+
+from app.core.config import config
+from app.core.logger import logger
+from app.services.text_splitter import SentenceSegmenter
+from app.services.xf_service import xf_service
+
+
+async def _iter_audio(resp, chunk_size: int = 16384) -> AsyncIterator[bytes]:
+    """按块读取合成结果 (缓存文件在线程中读取,不阻塞事件循环)"""
+    if isinstance(resp, xf_service.FileStreamResponse):
+        data = await asyncio.to_thread(xf_service._read_file, resp.path)
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+        return
+    async for data in resp.aiter_content(chunk_size=chunk_size):
+        yield data
+
+
+class StreamSession:
+    """一次流式合成会话
+
+    push() 接收文本片段并调度已完成句子的合成;events() 按句子顺序产出
+    事件 (dict) 和音频数据 (bytes),finish() 之后输出完剩余句子即结束。
+    """
+
+    def __init__(self, voice_code: str, speed: int, volume: int, audio_type: str):
+        settings = config.get_settings()
+        self.args = (voice_code, speed, volume, 50, audio_type)
+        self.segmenter = SentenceSegmenter(int(settings.get("long_text_chunk_chars", 150)))
+        self.concurrency = max(1, int(settings.get("long_text_concurrency", 3)))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks = set()
+        # 已调度但尚未输出完毕的句子数
+        self._pending = 0
+        self.sentences = 0
+        self.characters = 0
+        self.first_text_at: Optional[float] = None
+        self.first_audio_ms: Optional[float] = None
+        self.finished = False
+
+    def push(self, text: str):
+        """追加文本片段,合成其中已完整的句子"""
+        if self.finished or not text:
+            return
+        if self.first_text_at is None:
+            self.first_text_at = time.time()
+        for sentence in self.segmenter.feed(text):
+            self._schedule(sentence)
+
+    def flush(self):
+        """把缓冲区中未完整的句子也立即合成"""
+        for sentence in self.segmenter.flush():
+            self._schedule(sentence)
+
+    def finish(self):
+        """文本输入结束: 合成剩余文本,输出完所有句子后 events() 结束"""
+        if self.finished:
+            return
+        self.flush()
+        self.finished = True
+        self._queue.put_nowait(None)
+
+    def notify(self, event: dict):
+        """插入一条事件 (如客户端消息格式错误),在已调度句子之后输出"""
+        self._queue.put_nowait(event)
+
+    def _schedule(self, sentence: str):
+        voice_code, speed, volume, pitch, audio_type = self.args
+        index = self.sentences
+        self.sentences += 1
+        self.characters += len(sentence)
+        # 前面没有待输出的句子时边下载边输出,否则在并发名额内下载完成再让出名额
+        wait_done = self._pending > 0
+        if self._pending >= self.concurrency and not xf_service._is_cached(sentence, voice_code, speed, volume, pitch, audio_type):
+            # 并发名额已满,提前签名,轮到该句时可直接下载
+            xf_service.presigner.schedule([sentence], voice_code, speed, volume, pitch)
+        self._pending += 1
+        task = asyncio.create_task(
+            xf_service.synth_segment(sentence, voice_code, speed, volume, pitch, audio_type, self._semaphore, wait_done)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._queue.put_nowait((index, sentence, task))
+
+    async def events(self) -> AsyncIterator[Union[dict, bytes]]:
+        """按句子顺序产出事件和音频数据
+
+        每句依次为 sentence_start 事件、若干音频数据、sentence_end 事件;
+        单句合成失败时产出 error 事件并继续下一句。
+        """
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, dict):
+                yield item
+                continue
+            index, sentence, task = item
+            yield {"type": "sentence_start", "index": index, "text": sentence}
+            size = 0
+            try:
+                resp = await task
+                async for data in _iter_audio(resp):
+                    if self.first_audio_ms is None:
+                        self.first_audio_ms = round((time.time() - self.first_text_at) * 1000)
+                    size += len(data)
+                    yield data
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[流式] 第 {index} 句合成失败: {e}")
+                yield {"type": "error", "index": index, "message": str(e)}
+                continue
+            finally:
+                self._pending -= 1
+            yield {"type": "sentence_end", "index": index, "bytes": size}
+
+    async def close(self):
+        """取消尚未完成的句子 (已开始的下载仍会在后台写入缓存)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
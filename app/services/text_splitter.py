@@ -0,0 +1,113 @@
+import re
+from typing import List
+
+# 句末标点 (优先在此处切分)
+SENTENCE_END = "。！？!?；;…\n"
+# 句内停顿标点 (句子过长时在此处切分)
+CLAUSE_END = "，,、：:"
+
+_SENTENCE_RE = re.compile(f"[^{re.escape(SENTENCE_END)}]*[{re.escape(SENTENCE_END)}]+|[^{re.escape(SENTENCE_END)}]+$")
+_CLAUSE_RE = re.compile(f"[^{re.escape(CLAUSE_END)}]*[{re.escape(CLAUSE_END)}]+|[^{re.escape(CLAUSE_END)}]+$")
+
+
+def _split_by(pattern: re.Pattern, text: str) -> List[str]:
+    return [m.group(0) for m in pattern.finditer(text) if m.group(0)]
+
+
+def split_sentences(text: str) -> List[str]:
+    """按句末标点切分文本,标点保留在句子末尾"""
+    return _split_by(_SENTENCE_RE, text)
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """将长文本切分为不超过 max_chars 的片段
+
+    优先在句末标点处切分,并把相邻的短句合并到同一片段;
+    单句过长时在逗号等停顿处切分,仍过长时按长度硬切。
+
+    Args:
+        text: 原始文本
+        max_chars: 每个片段的最大字符数
+
+    Returns:
+        片段列表 (空白片段会被丢弃)
+    """
+    max_chars = max(1, max_chars)
+    pieces: List[str] = []
+    for sentence in split_sentences(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _split_by(_CLAUSE_RE, sentence):
+            while len(clause) > max_chars:
+                pieces.append(clause[:max_chars])
+                clause = clause[max_chars:]
+            if clause:
+                pieces.append(clause)
+
+    # 合并相邻的短片段,减少上游请求数
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        # 只有标点的片段始终并入前一片段,避免上游收到无法发音的内容
+        only_punct = all(ch in SENTENCE_END or ch in CLAUSE_END or ch.isspace() for ch in piece)
+        if current and not only_punct and len(current) + len(piece) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+# 可以跟在句末标点之后、仍属于同一句的字符 (引号、括号)
+_CLOSING = "”’」』）》】)\"'"
+
+
+def _pronounceable(text: str) -> bool:
+    return not all(ch in SENTENCE_END or ch in CLAUSE_END or ch in _CLOSING or ch.isspace() for ch in text)
+
+
+class SentenceSegmenter:
+    """增量切句: 逐段接收文本 (如大模型逐 token 输出),句子完整时立即产出
+
+    句末标点之后出现了其他字符才认为句子结束 (后续片段可能还会补上 "！？" 或引号);
+    英文句点后跟空白时也视为句末。超过 max_chars 仍未结束的句子在停顿标点处切出。
+    """
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max(1, max_chars)
+        self._buffer = ""
+
+    def _find_end(self) -> int:
+        """缓冲区中第一个完整句子的结束位置,没有完整句子时返回 -1"""
+        buffer = self._buffer
+        for i, ch in enumerate(buffer):
+            if ch in SENTENCE_END or (ch == "." and i + 1 < len(buffer) and buffer[i + 1].isspace()):
+                end = i + 1
+                while end < len(buffer) and (buffer[end] in SENTENCE_END or buffer[end] in _CLOSING or buffer[end] == "."):
+                    end += 1
+                return end if end < len(buffer) else -1
+        return -1
+
+    def feed(self, text: str) -> List[str]:
+        """追加文本,返回新完成的句子"""
+        self._buffer += text
+        sentences = []
+        end = self._find_end()
+        while end >= 0:
+            sentences.append(self._buffer[:end])
+            self._buffer = self._buffer[end:]
+            end = self._find_end()
+        while len(self._buffer) > self.max_chars:
+            head = self._buffer[:self.max_chars]
+            cut = max(head.rfind(ch) for ch in CLAUSE_END) + 1 or self.max_chars
+            sentences.append(self._buffer[:cut])
+            self._buffer = self._buffer[cut:]
+        return [s.strip() for s in sentences if _pronounceable(s)]
+
+    def flush(self) -> List[str]:
+        """取出缓冲区中剩余的文本 (不完整的句子)"""
+        rest, self._buffer = self._buffer, ""
+        return [rest.strip()] if _pronounceable(rest) else []
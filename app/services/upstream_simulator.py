@@ -0,0 +1,252 @@
+"""
+上游接口本地模拟
+
+模拟讯飞配音的签名接口 (works_synth_sign) 和音频接口 (/synth),加解密与
+XFService._encrypt/_decrypt 使用同一套 AES-ECB 协议,音频接口返回静音 MP3 数据。
+延迟分布、错误率和限流均可配置,用于在不访问真实上游的情况下压测本服务:
+
+    python -m app.services.upstream_simulator --port 9100
+    python -m app.services.upstream_simulator --sign-latency lognormal:80:0.5 --synth-latency uniform:200:1500 \\
+        --error-rate 0.02 --rate-limit 50 --max-concurrency 20
+
+然后在 settings.yaml 中设置 upstream_base_url: http://127.0.0.1:9100,
+用 python -m app.services.benchmark 发起压测。GET /__stats 返回模拟服务的请求统计。
+
+延迟分布写法 (单位毫秒): 200 / const:200 / uniform:100:500 / normal:300:50 /
+lognormal:中位数:sigma / exp:均值
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+from typing import List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.services.xf_service import XFService, xf_service
+
+# 签名使用的密钥 (只在模拟服务内部校验签名与文本是否匹配)
+SIGN_SECRET = "xfapi-simulator"
+
+# 静音 MP3 帧: MPEG-1 Layer III, 32kbps, 32kHz, 单声道,每帧 144 字节、36 毫秒
+MP3_FRAME = bytes([0xFF, 0xFB, 0x18, 0xC4]) + bytes(140)
+# 每个字约 0.25 秒语音
+FRAMES_PER_CHAR = 7
+
+
+class LatencyDistribution:
+    """延迟分布,sample() 返回秒数"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        name, _, rest = spec.partition(":")
+        if not rest:
+            name, rest = "const", spec
+        try:
+            args = [float(x) / 1000 for x in rest.split(":")]
+        except ValueError:
+            raise ValueError(f"无效的延迟分布: {spec}")
+        expected = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if name not in expected or len(args) != expected[name]:
+            raise ValueError(f"无效的延迟分布: {spec}")
+        if name == "lognormal":
+            # 第二个参数是 sigma,不是毫秒
+            args[1] *= 1000
+        self.name = name
+        self.args = args
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.args
+        if self.name == "const":
+            value = a[0]
+        elif self.name == "uniform":
+            value = rng.uniform(a[0], a[1])
+        elif self.name == "normal":
+            value = rng.gauss(a[0], a[1])
+        elif self.name == "lognormal":
+            value = a[0] * rng.lognormvariate(0, a[1])
+        else:
+            value = rng.expovariate(1 / a[0]) if a[0] > 0 else 0
+        return max(0.0, value)
+
+    def __str__(self):
+        return self.spec
+
+
+class TokenBucket:
+    """令牌桶限流 (rate 为每秒请求数,0 表示不限)"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def acquire(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def _sign(txt_hash: str, ts: str) -> str:
+    return hashlib.md5(f"{txt_hash}:{ts}:{SIGN_SECRET}".encode("utf-8")).hexdigest()
+
+
+def silent_mp3(chars: int) -> bytes:
+    """按文本长度生成静音 MP3 数据"""
+    return MP3_FRAME * max(10, chars * FRAMES_PER_CHAR)
+
+
+class _AudioResponse(StreamingResponse):
+    """音频流响应,发送结束 (包括客户端提前断开) 后释放并发名额"""
+
+    def __init__(self, content, release):
+        super().__init__(content, media_type="audio/mpeg")
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+class UpstreamSimulator:
+    """上游模拟服务
+
+    Args:
+        sign_latency: 签名接口的响应延迟分布
+        synth_latency: 音频接口的首包延迟分布
+        error_rate: 两个接口返回 500 的概率
+        sign_error_rate: 签名接口额外返回格式错误响应的概率
+        rate_limit: 每秒请求数上限 (两个接口合计),超出返回 429
+        max_concurrency: 同时进行的音频下载上限,超出返回 503
+        bandwidth: 每个音频下载的速率 (KB/s),0 表示不限
+        seed: 随机数种子
+    """
+
+    def __init__(self, sign_latency: str = "50", synth_latency: str = "200", error_rate: float = 0.0,
+                 sign_error_rate: float = 0.0, rate_limit: float = 0.0, max_concurrency: int = 0,
+                 bandwidth: float = 0.0, seed: Optional[int] = None):
+        self.sign_latency = LatencyDistribution(sign_latency)
+        self.synth_latency = LatencyDistribution(synth_latency)
+        self.error_rate = error_rate
+        self.sign_error_rate = sign_error_rate
+        self.bucket = TokenBucket(rate_limit)
+        self.max_concurrency = max_concurrency
+        self.bandwidth = bandwidth
+        self.rng = random.Random(seed)
+        self.active = 0
+        self.stats = {
+            "sign_requests": 0,
+            "synth_requests": 0,
+            "errors": 0,
+            "throttled": 0,
+            "rejected_signs": 0,
+            "bytes_sent": 0,
+            "peak_concurrency": 0,
+        }
+
+    def _fail(self, status: int, message: str, key: str = "errors") -> Response:
+        self.stats[key] += 1
+        return JSONResponse({"code": status, "message": message}, status_code=status)
+
+    async def sign(self, request: Request) -> Response:
+        self.stats["sign_requests"] += 1
+        if not self.bucket.acquire():
+            return self._fail(429, "too many requests", "throttled")
+        await asyncio.sleep(self.sign_latency.sample(self.rng))
+        if self.rng.random() < self.error_rate:
+            return self._fail(500, "internal error")
+        try:
+            body = await request.json()
+            txt_hash = xf_service._decrypt(body["req"])["synth_text_hash_code"]
+        except Exception:
+            return self._fail(400, "bad request")
+        if self.rng.random() < self.sign_error_rate:
+            self.stats["errors"] += 1
+            return JSONResponse({"code": 0, "message": "ok"})
+        ts = str(int(time.time() * 1000))
+        return JSONResponse({"body": xf_service._encrypt({"time_stamp": ts, "sign_text": _sign(txt_hash, ts)})})
+
+    async def synth(self, request: Request) -> Response:
+        self.stats["synth_requests"] += 1
+        params = request.query_params
+        content = params.get("content", "")
+        txt_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
+        if params.get("sign") != _sign(txt_hash, params.get("ts", "")):
+            return self._fail(403, "invalid sign", "rejected_signs")
+        if not self.bucket.acquire():
+            return self._fail(429, "too many requests", "throttled")
+        if self.max_concurrency and self.active >= self.max_concurrency:
+            return self._fail(503, "server busy", "throttled")
+        self.active += 1
+        self.stats["peak_concurrency"] = max(self.stats["peak_concurrency"], self.active)
+        try:
+            await asyncio.sleep(self.synth_latency.sample(self.rng))
+            if self.rng.random() < self.error_rate:
+                self.active -= 1
+                return self._fail(500, "internal error")
+        except BaseException:
+            self.active -= 1
+            raise
+        return _AudioResponse(self._stream(silent_mp3(len(content))), self._release)
+
+    def _release(self):
+        self.active -= 1
+
+    async def _stream(self, data: bytes, chunk_size: int = 16384):
+        for i in range(0, len(data), chunk_size):
+            chunk = data[i:i + chunk_size]
+            if self.bandwidth > 0:
+                await asyncio.sleep(len(chunk) / (self.bandwidth * 1024))
+            self.stats["bytes_sent"] += len(chunk)
+            yield chunk
+
+    def create_app(self) -> FastAPI:
+        app = FastAPI(title="XFAPI upstream simulator")
+        app.add_api_route(XFService.SIGN_PATH, self.sign, methods=["POST"])
+        app.add_api_route(XFService.SYNTH_PATH, self.synth, methods=["GET"])
+        app.add_api_route("/__stats", lambda: dict(self.stats, active=self.active), methods=["GET"])
+        return app
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="讯飞配音上游接口的本地模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--sign-latency", default="50", help="签名接口延迟分布 (毫秒)")
+    parser.add_argument("--synth-latency", default="200", help="音频接口首包延迟分布 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--sign-error-rate", type=float, default=0.0, help="签名接口返回格式错误响应的概率")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="每秒请求数上限,0 表示不限")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="同时下载数上限,0 表示不限")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="每个下载的速率 (KB/s),0 表示不限")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    try:
+        simulator = UpstreamSimulator(
+            args.sign_latency, args.synth_latency, args.error_rate, args.sign_error_rate,
+            args.rate_limit, args.max_concurrency, args.bandwidth, args.seed,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"上游模拟服务: http://{args.host}:{args.port} (签名延迟 {simulator.sign_latency}ms, "
+          f"首包延迟 {simulator.synth_latency}ms, 错误率 {args.error_rate:.1%})")
+    uvicorn.run(simulator.create_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
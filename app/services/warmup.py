@@ -0,0 +1,395 @@
+"""
+缓存预热模块
+
+从 data/warmup/ 下的短语清单中读取预知会被请求的文本 (IVR 提示音、广播通知等),
+在启动时和/或每天的固定时间通过 XFService 预先合成,已缓存的条目直接跳过。
+预热以低并发运行,并且只在上游并发名额空闲、熔断器关闭时才发起请求,不与实时请求争抢。
+
+清单格式 (YAML / JSON,文件名任意):
+
+    defaults:            # 可选,清单内条目的默认参数
+      voice: 聆小糖
+      format: mp3
+    phrases:
+      - 您好,欢迎致电
+      - text: 请按 1 查询余额
+        speed: 110
+        volume: 100
+
+也可以直接是条目列表;.txt 文件每行一条文本,使用默认参数。
+"""
+
+import asyncio
+import datetime
+import glob
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from app.core.config import config
+from app.core.logger import logger
+from app.services.xf_service import xf_service
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台不做跨进程互斥
+    fcntl = None
+
+
+class WarmupPhrase:
+    """预热清单中的一条 (参数已解析为上游使用的发音人代码和默认值)"""
+
+    def __init__(self, text: str, voice_code: str, speed: int, volume: int, audio_type: str, source: str):
+        self.text = text
+        self.voice_code = voice_code
+        self.speed = speed
+        self.volume = volume
+        self.audio_type = audio_type
+        self.source = source
+
+    @property
+    def cache_key(self) -> str:
+        return xf_service._get_cache_key(self.text, self.voice_code, self.speed, self.volume, 50, self.audio_type)
+
+    def is_cached(self) -> bool:
+        return xf_service._is_cached(self.text, self.voice_code, self.speed, self.volume, 50, self.audio_type)
+
+    def upstream_requests(self) -> int:
+        """合成所需的上游请求数 (每段文本一次签名 + 一次下载)"""
+        chunks = xf_service._split_long_text(self.text, self.audio_type)
+        return 2 * (len(chunks) if chunks else 1)
+
+
+def _read_manifest(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".txt"):
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        if path.endswith(".json"):
+            return json.load(f)
+        return yaml.safe_load(f)
+
+
+def load_manifests(directory: str) -> Tuple[List[WarmupPhrase], List[str]]:
+    """读取目录下的全部预热清单,按缓存键去重
+
+    Returns:
+        (短语列表, 无效条目的说明)
+    """
+    settings = config.get_settings()
+    base = {
+        "voice": settings.get("default_speaker", "聪小糖"),
+        "speed": settings.get("default_speed", 100),
+        "volume": settings.get("default_volume", 100),
+        "format": settings.get("default_audio_type", "audio/mp3"),
+    }
+    phrases: List[WarmupPhrase] = []
+    errors: List[str] = []
+    seen = set()
+
+    paths = sorted(
+        path for pattern in ("*.yaml", "*.yml", "*.json", "*.txt")
+        for path in glob.glob(os.path.join(directory, pattern))
+    )
+    for path in paths:
+        name = os.path.basename(path)
+        try:
+            content = _read_manifest(path)
+        except Exception as e:
+            errors.append(f"{name}: 读取失败 ({e})")
+            continue
+
+        defaults = dict(base)
+        if isinstance(content, dict):
+            defaults.update(content.get("defaults") or {})
+            content = content.get("phrases")
+        if not isinstance(content, list):
+            errors.append(f"{name}: 缺少短语列表")
+            continue
+
+        for index, entry in enumerate(content, 1):
+            if isinstance(entry, str):
+                entry = {"text": entry}
+            if not isinstance(entry, dict) or not str(entry.get("text") or "").strip():
+                errors.append(f"{name}: 第 {index} 条缺少 text")
+                continue
+            params = dict(defaults, **entry)
+            audio_type = str(params.get("audio_type") or params["format"])
+            if "/" not in audio_type:
+                audio_type = f"audio/{audio_type}"
+            try:
+                phrase = WarmupPhrase(
+                    str(params["text"]).strip(),
+                    config.resolve_voice(str(params["voice"])),
+                    int(params["speed"]),
+                    int(params["volume"]),
+                    audio_type,
+                    name,
+                )
+            except (TypeError, ValueError) as e:
+                errors.append(f"{name}: 第 {index} 条参数无效 ({e})")
+                continue
+            key = phrase.cache_key
+            if key not in seen:
+                seen.add(key)
+                phrases.append(phrase)
+    return phrases, errors
+
+
+class WarmupService:
+    """缓存预热: 启动时和每天固定时间按清单预先合成音频
+
+    多个 worker 进程共享磁盘缓存,通过 data/warmup.lock 文件锁保证同一时间只有一个进程在预热。
+    """
+
+    MANIFEST_DIR = "data/warmup"
+    LOCK_PATH = "data/warmup.lock"
+    # 上游繁忙或熔断时让路的检查间隔(秒)
+    IDLE_CHECK_INTERVAL = 0.5
+    # 定时任务重新读取设置的间隔(秒),修改 warmup_time 后最迟在这个时间内生效
+    SCHEDULE_CHECK_INTERVAL = 60
+    # 保留的失败条目数量
+    MAX_ERRORS = 20
+
+    def __init__(self):
+        self.run: Optional[dict] = None
+        self.next_run: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """启动定时任务,按设置在启动时执行一次预热 (应用启动时调用)"""
+        self._scheduler = asyncio.create_task(self._schedule_loop())
+        if config.get_settings().get("warmup_on_startup", True) and os.path.isdir(self.MANIFEST_DIR):
+            self.trigger("startup")
+
+    def trigger(self, reason: str = "manual") -> dict:
+        """开始一次预热,已有预热在进行时抛出 RuntimeError"""
+        if self.running:
+            raise RuntimeError("预热正在进行中")
+        self.run = {
+            "state": "starting",
+            "trigger": reason,
+            "started": time.time(),
+            "finished": None,
+            "total": 0,
+            "cached": 0,
+            "pending": 0,
+            "generated": 0,
+            "failed": 0,
+            "characters": 0,
+            "characters_done": 0,
+            "upstream_requests": 0,
+            "upstream_requests_done": 0,
+            "paused_seconds": 0.0,
+            "manifest_errors": [],
+            "errors": [],
+        }
+        self._task = asyncio.create_task(self._run(self.run))
+        return self.run
+
+    async def cancel(self) -> bool:
+        """取消进行中的预热,返回是否有预热被取消"""
+        if not self.running:
+            return False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return True
+
+    @staticmethod
+    def _next_run_time(after: float) -> Optional[float]:
+        """warmup_time (HH:MM,本地时间) 在 after 之后的下一次时间,未设置时返回 None"""
+        value = str(config.get_settings().get("warmup_time") or "").strip()
+        if not value:
+            return None
+        try:
+            hour, minute = (int(part) for part in value.split(":", 1))
+            at = datetime.time(hour, minute)
+        except ValueError:
+            logger.warning(f"[预热] warmup_time 格式无效: {value} (应为 HH:MM)")
+            return None
+        base = datetime.datetime.fromtimestamp(after)
+        target = datetime.datetime.combine(base.date(), at)
+        if target.timestamp() <= after:
+            target += datetime.timedelta(days=1)
+        return target.timestamp()
+
+    async def _schedule_loop(self):
+        last_target = 0.0
+        while True:
+            try:
+                self.next_run = self._next_run_time(max(time.time(), last_target + 1))
+                if self.next_run is None:
+                    await asyncio.sleep(self.SCHEDULE_CHECK_INTERVAL)
+                    continue
+                wait = self.next_run - time.time()
+                if wait > self.SCHEDULE_CHECK_INTERVAL:
+                    # 分段等待,期间修改的设置可以及时生效
+                    await asyncio.sleep(self.SCHEDULE_CHECK_INTERVAL)
+                    continue
+                await asyncio.sleep(max(0.0, wait))
+                last_target = self.next_run
+                if self.running:
+                    logger.info("[预热] 上一次预热尚未结束,跳过本次定时预热")
+                else:
+                    self.trigger("schedule")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[预热] 定时任务出错: {e}")
+                await asyncio.sleep(self.SCHEDULE_CHECK_INTERVAL)
+
+    def _try_lock(self):
+        """获取跨进程预热锁,已被其他进程持有时返回 None"""
+        os.makedirs(os.path.dirname(self.LOCK_PATH), exist_ok=True)
+        f = open(self.LOCK_PATH, "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return None
+        return f
+
+    @staticmethod
+    def _upstream_idle() -> bool:
+        """上游有空闲名额且熔断器放行
+
+        熔断器只在 before_call 中从打开转为半开,没有实时请求时由预热请求充当探测请求,
+        否则一次熔断后预热会一直等待。
+        """
+        return (
+            xf_service.sign_limiter.has_headroom()
+            and xf_service.synth_limiter.has_headroom()
+            and xf_service.sign_breaker.available()
+            and xf_service.synth_breaker.available()
+        )
+
+    async def _wait_for_idle(self, run: dict):
+        """上游繁忙时等待,让实时请求优先"""
+        while not self._upstream_idle():
+            await asyncio.sleep(self.IDLE_CHECK_INTERVAL)
+            run["paused_seconds"] += self.IDLE_CHECK_INTERVAL
+
+    @staticmethod
+    def plan(phrases: List[WarmupPhrase]) -> Tuple[List[WarmupPhrase], dict]:
+        """检查哪些短语尚未缓存,估算生成它们的上游开销 (会访问文件系统,应在线程中调用)"""
+        pending = [phrase for phrase in phrases if not phrase.is_cached()]
+        upstream_requests = sum(phrase.upstream_requests() for phrase in pending)
+        sign_latency = xf_service.sign_limiter.stats()["baseline_latency_ms"]
+        synth_latency = xf_service.synth_limiter.stats()["baseline_latency_ms"]
+        estimated_seconds = None
+        if sign_latency is not None and synth_latency is not None:
+            concurrency = max(1, int(config.get_settings().get("warmup_concurrency", 1)))
+            per_request = (sign_latency + synth_latency) / 2 / 1000
+            estimated_seconds = round(upstream_requests * per_request / concurrency, 1)
+        return pending, {
+            "total": len(phrases),
+            "cached": len(phrases) - len(pending),
+            "pending": len(pending),
+            "characters": sum(len(phrase.text) for phrase in pending),
+            "upstream_requests": upstream_requests,
+            "estimated_seconds": estimated_seconds,
+        }
+
+    async def _warm(self, phrase: WarmupPhrase, run: dict):
+        await self._wait_for_idle(run)
+        if phrase.is_cached():
+            # 等待期间已被实时请求合成
+            run["cached"] += 1
+            run["pending"] -= 1
+            return
+        requests = phrase.upstream_requests()
+        try:
+            await xf_service.ensure_cached(phrase.text, phrase.voice_code, phrase.speed, phrase.volume,
+                                           audio_type=phrase.audio_type)
+            run["generated"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            run["failed"] += 1
+            if len(run["errors"]) < self.MAX_ERRORS:
+                run["errors"].append({"source": phrase.source, "text": phrase.text[:50], "error": str(e)})
+            logger.warning(f"[预热] 合成失败 ({phrase.source}): {e}")
+        run["pending"] -= 1
+        run["characters_done"] += len(phrase.text)
+        run["upstream_requests_done"] += requests
+
+    async def _run(self, run: dict):
+        lock = await asyncio.to_thread(self._try_lock)
+        if lock is None:
+            run.update(state="skipped", finished=time.time())
+            logger.info("[预热] 其他进程正在预热,跳过")
+            return
+        try:
+            phrases, errors = await asyncio.to_thread(load_manifests, self.MANIFEST_DIR)
+            for error in errors:
+                logger.warning(f"[预热] 清单条目无效: {error}")
+            pending, estimate = await asyncio.to_thread(self.plan, phrases)
+            run.update(estimate, state="running", manifest_errors=errors[:self.MAX_ERRORS])
+            if not pending:
+                run.update(state="done", finished=time.time())
+                logger.info(f"[预热] {len(phrases)} 条短语均已缓存")
+                return
+
+            cache_limit = int(config.get_settings().get("cache_limit", 100))
+            if 0 < cache_limit < len(phrases):
+                logger.warning(f"[预热] 短语数 ({len(phrases)}) 超过缓存文件数上限 ({cache_limit}),部分预热结果会被淘汰")
+            logger.info(
+                f"[预热] 开始预热: 共 {len(phrases)} 条, 待生成 {len(pending)} 条, "
+                f"{estimate['characters']} 字, 约 {estimate['upstream_requests']} 次上游请求"
+            )
+
+            queue = iter(pending)
+
+            async def worker():
+                for phrase in queue:
+                    await self._warm(phrase, run)
+
+            concurrency = max(1, int(config.get_settings().get("warmup_concurrency", 1)))
+            await asyncio.gather(*(worker() for _ in range(min(concurrency, len(pending)))))
+            run.update(state="done", finished=time.time())
+            logger.info(
+                f"[预热] 完成: 生成 {run['generated']} 条, 失败 {run['failed']} 条, "
+                f"耗时 {run['finished'] - run['started']:.1f}s"
+            )
+        except asyncio.CancelledError:
+            run.update(state="cancelled", finished=time.time())
+            logger.info("[预热] 已取消")
+            raise
+        except Exception as e:
+            run.update(state="failed", finished=time.time())
+            run["errors"].append({"source": None, "text": None, "error": str(e)})
+            logger.error(f"[预热] 预热出错: {e}")
+        finally:
+            lock.close()
+
+    async def status(self) -> dict:
+        """最近一次预热的进度,以及按当前清单和缓存状态估算的待生成开销"""
+        phrases, errors = await asyncio.to_thread(load_manifests, self.MANIFEST_DIR)
+        _, estimate = await asyncio.to_thread(self.plan, phrases)
+        estimate["manifest_errors"] = errors[:self.MAX_ERRORS]
+        return {
+            "running": self.running,
+            "run": self.run,
+            "next_run": self.next_run,
+            "plan": estimate,
+        }
+
+    async def close(self):
+        """停止定时任务和进行中的预热"""
+        tasks = [task for task in (self._scheduler, self._task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._scheduler = None
+        self._task = None
+
+
+warmup_service = WarmupService()
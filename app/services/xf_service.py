@@ -1,22 +1,39 @@
 import json
 import base64
 import hashlib
+import re
 import asyncio
 import time
-import random
+from contextlib import asynccontextmanager
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
+from typing import Optional
 from urllib.parse import quote
 from app.core.config import config
 from app.core.logger import logger
 from app.core.disguise import DisguiseClient
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.concurrency import AdaptiveLimiter, LatencyWindow, LimiterPermit, outcome
+from app.core.metrics import (CACHE_HITS, CACHE_MISSES, DOWNLOAD_TTFB_SECONDS, SIGN_SECONDS, SYNTH_TOTAL_SECONDS,
+                              audio_format, voice_label)
+from app.core.tracing import add_event, set_attributes, span
+from app.core.retry import RetryBudget, RetryPolicy, UpstreamResponseError, is_retryable, retry_call
+from app.services.sign_cache import PreSigner, SignCache
+from app.services.single_flight import InflightDownload
+from app.services.memory_cache import MemoryCache
+from app.services.cache_store import CacheStore
+from app.services.text_splitter import split_text
+from app.services.canonical import CanonicalStats, normalize_text, raw_fingerprint
 
 import os
+import weakref
 
 class XFService:
     AES_KEY = b'G%.g7"Y&Nf^40Ee<'
-    SIGN_URL = "https://peiyin.xunfei.cn/web-server/1.0/works_synth_sign"
-    SYNTH_URL_BASE = "https://peiyin.xunfei.cn/synth"
+    # 上游地址 (设置 upstream_base_url 可改为本地模拟服务,用于压测)
+    UPSTREAM_BASE_URL = "https://peiyin.xunfei.cn"
+    SIGN_PATH = "/web-server/1.0/works_synth_sign"
+    SYNTH_PATH = "/synth"
     CACHE_DIR = "data/cache"
     
     SPECIAL_SYMBOLS_MAP = {
@@ -29,69 +46,225 @@ class XFService:
         "'": '单引号', '?': '问号', '!': '感叹号'
     }
 
+    # 各阶段默认的单次尝试超时与整体截止时间(秒)
+    # 音频流请求在收到响应头后即返回,超时只覆盖建立连接和等待首包
+    RETRY_TIMEOUTS = {
+        "sign": (15, 45),
+        "synth": (120, 180),
+    }
+
+    # 计算对冲阈值所需的最少样本数
+    HEDGE_MIN_SAMPLES = 20
+
     def __init__(self):
         if not os.path.exists(self.CACHE_DIR):
             os.makedirs(self.CACHE_DIR)
+        
+        # 各阶段独立的重试预算,避免一个阶段的故障耗尽另一个阶段的预算
+        budget_ratio = config.get_settings().get("retry_budget_ratio", 0.2)
+        self.sign_retry_budget = RetryBudget(ratio=budget_ratio)
+        self.synth_retry_budget = RetryBudget(ratio=budget_ratio)
+        
+        # 签名和下载两个阶段各自的自适应并发上限
+        self.sign_limiter = AdaptiveLimiter("签名")
+        self.synth_limiter = AdaptiveLimiter("下载")
+        
+        # 熔断器: 上游错误率过高时快速失败,不再进入完整的重试循环
+        self.sign_breaker = CircuitBreaker("签名接口")
+        self.synth_breaker = CircuitBreaker("音频下载")
+        
+        # 近期下载首包耗时,用于计算对冲请求的触发阈值
+        self.synth_latency = LatencyWindow()
+        self.hedges = 0
+        self.hedge_wins = 0
+        
+        # 签名缓存与预签名管道
+        self.sign_cache = SignCache()
+        self.presigner = PreSigner(self)
+        
+        # 带索引的磁盘缓存与内存热点缓存
+        self.cache_store = CacheStore(self.CACHE_DIR)
+        self.memory_cache = MemoryCache()
+        self.memory_cache.on_demote = lambda key, size: self.cache_store.add(key, size, force=True)
+        # 缓存键规范化带来的额外命中统计
+        self.canonical_stats = CanonicalStats()
+        
+        # 进行中的上游下载 (缓存键 -> InflightDownload)
+        self._inflight = {}
+        # 离线任务需要的缓存键及其等待数 (跳过准入判断,保证结果可被下载)
+        self._required_keys = {}
 
-    def _get_cache_key(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str) -> str:
-        """生成缓存键"""
-        raw = f"{text}_{voice_code}_{speed}_{volume}_{pitch}_{audio_type}"
-        return hashlib.md5(raw.encode('utf-8')).hexdigest() + ("." + audio_type.split('/')[-1] if '/' in audio_type else ".mp3")
-
-    def _clean_cache(self):
-        """清理超出限制的缓存文件"""
-        limit = config.get_settings().get("cache_limit", 100)
-        if limit <= 0:
-            return
+    def _retry_policy(self, stage: str) -> RetryPolicy:
+        """根据当前设置构建指定阶段的重试策略"""
+        settings = config.get_settings()
+        attempt_timeout, deadline = self.RETRY_TIMEOUTS[stage]
+        return RetryPolicy(
+            max_attempts=settings.get("retry_max_attempts", 5),
+            base_delay=settings.get("retry_base_delay", 1.0),
+            max_delay=settings.get("retry_max_delay", 8.0),
+            attempt_timeout=attempt_timeout,
+            deadline=deadline,
+        )
 
-        if not os.path.exists(self.CACHE_DIR):
-            os.makedirs(self.CACHE_DIR)
-            return
+    # 缓存键格式: 32位MD5 + 扩展名,用于校验外部传入的缓存键
+    CACHE_KEY_PATTERN = re.compile(r"^[0-9a-f]{32}\.[a-z0-9]+$")
 
-        files = [os.path.join(self.CACHE_DIR, f) for f in os.listdir(self.CACHE_DIR)]
-        files = [f for f in files if os.path.isfile(f)]
+    def _get_cache_key(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str) -> str:
+        """生成缓存键
         
-        if len(files) > limit:
-            files.sort(key=os.path.getmtime)
-            for f in files[:len(files) - limit]:
-                try:
-                    os.remove(f)
-                except Exception as e:
-                    logger.error(f"清理缓存文件 {f} 时出错: {e}")
+        基于上游实际收到的参数 (规范化并加标签后的文本、映射后的语速音量) 计算,
+        上游听起来相同的请求共用一条缓存。
+        """
+        params = self._prepare_synth_params(text, voice_code, speed, volume, pitch)
+        raw = f"{params['vid']}_{params['final_speed']}_{params['final_volume']}_{params['tagged_text']}"
+        ext = audio_type.split('/')[-1] if '/' in audio_type else "mp3"
+        if ext == "mpeg":
+            ext = "mp3"
+        return hashlib.md5(raw.encode('utf-8')).hexdigest() + "." + ext
 
-    class CachedStreamResponse:
-        def __init__(self, response, cache_path, service):
+    class UpstreamStreamResponse:
+        """上游音频流包装,读取完毕或中断后释放连接回连接池"""
+        def __init__(self, response):
             self.response = response
-            self.cache_path = cache_path
-            self.service = service
+
+        async def aiter_content(self, chunk_size=4096):
+            try:
+                async for chunk in self.response.aiter_content(chunk_size=chunk_size):
+                    if chunk:
+                        yield chunk
+            finally:
+                await self.response.aclose()
+
+    class FileStreamResponse:
+        """磁盘缓存文件响应 (接口层直接以文件响应发送,支持 Range)"""
+        def __init__(self, path, cache_key=None):
+            self.path = path
+            self.cache_key = cache_key
 
         def iter_content(self, chunk_size=4096):
-            # 使用临时文件避免写入未完成的文件被读取
-            temp_path = f"{self.cache_path}.{str(time.time())}.tmp"
+            with open(self.path, 'rb') as f:
+                while True:
+                    data = f.read(chunk_size)
+                    if not data:
+                        break
+                    yield data
+
+    class MemoryStreamResponse:
+        """内存缓存响应,整段数据一次发送"""
+        def __init__(self, data: bytes, cache_key=None, path=None):
+            self.data = data
+            self.cache_key = cache_key
+            # 对应的磁盘缓存路径,Range 请求时优先从磁盘发送
+            self.path = path
+
+        async def aiter_content(self, chunk_size=4096):
+            yield self.data
+
+    class ChunkedStreamResponse:
+        """长文本分段合成响应
+
+        各片段并发合成 (并发数受限),按原始顺序依次输出,
+        首个片段就绪即可开始发送,无需等待全部片段完成。
+        """
+        def __init__(self, service, chunks, voice_code, speed, volume, pitch, audio_type):
+            self.service = service
+            self.chunks = chunks
+            self.args = (voice_code, speed, volume, pitch, audio_type)
+            self._tasks = []
+
+        async def start(self):
+            """启动所有片段的合成任务,等待首个片段就绪 (首段失败时直接抛出异常)"""
+            voice_code, speed, volume, pitch, audio_type = self.args
+            concurrency = max(1, int(config.get_settings().get("long_text_concurrency", 3)))
+            semaphore = asyncio.Semaphore(concurrency)
+            self._tasks = [
+                asyncio.create_task(self._synth_chunk(chunk, semaphore, wait_done=i > 0))
+                for i, chunk in enumerate(self.chunks)
+            ]
+            
+            # 排在并发窗口之外的片段提前签名,轮到它们时可直接下载
+            pending = [
+                chunk for chunk in self.chunks[concurrency:]
+                if not self.service._is_cached(chunk, voice_code, speed, volume, pitch, audio_type)
+            ]
+            if pending:
+                self.service.presigner.schedule(pending, voice_code, speed, volume, pitch)
+            
             try:
-                with open(temp_path, 'wb') as f:
-                    for chunk in self.response.iter_content(chunk_size=chunk_size):
-                        if chunk:
-                            f.write(chunk)
-                            yield chunk
-                
-                # 下载完成后重命名
-                if os.path.exists(temp_path):
-                    # 再次检查目标是否存在
-                    if not os.path.exists(self.cache_path):
-                        os.rename(temp_path, self.cache_path)
-                        self.service._clean_cache()
-                        logger.debug(f"[缓存] 已保存: {os.path.basename(self.cache_path)}")
-                    else:
-                        os.remove(temp_path)
-            except Exception as e:
-                logger.error(f"流式缓存出错: {e}")
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
+                await asyncio.shield(self._tasks[0])
+            except BaseException:
+                await self._cancel()
                 raise
 
-    async def process_tts_request(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50, audio_type: str = "mp3"):
-        """处理TTS请求 - 完全并发,无队列"""
+        async def _synth_chunk(self, chunk, semaphore, wait_done=True):
+            voice_code, speed, volume, pitch, audio_type = self.args
+            return await self.service.synth_segment(chunk, voice_code, speed, volume, pitch, audio_type, semaphore, wait_done)
+
+        async def _cancel(self):
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        async def aiter_content(self, chunk_size=4096):
+            try:
+                for task in self._tasks:
+                    resp = await task
+                    if hasattr(resp, "aiter_content"):
+                        async for data in resp.aiter_content(chunk_size=chunk_size):
+                            yield data
+                    else:
+                        for data in resp.iter_content(chunk_size=chunk_size):
+                            yield data
+            finally:
+                # 客户端断开时取消尚未完成的片段 (已开始的下载仍会在后台写入缓存)
+                await self._cancel()
+
+    @asynccontextmanager
+    async def _upstream_slot(self, limiter: AdaptiveLimiter, breaker: CircuitBreaker):
+        """上游请求的公共包装: 熔断检查 + 自适应并发名额 + 结果记录"""
+        breaker.before_call()
+        success = None
+        try:
+            async with limiter.slot():
+                yield
+            success = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                success = False
+            raise
+        finally:
+            if success is None:
+                breaker.release()
+            else:
+                breaker.record(success)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def process_tts_request(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50, audio_type: str = "mp3", split: bool = True):
+        """处理TTS请求
+        
+        上游签名和下载请求受自适应并发上限控制,超出部分在本地排队。
+        相同参数的并发请求合并为一次上游下载,后到的请求直接读取正在下载的数据。
+        split=True 时超长的 MP3 文本按句切分后并发合成、按序输出。
+        """
+        with span("process_tts_request", voice=voice_code, format=audio_type, chars=len(text)):
+            return await self._process_tts_request(text, voice_code, speed, volume, pitch, audio_type, split)
+
+    async def _process_tts_request(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str, split: bool):
+        if split:
+            chunks = self._split_long_text(text, audio_type)
+            if chunks:
+                logger.info(f"[TTS] 长文本分段合成: {len(text)} 字, {len(chunks)} 段")
+                set_attributes(cache="chunked", chunks=len(chunks))
+                resp = self.ChunkedStreamResponse(self, chunks, voice_code, speed, volume, pitch, audio_type)
+                await resp.start()
+                return resp
+        
         tts_start = time.time()
         
         # 检查缓存
@@ -101,60 +274,243 @@ class XFService:
                 os.makedirs(self.CACHE_DIR)
             
             cache_key = self._get_cache_key(text, voice_code, speed, volume, pitch, audio_type)
-            cache_path = os.path.join(self.CACHE_DIR, cache_key)
+            cache_path = self.cache_store.path_for(cache_key)
+            fingerprint = raw_fingerprint(text, voice_code, speed, volume, pitch, audio_type)
+            set_attributes(cache_key=cache_key)
+            
+            # 内存热点命中: 不访问文件系统
+            data = self.memory_cache.get(cache_key)
+            if data is not None:
+                cache_time = (time.time() - tts_start) * 1000
+                await asyncio.to_thread(self.cache_store.touch, cache_key, len(data))
+                self.canonical_stats.observe(cache_key, fingerprint, hit=True)
+                CACHE_HITS.inc(voice=voice_label(voice_code), format=audio_format(audio_type), tier="memory")
+                set_attributes(cache="memory")
+                logger.info(f"[TTS] 缓存命中(内存): {cache_time:.0f}ms")
+                return self.MemoryStreamResponse(data, cache_key, cache_path)
             
             if os.path.exists(cache_path):
-                # 更新修改时间
-                os.utime(cache_path, None)
+                # 记录访问 (批量写入索引)
+                file_size = os.path.getsize(cache_path)
+                await asyncio.to_thread(self.cache_store.touch, cache_key, file_size)
+                self.canonical_stats.observe(cache_key, fingerprint, hit=True)
+                CACHE_HITS.inc(voice=voice_label(voice_code), format=audio_format(audio_type), tier="disk")
+                set_attributes(cache="disk", bytes=file_size)
                 
-                # 返回文件响应
-                class FileStreamResponse:
-                    def __init__(self, path):
-                        self.path = path
-                    def iter_content(self, chunk_size=4096):
-                        with open(self.path, 'rb') as f:
-                            while True:
-                                data = f.read(chunk_size)
-                                if not data:
-                                    break
-                                yield data
+                # 频繁命中的小文件提升到内存
+                if self.memory_cache.should_promote(cache_key, file_size):
+                    with span("cache.read", bytes=file_size):
+                        data = await asyncio.to_thread(self._read_file, cache_path)
+                    await self.memory_cache.put(cache_key, data, cache_path)
+                    cache_time = (time.time() - tts_start) * 1000
+                    logger.info(f"[TTS] 缓存命中(提升至内存): {cache_time:.0f}ms")
+                    return self.MemoryStreamResponse(data, cache_key, cache_path)
                 
                 cache_time = (time.time() - tts_start) * 1000
                 logger.info(f"[TTS] 缓存命中: {cache_time:.0f}ms")
-                return FileStreamResponse(cache_path)
+                return self.FileStreamResponse(cache_path, cache_key)
+            
+            await asyncio.to_thread(self.cache_store.record_miss, cache_key)
+            self.canonical_stats.observe(cache_key, fingerprint, hit=False)
+            CACHE_MISSES.inc(voice=voice_label(voice_code), format=audio_format(audio_type))
+            
+            # 合并到进行中的相同请求,或作为首个请求发起上游下载
+            download = self._inflight.get(cache_key)
+            if download is not None:
+                logger.info(f"[TTS] 合并到进行中的请求 (当前读者: {download.readers})")
+                set_attributes(cache="coalesced")
+            else:
+                set_attributes(cache="miss")
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                download = InflightDownload(
+                    cache_path,
+                    admit=lambda d, key=cache_key: self.cache_store.admit(
+                        key, d.size, voice_code, force=key in self._required_keys
+                    ),
+                    on_saved=lambda d, key=cache_key: self.cache_store.register(key, d.size, voice_code, audio_type),
+                    on_done=self._on_download_done,
+                )
+                self._inflight[cache_key] = download
+                download.start(lambda: self._open_upstream(text, voice_code, speed, volume, pitch, audio_type, tts_start))
+            await download.wait_ready()
+            return download
+        
+        set_attributes(cache="disabled")
+        resp = await self._open_upstream(text, voice_code, speed, volume, pitch, audio_type, tts_start)
+        return self.UpstreamStreamResponse(resp)
+
+    def _is_cached(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str) -> bool:
+        """判断音频是否已在内存或磁盘缓存中"""
+        cache_key = self._get_cache_key(text, voice_code, speed, volume, pitch, audio_type)
+        if cache_key in self.memory_cache:
+            return True
+        return os.path.exists(self.cache_store.path_for(cache_key))
+
+    async def synth_segment(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str,
+                            semaphore: asyncio.Semaphore, wait_done: bool = True):
+        """在并发名额内合成一段文本 (长文本分段、流式合成共用)
+        
+        wait_done=True 时在占用名额期间完成下载,保证并发数限制的是真实的上游下载量;
+        马上要输出的片段传 False,响应就绪即可开始发送。
+        """
+        async with semaphore:
+            resp = await self.process_tts_request(text, voice_code, speed, volume, pitch, audio_type, split=False)
+            if isinstance(resp, InflightDownload):
+                if wait_done:
+                    await resp.wait_done()
+            elif isinstance(resp, self.UpstreamStreamResponse) and wait_done:
+                # 未启用缓存时数据只能保存在内存中
+                data = b"".join([c async for c in resp.aiter_content(chunk_size=65536)])
+                resp = self.MemoryStreamResponse(data)
+            return resp
+
+    def _split_long_text(self, text: str, audio_type: str):
+        """判断是否需要分段合成,需要时返回片段列表,否则返回 None
         
+        只有 MP3 可以直接按帧拼接,其他格式 (如 WAV 带文件头) 不分段
+        """
+        settings = config.get_settings()
+        threshold = int(settings.get("long_text_threshold", 300))
+        if threshold <= 0 or len(text) <= threshold:
+            return None
+        if "mp3" not in audio_type and "mpeg" not in audio_type:
+            return None
+        chunks = split_text(text, int(settings.get("long_text_chunk_chars", 150)))
+        return chunks if len(chunks) > 1 else None
+
+    async def _open_upstream(self, text: str, voice_code: str, speed: int, volume: int, pitch: int, audio_type: str, tts_start: float):
+        """执行签名和下载两个步骤,返回上游流式响应"""
         # 为本次请求创建一个随机的伪装客户端(步骤1和步骤2共用)
+        # 客户端只负责指纹和请求头,底层连接来自全局连接池,可跨请求复用
         # 增加超时时间到120秒，防止长文本生成时截断
         client = DisguiseClient(browser="chrome", timeout=120)
         
-        # 步骤1: 获取签名URL (在线程池中执行)
+        # 步骤1: 获取签名URL
         step1_start = time.time()
-        url = await asyncio.to_thread(self.get_audio_url, text, voice_code, speed, volume, pitch, audio_type, client)
+        url = await self.get_audio_url(text, voice_code, speed, volume, pitch, audio_type, client)
         step1_time = (time.time() - step1_start) * 1000
         logger.info(f"[TTS] 步骤1-签名请求: {step1_time:.0f}ms")
         
-        # 步骤2: 下载音频流 (在线程池中执行，使用相同的客户端)
+        # 步骤2: 下载音频流 (使用相同的客户端)
         step2_start = time.time()
-        resp = await asyncio.to_thread(self.get_audio_stream, url, client)
+        try:
+            resp = await self.get_audio_stream(url, client)
+        except Exception:
+            # 签名可能已被上游拒绝,作废缓存以便下次重新签名
+            self.sign_cache.invalidate(self._prepare_synth_params(text, voice_code, speed, volume, pitch)["txt_hash"])
+            raise
         step2_time = (time.time() - step2_start) * 1000
         logger.info(f"[TTS] 步骤2-音频下载: {step2_time:.0f}ms")
         
         # 记录总耗时
         total_time = (time.time() - tts_start) * 1000
+        labels = {"voice": voice_label(voice_code), "format": audio_format(audio_type)}
+        SIGN_SECONDS.observe(step1_time / 1000, **labels)
+        DOWNLOAD_TTFB_SECONDS.observe(step2_time / 1000, **labels)
+        SYNTH_TOTAL_SECONDS.observe(total_time / 1000, **labels)
         if total_time > 10000:
             logger.warning(f"[TTS] 总耗时: {total_time:.0f}ms (步骤1: {step1_time:.0f}ms + 步骤2: {step2_time:.0f}ms)")
         else:
             logger.info(f"[TTS] 总耗时: {total_time:.0f}ms")
         
-        # 如果启用缓存,使用包装类进行流式保存
-        if limit > 0:
-            cache_key = self._get_cache_key(text, voice_code, speed, volume, pitch, audio_type)
-            cache_path = os.path.join(self.CACHE_DIR, cache_key)
-            return self.CachedStreamResponse(resp, cache_path, self)
-        
         return resp
 
+    def _on_download_done(self, download: InflightDownload):
+        """下载结束后移出进行中列表"""
+        key = os.path.basename(download.cache_path)
+        if self._inflight.get(key) is download:
+            del self._inflight[key]
+
+    async def ensure_cached(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50, audio_type: str = "mp3") -> str:
+        """确保音频已写入磁盘缓存,返回缓存键 (批量任务、异步任务等离线场景使用)"""
+        if config.get_settings().get("cache_limit", 100) <= 0:
+            raise RuntimeError("缓存已禁用 (cache_limit <= 0),无法生成离线结果")
+        
+        cache_key = self._get_cache_key(text, voice_code, speed, volume, pitch, audio_type)
+        self._required_keys[cache_key] = self._required_keys.get(cache_key, 0) + 1
+        try:
+            resp = await self.process_tts_request(text, voice_code, speed, volume, pitch, audio_type)
+            if isinstance(resp, InflightDownload):
+                await resp.wait_done()
+                if resp.error is not None:
+                    raise resp.error
+            elif isinstance(resp, self.ChunkedStreamResponse):
+                # 分段合成的结果拼接后作为整段文本的缓存
+                data = b"".join([c async for c in resp.aiter_content(chunk_size=65536)])
+                await asyncio.to_thread(self.store_bytes, cache_key, data, voice_code, audio_type)
+            elif isinstance(resp, self.MemoryStreamResponse):
+                # 内存中的热点音频可能已被磁盘缓存淘汰
+                await asyncio.to_thread(self.store_bytes, cache_key, resp.data, voice_code, audio_type)
+        finally:
+            remaining = self._required_keys.pop(cache_key) - 1
+            if remaining > 0:
+                self._required_keys[cache_key] = remaining
+        return cache_key
+
+    def store_bytes(self, cache_key: str, data: bytes, voice_code: str = None, audio_type: str = None):
+        """将完整音频数据写入磁盘缓存 (写文件并更新索引,应在线程中调用)"""
+        path = self.cache_store.path_for(cache_key)
+        if os.path.exists(path):
+            return
+        with span("cache.write", cache_key=cache_key, bytes=len(data)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{str(time.time())}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        self.cache_store.add(cache_key, len(data), voice_code, audio_type, force=True)
+
+    def get_cached_path(self, cache_key: str):
+        """缓存键对应的缓存文件路径,不存在时返回 None"""
+        if not self.CACHE_KEY_PATTERN.match(cache_key):
+            return None
+        path = self.cache_store.path_for(cache_key)
+        return path if os.path.exists(path) else None
+
+    async def purge_cache(self, voice_code: str = None, older_than: float = None) -> int:
+        """按发音人和/或时间清理磁盘及内存缓存,返回清理数量"""
+        keys = await asyncio.to_thread(self.cache_store.purge, voice_code, older_than)
+        for key in keys:
+            self.memory_cache.discard(key)
+        if voice_code is None and older_than is None:
+            self.memory_cache.clear()
+        return len(keys)
 
+    async def cache_stats(self) -> dict:
+        """缓存统计信息"""
+        return {
+            "disk": await asyncio.to_thread(self.cache_store.stats),
+            "memory": self.memory_cache.stats(),
+            "sign": self.sign_cache.stats(),
+            "canonical": self.canonical_stats.stats(),
+            "inflight": len(self._inflight),
+        }
+
+    def upstream_stats(self) -> dict:
+        """上游并发控制与重试预算状态"""
+        hedge_delay = self._hedge_delay()
+        return {
+            "sign": dict(
+                self.sign_limiter.stats(),
+                retry_tokens=round(self.sign_retry_budget.tokens, 2),
+                circuit=self.sign_breaker.stats(),
+            ),
+            "synth": dict(
+                self.synth_limiter.stats(),
+                retry_tokens=round(self.synth_retry_budget.tokens, 2),
+                circuit=self.synth_breaker.stats(),
+                hedge_delay_ms=round(hedge_delay * 1000) if hedge_delay is not None else None,
+                hedges=self.hedges,
+                hedge_wins=self.hedge_wins,
+            ),
+        }
+
+    async def close(self):
+        """关闭服务: 取消预签名任务和进行中的下载,写入缓存索引"""
+        await self.presigner.close()
+        for download in list(self._inflight.values()):
+            await download.cancel()
+        self.cache_store.close()
 
     def _process_special_symbols(self, text: str) -> str:
         """处理特殊符号映射"""
@@ -166,6 +522,10 @@ class XFService:
             processed_text += self.SPECIAL_SYMBOLS_MAP.get(char, char)
         return processed_text
 
+    def _upstream_url(self, path: str) -> str:
+        base = config.get_settings().get("upstream_base_url") or self.UPSTREAM_BASE_URL
+        return base.rstrip("/") + path
+
     def _encrypt(self, data: dict) -> str:
         """加密数据"""
         cipher = AES.new(self.AES_KEY, AES.MODE_ECB)
@@ -186,9 +546,11 @@ class XFService:
         emo_tag = f"[em{emo}:{emo_value}]" if emo else ""
         return f"{pitch_tag}{emo_tag}{text}"
 
-    def get_audio_url(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50, audio_type: str = "mp3", client: DisguiseClient = None) -> str:
-        """获取音频URL(同步方法)"""
-        processed_text = self._process_special_symbols(text)
+    def _prepare_synth_params(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50) -> dict:
+        """计算上游请求参数 (发音人、映射后的语速音量、带标签文本及其哈希)"""
+        processed_text = normalize_text(self._process_special_symbols(text))
+        # 发音人名称、code 与 param 解析为同一个上游代码
+        voice_code = config.resolve_voice(voice_code)
         
         # 处理自定义语音格式
         vid = voice_code
@@ -215,6 +577,22 @@ class XFService:
         m.update(tagged_text.encode('utf-8'))
         txt_hash = m.hexdigest()
         
+        return {
+            "vid": vid,
+            "final_speed": final_speed,
+            "final_volume": final_volume,
+            "tagged_text": tagged_text,
+            "txt_hash": txt_hash,
+        }
+
+    async def get_audio_url(self, text: str, voice_code: str, speed: int, volume: int, pitch: int = 50, audio_type: str = "mp3", client: DisguiseClient = None) -> str:
+        """获取音频URL(异步方法)
+        
+        签名结果按文本哈希缓存,有效期内的重复文本无需再次请求签名接口
+        """
+        params = self._prepare_synth_params(text, voice_code, speed, volume, pitch)
+        txt_hash = params["txt_hash"]
+        
         req_data = {"synth_text_hash_code": txt_hash}
         encrypted_req = self._encrypt(req_data)
         final_req = {"req": encrypted_req}
@@ -223,80 +601,194 @@ class XFService:
         if client is None:
             client = DisguiseClient(browser="chrome", timeout=120)
         
-        # 重试循环
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                resp = client.post(
-                    self.SIGN_URL, 
+        async def attempt_sign(attempt: int):
+            async with self._upstream_slot(self.sign_limiter, self.sign_breaker):
+                resp = await client.apost(
+                    self._upstream_url(self.SIGN_PATH),
                     json=final_req,
                     request_type="api",
                     add_delay=True if attempt > 0 else False
                 )
                 resp.raise_for_status()
-                
-                resp_json = resp.json()
-                
-                if "body" not in resp_json:
-                     raise Exception(f"Unexpected response format: {resp_json}")
+            
+            resp_json = resp.json()
+            
+            if "body" not in resp_json:
+                raise UpstreamResponseError(f"Unexpected response format: {resp_json}")
 
-                decrypted_body = self._decrypt(resp_json["body"])
-                
-                txt_cnt = quote(tagged_text)
-                
-                final_url = (
-                    f"{self.SYNTH_URL_BASE}?"
-                    f"ts={decrypted_body['time_stamp']}&"
-                    f"sign={decrypted_body['sign_text']}&"
-                    f"sid=&vid={vid}&"
-                    f"volume={final_volume}&"
-                    f"speed={final_speed}&"
-                    f"content={txt_cnt}&"
-                    f"listen=0"
-                )
-                
-                return final_url
+            decrypted_body = self._decrypt(resp_json["body"])
+            return decrypted_body['time_stamp'], decrypted_body['sign_text']
 
-            except Exception as e:
-                logger.warning(f"签名URL请求尝试 {attempt + 1}/{max_retries} 次失败: {e}")
-                
-                if attempt == max_retries - 1:
-                    logger.error("签名URL请求在多次重试后失败。")
-                    raise
-                
-                sleep_time = ((attempt + 1) * 2) + random.uniform(0, 1)
-                logger.info(f"将在 {sleep_time:.2f} 秒后重试...")
-                time.sleep(sleep_time)
+        async def fetch_sign():
+            set_attributes(sign_cache="miss")
+            return await retry_call(attempt_sign, self._retry_policy("sign"), self.sign_retry_budget, label="签名URL请求", stage="sign")
+
+        with span("sign", txt_hash=txt_hash, sign_cache="hit"):
+            time_stamp, sign_text = await self.sign_cache.get_or_fetch(txt_hash, fetch_sign)
+        
+        txt_cnt = quote(params["tagged_text"])
+        
+        final_url = (
+            f"{self._upstream_url(self.SYNTH_PATH)}?"
+            f"ts={time_stamp}&"
+            f"sign={sign_text}&"
+            f"sid=&vid={params['vid']}&"
+            f"volume={params['final_volume']}&"
+            f"speed={params['final_speed']}&"
+            f"content={txt_cnt}&"
+            f"listen=0"
+        )
+        
+        return final_url
 
-    def get_audio_stream(self, url: str, client: DisguiseClient = None):
-        """获取音频流(同步方法)"""
+    async def get_audio_stream(self, url: str, client: DisguiseClient = None):
+        """获取音频流(异步方法)
+        
+        返回流式响应,调用方读取完毕后需 await resp.aclose() 归还连接
+        """
         # 如果没有传入客户端，创建一个新的
         if client is None:
             client = DisguiseClient(browser="chrome", timeout=120)
         
-        max_retries = 5
-        
-        for attempt in range(max_retries):
+        async def attempt_stream(attempt: int):
+            return await self._hedged_open_stream(url, client, add_delay=attempt > 0)
+
+        with span("download"):
+            return await retry_call(attempt_stream, self._retry_policy("synth"), self.synth_retry_budget, label="音频流请求", stage="synth")
+
+    async def _open_stream(self, url: str, client: DisguiseClient, add_delay: bool = False):
+        """发起一次音频流请求,收到响应头后返回
+
+        下载并发名额一直占用到正文读取完毕 (响应关闭),自适应上限限制的是
+        同时进行的音频传输数;延迟采样仍取收到响应头的耗时,不受音频长短影响。
+        """
+        self.synth_breaker.before_call()
+        try:
+            permit = await self.synth_limiter.acquire()
+        except BaseException:
+            self.synth_breaker.release()
+            raise
+        hold = self._UpstreamHold(permit, self.synth_breaker)
+        resp = None
+        try:
+            start = time.monotonic()
+            resp = await client.aget(
+                url, 
+                request_type="resource",
+                stream=True,
+                add_delay=add_delay
+            )
+            resp.raise_for_status()
+            permit.mark_latency()
+            self.synth_latency.add(time.monotonic() - start)
+        except BaseException as e:
+            hold.settle(e)
+            # 失败或被取消时归还连接
+            if resp is not None:
+                await resp.aclose()
+            raise
+        return self._HeldStream(resp, hold)
+
+    class _UpstreamHold:
+        """一次音频下载占用的并发名额和熔断记录,下载结束时结算一次"""
+        def __init__(self, permit: LimiterPermit, breaker: CircuitBreaker):
+            self.permit = permit
+            self.breaker = breaker
+            self.settled = False
+
+        def settle(self, error: Optional[BaseException] = None):
+            if self.settled:
+                return
+            self.settled = True
+            success = outcome(error)
+            self.permit.release(success)
+            if success is None:
+                self.breaker.release()
+            else:
+                self.breaker.record(success)
+
+    class _HeldStream:
+        """持有下载名额的上游流式响应: 正文读取出错或响应关闭时结算名额
+
+        未被关闭就被回收的响应由 finalizer 归还名额,避免名额泄漏。
+        """
+        def __init__(self, response, hold):
+            self.response = response
+            self._hold = hold
+            self._error: Optional[BaseException] = None
+            weakref.finalize(self, hold.settle, None)
+
+        def __getattr__(self, name):
+            return getattr(self.response, name)
+
+        async def aiter_content(self, chunk_size=4096):
             try:
-                
-                resp = client.get(
-                    url, 
-                    request_type="resource",
-                    stream=True,
-                    add_delay=True if attempt > 0 else False
-                )
-                resp.raise_for_status()
-                return resp
-                
-            except Exception as e:
-                logger.warning(f"音频流请求尝试 {attempt + 1}/{max_retries} 次失败: {e}")
-                
-                if attempt == max_retries - 1:
-                    logger.error("音频流请求在多次重试后失败。")
-                    raise
-                
-                sleep_time = ((attempt + 1) * 2) + random.uniform(0, 1)
-                logger.info(f"将在 {sleep_time:.2f} 秒后重试音频流...")
-                time.sleep(sleep_time)
+                async for chunk in self.response.aiter_content(chunk_size=chunk_size):
+                    yield chunk
+            except BaseException as e:
+                self._error = e
+                self._hold.settle(e)
+                raise
+
+        async def aclose(self):
+            try:
+                await self.response.aclose()
+            finally:
+                self._hold.settle(self._error)
+
+    def _hedge_delay(self):
+        """对冲请求的触发阈值: 近期下载首包耗时的高分位数,样本不足或未启用时返回 None"""
+        settings = config.get_settings()
+        if not settings.get("hedge_enabled", True) or len(self.synth_latency) < self.HEDGE_MIN_SAMPLES:
+            return None
+        delay = self.synth_latency.percentile(float(settings.get("hedge_percentile", 0.95)))
+        return max(delay, float(settings.get("hedge_min_delay", 0.5)))
+
+    async def _hedged_open_stream(self, url: str, client: DisguiseClient, add_delay: bool = False):
+        """带对冲的音频流请求
+        
+        首个请求超过近期耗时的高分位数仍未返回时,用不同指纹再发一个请求,
+        取先返回响应头的一个,取消另一个。
+        """
+        primary = asyncio.create_task(self._open_stream(url, client, add_delay))
+        tasks = [primary]
+        winner = None
+        try:
+            delay = self._hedge_delay()
+            if delay is None:
+                winner = primary
+                return await asyncio.shield(primary)
+            
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                logger.info(f"[TTS] 音频下载超过 {delay * 1000:.0f}ms 未响应,发起对冲请求")
+                add_event("hedge", delay_ms=round(delay * 1000))
+                tasks.append(asyncio.create_task(self._open_stream(url, client.fork())))
+            
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        if task is not primary:
+                            self.hedge_wins += 1
+                            add_event("hedge_win")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消未完成的请求;已成功但落选的响应需要关闭以归还连接
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for task in tasks:
+                if task is winner and not task.cancelled() and task.exception() is None:
+                    continue
+                if not task.cancelled() and task.exception() is None:
+                    await task.result().aclose()
 
 xf_service = XFService()
@@ -1,14 +1,24 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.api.endpoints import router
+from fastapi.responses import FileResponse, Response
+from app.api.endpoints import router, verify_key
 import uvicorn
 
 from app.core.config import config
-from app.core.logger import setup_logger, logger
-from contextlib import asynccontextmanager
+from app.core.logger import setup_logger, shutdown_logger, logger
+from app.core.disguise import session_pool
+from app.core.metrics import (CONTENT_TYPE, HTTP_INFLIGHT, HTTP_REQUESTS, HTTP_SECONDS, TTS_BYTES, TTS_INFLIGHT,
+                              metrics)
+from app.services.xf_service import xf_service
+from app.services.job_queue import job_queue
+from app.services.warmup import warmup_service
+from app.core.tracing import exporter as trace_exporter, start_trace
+from contextlib import asynccontextmanager, nullcontext
 import asyncio
+import re
 import time
+import uuid
+from typing import Optional
 from urllib.parse import unquote
 
 @asynccontextmanager
@@ -18,9 +28,20 @@ async def lifespan(app: FastAPI):
     
     # 2. 然后，加载应用配置
     config.load_config()
+    config.start_watcher()
+    metrics.start()
     settings = config.get_settings()
     port = settings.get("port", 8501)
     
+    # 3. 打开磁盘缓存索引 (首次启动时迁移旧缓存文件)
+    xf_service.cache_store.open()
+    
+    # 4. 启动异步任务队列 (继续处理上次未完成的任务)
+    job_queue.start()
+    
+    # 5. 启动缓存预热 (按 data/warmup/ 下的清单预先合成常用短语)
+    warmup_service.start()
+    
     async def print_banner():
         await asyncio.sleep(0.5)
         logger.info("="*50)
@@ -44,9 +65,46 @@ async def lifespan(app: FastAPI):
             await banner_task
         except asyncio.CancelledError:
             pass  # 取消是预期的
+        
+        # 取消未完成的后台任务,关闭上游长连接会话
+        await warmup_service.close()
+        await job_queue.close()
+        await xf_service.close()
+        await session_pool.close()
+        config.stop_watcher()
+        await metrics.close()
+        await asyncio.to_thread(trace_exporter.close)
+        # 最后停止日志监听线程 (输出完队列中剩余的日志)
+        shutdown_logger()
 
 app = FastAPI(title="XFAPI - iFLYTEK TTS Proxy", lifespan=lifespan)
 
+# 不记录追踪的路径前缀
+UNTRACED_PREFIXES = ("/api/logs", "/metrics", "/static/", "/multitts/")
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def _request_id(scope) -> str:
+    """请求 ID: 沿用客户端或上游代理传入的 X-Request-ID (格式合法时),否则随机生成"""
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            value = value.decode("latin-1")
+            if _REQUEST_ID_RE.match(value):
+                return value
+    return uuid.uuid4().hex[:16]
+
+def _route_label(scope) -> str:
+    """请求匹配到的路由模板 (如 /api/cache/{cache_key}),未匹配时返回 other"""
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "other"
+    path = scope["path"]
+    if path == template or path.startswith(template.rstrip("/") + "/"):
+        # 完整路径或挂载点 (如 /static)
+        return template
+    # 通过 include_router 引入的路由只记录前缀之后的部分,按层级补上前缀
+    depth = path.count("/") - template.count("/")
+    return "/".join(path.split("/")[:depth + 1]) + template
+
 # 添加日志中间件 (纯 ASGI 中间件，避免 BaseHTTPMiddleware 阻塞 SSE 流)
 class LoggingMiddleware:
     def __init__(self, app):
@@ -59,34 +117,66 @@ class LoggingMiddleware:
 
         start_time = time.time()
         status_code = [200] # 使用列表以便在闭包中修改
+        # 音频响应的发音人/格式标签 (由接口写入 request.state.tts_labels)
+        tts_labels = [None]
+        request_id = _request_id(scope)
 
         async def send_wrapper(message):
             if message["type"] == "http.response.start":
                 status_code[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+                if message["status"] < 400:
+                    tts_labels[0] = scope.get("state", {}).get("tts_labels")
+                if tts_labels[0]:
+                    TTS_INFLIGHT.inc(**tts_labels[0])
+            elif message["type"] == "http.response.body" and tts_labels[0]:
+                TTS_BYTES.inc(len(message.get("body", b"")), **tts_labels[0])
             await send(message)
         
-        try:
-            await self.app(scope, receive, send_wrapper)
-        except asyncio.CancelledError:
-            # 在服务器强制关闭期间，活动的流式请求（如日志）会被取消。
-            # 这是预期的行为，所以我们捕获这个异常并直接返回，
-            # 以防止 uvicorn 将其记录为未处理的错误。
-            return
-        
-        process_time = (time.time() - start_time) * 1000
-        
-        # 提取信息
         path = unquote(scope["path"])
         method = scope["method"]
-        client = scope.get("client")
-        host = client[0] if client else "unknown"
-        port = client[1] if client else 0
-        http_version = scope.get("http_version", "1.1")
+        # 日志流、指标和静态资源不记录追踪
+        traced = not path.startswith(UNTRACED_PREFIXES)
+        trace = start_trace(f"{method} {path}", request_id, **{"http.method": method, "http.path": path}) if traced else nullcontext()
         
-        # 排除 /api/logs 的日志，避免刷屏
-        if path != "/api/logs":
-            log_message = f'{host}:{port} - "{method} {path} HTTP/{http_version}" {status_code[0]} ({process_time:.2f}ms)'
-            logger.info(log_message)
+        with trace as root:
+            HTTP_INFLIGHT.inc()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            except asyncio.CancelledError:
+                # 在服务器强制关闭期间，活动的流式请求（如日志）会被取消。
+                # 这是预期的行为，所以我们捕获这个异常并直接返回，
+                # 以防止 uvicorn 将其记录为未处理的错误。
+                if root is not None:
+                    root.set(cancelled=True)
+                return
+            finally:
+                HTTP_INFLIGHT.dec()
+                if tts_labels[0]:
+                    TTS_INFLIGHT.dec(**tts_labels[0])
+            
+            process_time = (time.time() - start_time) * 1000
+            
+            # 按路由模板统计,避免路径参数 (如缓存键) 产生过多标签
+            route = _route_label(scope)
+            HTTP_REQUESTS.inc(method=method, route=route, status=status_code[0])
+            HTTP_SECONDS.observe(process_time / 1000, route=route)
+            if root is not None:
+                root.name = f"{method} {route}"
+                root.set(**{"http.route": route, "http.status_code": status_code[0]})
+                if status_code[0] >= 500:
+                    root.status = "error"
+            
+            # 提取信息
+            client = scope.get("client")
+            host = client[0] if client else "unknown"
+            port = client[1] if client else 0
+            http_version = scope.get("http_version", "1.1")
+            
+            # 排除 /api/logs 和 /metrics 的日志，避免刷屏
+            if path not in ("/api/logs", "/metrics"):
+                log_message = f'{host}:{port} - "{method} {path} HTTP/{http_version}" {status_code[0]} ({process_time:.2f}ms)'
+                logger.info(log_message)
 
 app.add_middleware(LoggingMiddleware)
 
@@ -104,6 +194,12 @@ app.mount("/multitts", StaticFiles(directory="data/multitts"), name="multitts")
 async def read_index():
     return FileResponse("static/index.html")
 
+@app.get("/metrics")
+async def read_metrics(key: Optional[str] = None):
+    """Prometheus 指标 (汇总所有 worker 进程)"""
+    verify_key(key)
+    return Response(await asyncio.to_thread(metrics.render), media_type=CONTENT_TYPE)
+
 @app.get("/settings_page")
 async def read_settings():
     return FileResponse("static/settings.html")
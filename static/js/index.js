@@ -105,7 +105,7 @@ document.addEventListener('DOMContentLoaded', async () => {
     function initHomePage() {
         async function loadSpeakers() {
             try {
-                const res = await fetch('/api/speakers');
+                const res = await fetch('/api/speakers?fields=name,param,avatar,desc,locale,extendUI');
                 const rawSpeakers = await res.json();
 
                 const seen = new Set();
@@ -352,7 +352,7 @@ document.addEventListener('DOMContentLoaded', async () => {
 
         async function loadSettings() {
             try {
-                const spkRes = await fetch('/api/speakers');
+                const spkRes = await fetch('/api/speakers?fields=name');
                 const speakers = await spkRes.json();
                 const spkSelect = document.getElementById('default-speaker');
                 spkSelect.innerHTML = '';
@@ -474,10 +474,14 @@ document.addEventListener('DOMContentLoaded', async () => {
                 const htmlLog = ansi_up.ansi_to_html(rawLog);
                 addNewLog(htmlLog, true); // Pass a flag to indicate it's HTML
             };
+            // 连接中断时浏览器会自动重连，并通过 Last-Event-ID 只获取断开后的日志
             eventSource.onerror = (err) => {
-                addNewLog('日志流连接错误，请检查服务器状态并刷新页面。');
                 console.error('EventSource failed:', err);
-                eventSource.close();
+                if (eventSource.readyState === EventSource.CLOSED) {
+                    addNewLog('日志流连接错误，请检查服务器状态并刷新页面。');
+                } else {
+                    addNewLog('日志流连接中断，正在重连...');
+                }
             };
         }
 
@@ -0,0 +1,21 @@
+import pytest
+
+from app.core.config import config
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    """每个测试使用独立的设置快照 (不读取 data/settings.yaml)
+
+    返回一个函数,调用 settings(key=value, ...) 覆盖部分设置,未设置的项使用代码中的默认值。
+    """
+    saved = config.settings, config._settings_loaded
+    values = {}
+
+    def update(**overrides):
+        values.update(overrides)
+        config._swap_settings(values)
+
+    update()
+    yield update
+    config.settings, config._settings_loaded = saved
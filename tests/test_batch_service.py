@@ -0,0 +1,52 @@
+import asyncio
+import io
+import zipfile
+
+from app.services import batch_service
+from app.services.batch_service import BatchItem, run_batch, zip_stream
+
+
+def _item(index, text, item_id=None):
+    return BatchItem(index, text, "voice", 100, 100, "audio/mp3", item_id)
+
+
+async def _collect(iterator):
+    return [value async for value in iterator]
+
+
+def test_identical_items_are_synthesized_once(monkeypatch, settings):
+    settings(batch_concurrency=2)
+    calls = []
+
+    async def ensure_cached(text, *args, **kwargs):
+        calls.append(text)
+        if text == "bad":
+            raise ConnectionError("reset")
+        return f"{text}.mp3"
+
+    monkeypatch.setattr(batch_service.xf_service, "ensure_cached", ensure_cached)
+    items = [_item(0, "a"), _item(1, "b"), _item(2, "a"), _item(3, "bad")]
+    results = asyncio.run(_collect(run_batch(items)))
+
+    assert sorted(calls) == ["a", "b", "bad"]
+    by_text = {result.items[0].text: result for result in results}
+    assert [item.index for item in by_text["a"].items] == [0, 2]
+    assert by_text["bad"].error == "reset" and by_text["bad"].cache_key is None
+
+
+def test_zip_entries_get_unique_names_and_errors_file(monkeypatch, tmp_path):
+    audio = tmp_path / "a.mp3"
+    audio.write_bytes(b"audio")
+    monkeypatch.setattr(batch_service.xf_service, "get_cached_path", lambda key: str(audio))
+
+    async def results():
+        items = [_item(0, "x", "a/b"), _item(1, "x", "a_b"), _item(2, "x", "a_b"), _item(3, "x")]
+        yield batch_service.BatchResult(items, cache_key="k.mp3")
+        yield batch_service.BatchResult([_item(4, "y", "errors")], error="reset")
+
+    data = b"".join(asyncio.run(_collect(zip_stream(results()))))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        names = zf.namelist()
+        assert names == ["a_b.mp3", "a_b-2.mp3", "a_b-3.mp3", "00003.mp3", "errors.txt"]
+        assert zf.read("a_b-2.mp3") == b"audio"
+        assert zf.read("errors.txt") == b"4\terrors\treset\n"
@@ -0,0 +1,221 @@
+import asyncio
+import gc
+import os
+
+import pytest
+
+from app.services.cache_policy import FrequencySketch, LRUPolicy, TinyLFUPolicy, create_policy
+from app.services.cache_store import CacheStore
+from app.services.single_flight import InflightDownload
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def _store(policy, limit_count, cache_dir=None):
+    return CacheStore(cache_dir, policy=policy, limits=(limit_count, 0), clock=Clock())
+
+
+def _fill(store, keys, hits=0, size=100):
+    for key in keys:
+        store.register(key, size)
+        for _ in range(hits):
+            store.touch(key, size)
+    store.flush()
+
+
+def _keys(store):
+    return {row[0] for row in store.conn.execute("SELECT key FROM entries")}
+
+
+def test_sketch_estimates_frequency_with_cap_and_aging():
+    sketch = FrequencySketch(width=64)
+    for _ in range(5):
+        sketch.increment("hot")
+    sketch.increment("warm")
+    assert sketch.estimate("hot") == 5
+    assert sketch.estimate("warm") == 1
+    assert sketch.estimate("cold") == 0
+
+    for _ in range(100):
+        sketch.increment("hot")
+    assert sketch.estimate("hot") == FrequencySketch.MAX_COUNT
+
+    sketch._reset()
+    assert sketch.estimate("hot") == FrequencySketch.MAX_COUNT // 2
+
+
+def test_tinylfu_admits_freely_below_limit():
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = _store(policy, 5)
+    _fill(store, ["a", "b"])
+    assert store.admit("c", 100)
+    assert policy.admitted == 1 and policy.rejected == 0
+
+
+def test_tinylfu_rejects_one_hit_wonder_when_full():
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = _store(policy, 5)
+    keys = [f"hot{i}" for i in range(5)]
+    for key in keys:
+        for _ in range(3):
+            store.record_miss(key)
+    _fill(store, keys)
+
+    store.record_miss("once")
+    assert not store.admit("once", 100)
+    assert policy.rejected == 1
+    assert not store.add("once", 100)
+    assert _keys(store) == set(keys)
+
+
+def test_tinylfu_admits_hotter_candidate_and_evicts_coldest():
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = _store(policy, 5)
+    keys = [f"k{i}" for i in range(5)]
+    for key in keys:
+        store.record_miss(key)
+    store.record_miss("k0")
+    _fill(store, keys)
+
+    for _ in range(5):
+        store.record_miss("new")
+    assert store.add("new", 100)
+    remaining = _keys(store)
+    assert "new" in remaining and len(remaining) == 5
+    # 被淘汰的是试用段中频率最低的文件,不会是频率更高的 k0
+    assert "k0" in remaining
+
+
+def test_force_and_existing_keys_skip_admission():
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = _store(policy, 2)
+    for _ in range(5):
+        store.record_miss("a")
+        store.record_miss("b")
+    _fill(store, ["a", "b"])
+    assert store.admit("a", 100)
+    assert store.admit("forced", 100, force=True)
+    assert policy.rejected == 0
+
+
+def test_victims_skip_window_and_prefer_probation():
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = _store(policy, 10)
+    _fill(store, ["p1", "p2"], hits=1)
+    _fill(store, [f"t{i}" for i in range(6)])
+    _fill(store, ["w1", "w2"])
+
+    victims = [key for key, _ in policy.victims(store, 20)]
+    # 最近写入的 2 个文件 (10 * 0.2) 在窗口内
+    assert "w1" not in victims and "w2" not in victims
+    assert victims[:6] == [f"t{i}" for i in range(6)]
+    assert victims[6:] == ["p1", "p2"]
+
+
+def test_victims_take_protected_first_when_over_quota():
+    policy = TinyLFUPolicy(window_ratio=0.1, protected_ratio=0.2)
+    store = _store(policy, 10)
+    _fill(store, ["t1"])
+    _fill(store, ["p1", "p2", "p3"], hits=1)
+    _fill(store, ["w1"])
+
+    victims = [key for key, _ in policy.victims(store, 20)]
+    assert victims == ["p1", "p2", "p3", "t1"]
+
+
+def test_lru_policy_evicts_least_recently_used():
+    store = _store(LRUPolicy(), 3)
+    _fill(store, ["a", "b", "c"])
+    store.touch("a")
+    store.flush()
+    _fill(store, ["d"])
+    assert _keys(store) == {"a", "c", "d"}
+
+
+def test_create_policy_falls_back_to_lru():
+    assert isinstance(create_policy("tinylfu"), TinyLFUPolicy)
+    assert isinstance(create_policy("unknown"), LRUPolicy)
+
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+    async def aiter_content(self, chunk_size=4096):
+        for i in range(0, len(self.data), 1000):
+            await asyncio.sleep(0.001)
+            yield self.data[i:i + 1000]
+
+    async def aclose(self):
+        await asyncio.sleep(0.01)
+
+
+def test_rejected_download_is_still_served_to_all_readers(tmp_path):
+    policy = TinyLFUPolicy(window_ratio=0.2, protected_ratio=0.8)
+    store = CacheStore(str(tmp_path), policy=policy, limits=(5, 0))
+    keys = [f"{i:032x}.mp3" for i in range(5)]
+    for key in keys:
+        for _ in range(5):
+            store.record_miss(key)
+        path = store.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        store.register(key, 100)
+
+    key = "f" * 32 + ".mp3"
+    store.record_miss(key)
+    data = os.urandom(20000)
+    cache_path = store.path_for(key)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+    async def read(download):
+        return b"".join([chunk async for chunk in download.aiter_content()])
+
+    async def main():
+        download = InflightDownload(cache_path, admit=lambda d: store.admit(key, d.size),
+                                    on_saved=lambda d: store.register(key, d.size))
+
+        async def opener():
+            return _Response(data)
+
+        download.start(opener)
+        await download.wait_ready()
+        concurrent = asyncio.create_task(read(download))
+        await download.wait_done()
+        late = await read(download)
+        return download, await concurrent, late
+
+    download, concurrent, late = asyncio.run(main())
+    assert download.rejected
+    assert concurrent == data and late == data
+    assert not os.path.exists(cache_path)
+    assert key not in _keys(store)
+
+    temp_path = download.temp_path
+    assert os.path.exists(temp_path)
+    del download
+    gc.collect()
+    # 不再有读者引用后删除临时文件
+    assert not os.path.exists(temp_path)
+    store.close()
+
+
+def test_migration_skips_index_and_access_log(tmp_path):
+    (tmp_path / "access.log").write_text("1\tH\tk\t\t\n")
+    (tmp_path / "abc.mp3").write_bytes(b"x")
+    (tmp_path / "old.tmp").write_bytes(b"x")
+    store = CacheStore(str(tmp_path), limits=(10, 0))
+    store.open()
+    assert (tmp_path / "access.log").exists()
+    assert (tmp_path / "ab" / "abc.mp3").exists()
+    assert not (tmp_path / "old.tmp").exists()
+    assert _keys(store) == {"abc.mp3"}
+    store.close()
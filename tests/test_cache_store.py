@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services.cache_policy import LRUPolicy
+from app.services.cache_store import CacheStore
+
+
+def _put(store, key, size=10, voice=None):
+    path = store.path_for(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return store.add(key, size, voice)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = CacheStore(str(tmp_path), policy=LRUPolicy(), limits=(3, 0))
+    yield store
+    store.close()
+
+
+def test_files_are_sharded_by_key_prefix(store, tmp_path):
+    assert store.path_for("abcdef.mp3") == os.path.join(str(tmp_path), "ab", "abcdef.mp3")
+
+
+def test_totals_follow_inserts_updates_and_deletes(store):
+    _put(store, "aa1.mp3", 10)
+    _put(store, "bb1.mp3", 20)
+    assert store.totals() == (2, 30)
+    store.register("aa1.mp3", 15)
+    assert store.totals() == (2, 35)
+    store.purge()
+    assert store.totals() == (0, 0)
+
+
+def test_eviction_keeps_count_within_limit(store):
+    for key in ("aa1.mp3", "bb1.mp3", "cc1.mp3"):
+        _put(store, key)
+    store.touch("aa1.mp3")
+    store.flush()
+    _put(store, "dd1.mp3")
+    assert store.totals()[0] == 3
+    assert not os.path.exists(store.path_for("bb1.mp3"))
+    assert os.path.exists(store.path_for("aa1.mp3"))
+
+
+def test_eviction_keeps_bytes_within_limit(tmp_path):
+    store = CacheStore(str(tmp_path), policy=LRUPolicy(), limits=(100, 25))
+    for key in ("aa1.mp3", "bb1.mp3", "cc1.mp3"):
+        _put(store, key, 10)
+    assert store.totals() == (2, 20)
+    store.close()
+
+
+def test_voice_quota_limits_files_per_voice(tmp_path, settings):
+    settings(cache_limit=100, cache_voice_quota=2, cache_policy="lru")
+    store = CacheStore(str(tmp_path))
+    for i in range(3):
+        _put(store, f"a{i}.mp3", voice="v1")
+    _put(store, "b0.mp3", voice="v2")
+    assert store.totals()[0] == 3
+    assert not os.path.exists(store.path_for("a0.mp3"))
+    store.close()
+
+
+def test_purge_by_voice_and_age(store):
+    store._fixed_limits = (100, 0)
+    _put(store, "aa1.mp3", voice="v1")
+    _put(store, "bb1.mp3", voice="v1_style")
+    _put(store, "cc1.mp3", voice="v2")
+    # 按发音人清理时包括其风格变体 (v1_xxx)
+    assert sorted(store.purge("v1")) == ["aa1.mp3", "bb1.mp3"]
+    assert store.purge(older_than=3600) == []
+    assert store.purge() == ["cc1.mp3"]
+
+
+def test_store_is_usable_from_worker_threads(tmp_path):
+    store = CacheStore(str(tmp_path), policy=LRUPolicy(), limits=(50, 0))
+    store.TOUCH_FLUSH_SIZE = 5
+
+    async def one(i):
+        key = f"{i:04x}.mp3"
+        path = store.path_for(key)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        await asyncio.to_thread(_put, store, key)
+        for _ in range(3):
+            await asyncio.to_thread(store.touch, key, 10)
+        await asyncio.to_thread(store.record_miss, key + "x")
+
+    async def main():
+        await asyncio.gather(*(one(i) for i in range(100)))
+        return await asyncio.to_thread(store.stats)
+
+    stats = asyncio.run(main())
+    assert stats["files"] == 50 and stats["bytes"] == 500
+    assert stats["hits"] == 300 and stats["misses"] == 100
+    store.close()
@@ -0,0 +1,49 @@
+import pytest
+
+from app.services.canonical import CanonicalStats, normalize_text, raw_fingerprint
+from app.services.xf_service import xf_service
+
+
+def _key(text, voice="v", speed=100, volume=100, audio_type="audio/mp3"):
+    return xf_service._get_cache_key(text, voice, speed, volume, 50, audio_type)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("ＡＢＣ　１２３", "ABC 123"),
+    ("你好，世界！", "你好,世界!"),
+    ("  多个   空格\t\t和制表符  ", "多个 空格 和制表符"),
+    ("第一段 \n\n  第二段", "第一段\n第二段"),
+])
+def test_normalize_text(text, expected):
+    assert normalize_text(text) == expected
+
+
+def test_equivalent_texts_share_a_cache_key():
+    key = _key("你好，世界！")
+    assert _key("  你好,世界!  ") == key
+    assert _key("你好，世界！", audio_type="audio/mpeg") == key
+    assert _key("ＡＢＣ　１２３") == _key("ABC 123")
+
+
+def test_upstream_relevant_parameters_change_the_key():
+    key = _key("你好")
+    assert _key("你好", speed=120) != key
+    assert _key("你好", volume=80) != key
+    assert _key("你好", voice="w") != key
+    assert _key("你好呀") != key
+    assert _key("你好", audio_type="audio/wav") == key[:-3] + "wav"
+
+
+def test_canonical_stats_counts_hits_only_new_variants_gain():
+    stats = CanonicalStats()
+    plain = raw_fingerprint("你好", "v", 100, 100, 50, "audio/mp3")
+    spaced = raw_fingerprint(" 你好 ", "v", 100, 100, 50, "audio/mp3")
+
+    stats.observe("k", plain, hit=False)
+    stats.observe("k", plain, hit=True)
+    assert stats.extra_hits == 0
+    # 原始参数不同但命中同一缓存键: 按原始参数计算缓存键时这次会未命中
+    stats.observe("k", spaced, hit=True)
+    assert stats.extra_hits == 1
+    stats.observe("k", spaced, hit=True)
+    assert stats.stats() == {"requests": 4, "extra_hits": 1, "tracked_keys": 1}
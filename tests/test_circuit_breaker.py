@@ -0,0 +1,100 @@
+import pytest
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def breaker(settings):
+    settings(circuit_failure_rate=0.5, circuit_min_requests=4, circuit_window=30,
+             circuit_cooldown=10, circuit_half_open_probes=1)
+    return CircuitBreaker("test")
+
+
+def _call(breaker, success):
+    breaker.before_call()
+    breaker.record(success)
+
+
+def _trip(breaker):
+    for success in (True, False, True, False):
+        _call(breaker, success)
+    assert breaker.state == breaker.OPEN
+
+
+def _cool_down(breaker):
+    breaker._opened_at -= 10
+
+
+def test_stays_closed_below_min_requests(breaker):
+    for _ in range(3):
+        _call(breaker, False)
+    assert breaker.state == breaker.CLOSED
+
+
+def test_opens_when_failure_rate_reaches_threshold(breaker):
+    _call(breaker, True)
+    _call(breaker, True)
+    _call(breaker, True)
+    _call(breaker, False)
+    # 1/4 未达到 50%
+    assert breaker.state == breaker.CLOSED
+    _call(breaker, False)
+    _call(breaker, False)
+    assert breaker.state == breaker.OPEN
+
+
+def test_open_breaker_rejects_until_cooldown(breaker):
+    _trip(breaker)
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected == 1
+    assert not breaker.available()
+
+    _cool_down(breaker)
+    assert breaker.available()
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+
+
+def test_half_open_limits_probes_and_closes_on_success(breaker):
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record(True)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.stats()["window_requests"] == 0
+
+
+def test_failed_probe_reopens(breaker):
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_released_probe_frees_the_slot(breaker):
+    _trip(breaker)
+    _cool_down(breaker)
+    breaker.before_call()
+    # 探测请求被取消 (没有结果),名额归还给下一次探测
+    breaker.release()
+    assert breaker.available()
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+
+
+def test_old_outcomes_leave_the_window(breaker):
+    for _ in range(3):
+        _call(breaker, False)
+    # 之前的失败已超出 30 秒窗口
+    breaker._outcomes = type(breaker._outcomes)((t - 60, ok) for t, ok in breaker._outcomes)
+    _call(breaker, False)
+    assert breaker.state == breaker.CLOSED
+    assert breaker.stats()["window_requests"] == 1
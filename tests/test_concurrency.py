@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+from curl_cffi.requests.exceptions import HTTPError
+
+from app.core.concurrency import AdaptiveLimiter, LatencyWindow, outcome
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _finish(permit, success, latency=0.1):
+    """以固定延迟结束请求 (避免测试机上微秒级的耗时抖动被当作延迟升高)"""
+    permit._latency = latency
+    permit.release(success)
+
+
+@pytest.fixture
+def limiter(settings):
+    settings(upstream_limit_initial=2, upstream_limit_min=1, upstream_limit_max=4, upstream_latency_tolerance=2.0)
+    return AdaptiveLimiter("test")
+
+
+def test_requests_over_limit_queue_in_fifo_order(limiter):
+    order = []
+
+    async def main():
+        first = await limiter.acquire()
+        second = await limiter.acquire()
+        assert not limiter.has_headroom()
+
+        async def waiter(name):
+            permit = await limiter.acquire()
+            order.append(name)
+            return permit
+
+        tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 2 and order == []
+        first.release()
+        await asyncio.sleep(0)
+        assert order == ["a"]
+        second.release()
+        permits = await asyncio.gather(*tasks)
+        for permit in permits:
+            permit.release()
+
+    asyncio.run(main())
+    assert order == ["a", "b"]
+    assert limiter.stats()["inflight"] == 0 and limiter.has_headroom()
+
+
+def test_cancelled_waiter_leaves_queue(limiter):
+    async def main():
+        permits = [await limiter.acquire(), await limiter.acquire()]
+        task = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert limiter.stats()["queued"] == 0
+        for permit in permits:
+            permit.release()
+
+    asyncio.run(main())
+    assert limiter.stats()["inflight"] == 0
+
+
+def test_failure_halves_limit_once_per_cooldown(limiter):
+    async def main():
+        for _ in range(2):
+            permit = await limiter.acquire()
+            permit.release(success=False)
+
+    asyncio.run(main())
+    # 第二次失败在冷却期内,不再下调
+    assert limiter.limit == 1
+    assert limiter.failures == 2
+
+
+def test_limit_never_drops_below_minimum(limiter):
+    limiter._limit = 1
+
+    async def main():
+        permit = await limiter.acquire()
+        permit.release(success=False)
+
+    asyncio.run(main())
+    assert limiter.limit == 1
+
+
+def test_success_grows_limit_only_when_nearly_saturated(limiter):
+    limiter._limit = 3
+
+    async def main():
+        # 只有 1 个请求在进行时成功,不增加上限
+        permit = await limiter.acquire()
+        _finish(permit, True)
+        idle_limit = limiter.limit
+        # 名额接近用满 (进行中 >= 上限 - 1) 时成功,上限加 1/limit
+        permits = [await limiter.acquire(), await limiter.acquire()]
+        _finish(permits[0], True)
+        permits[1].release()
+        return idle_limit
+
+    idle_limit = asyncio.run(main())
+    assert idle_limit == 3
+    assert limiter.limit == pytest.approx(3 + 1 / 3)
+
+
+def test_limit_is_capped_at_maximum(limiter):
+    limiter._limit = 4
+
+    async def main():
+        permits = [await limiter.acquire() for _ in range(4)]
+        for permit in permits:
+            _finish(permit, True)
+
+    asyncio.run(main())
+    assert limiter.limit == 4
+
+
+def test_latency_spike_reduces_limit(limiter):
+    limiter._short_latency = limiter._long_latency = 0.01
+    limiter._record(True, 10.0)
+    assert limiter.limit == 1
+
+
+def test_release_is_idempotent_and_uses_marked_latency(limiter):
+    async def main():
+        permit = await limiter.acquire()
+        permit.mark_latency()
+        marked = permit._latency
+        await asyncio.sleep(0.05)
+        permit.release(success=True)
+        permit.release(success=True)
+        return marked
+
+    marked = asyncio.run(main())
+    assert limiter.successes == 1 and limiter.stats()["inflight"] == 0
+    assert limiter._long_latency == marked
+
+
+def test_slot_classifies_errors(limiter):
+    async def run(error):
+        try:
+            async with limiter.slot():
+                if error is not None:
+                    raise error
+        except BaseException:
+            pass
+
+    asyncio.run(run(None))
+    asyncio.run(run(HTTPError("bad request", response=_Response(400))))
+    assert (limiter.successes, limiter.failures) == (1, 0)
+    asyncio.run(run(ConnectionError("reset")))
+    assert (limiter.successes, limiter.failures) == (1, 1)
+    assert limiter.stats()["inflight"] == 0
+
+
+@pytest.mark.parametrize("error, expected", [
+    (None, True),
+    (asyncio.CancelledError(), None),
+    (asyncio.TimeoutError(), False),
+    (RuntimeError(), None),
+])
+def test_outcome(error, expected):
+    assert outcome(error) is expected
+
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.5) is None
+    for value in range(1, 201):
+        window.add(value)
+    assert len(window) == 100
+    assert window.percentile(0) == 101
+    assert window.percentile(0.95) == 195
+    assert window.percentile(1) == 200
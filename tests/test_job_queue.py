@@ -0,0 +1,139 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.services.job_queue import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+def _submit(store, text):
+    job = store.create(text, "voice", 100, 100, "audio/mp3")
+    # 保证 created 严格递增,领取顺序确定
+    time.sleep(0.002)
+    return job
+
+
+def _set_owner(store, job_id, owner):
+    store.conn.execute("UPDATE jobs SET owner = ? WHERE id = ?", (owner, job_id))
+
+
+def _dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_claim_takes_oldest_pending_job_once(store):
+    first = _submit(store, "a")
+    second = _submit(store, "b")
+
+    claimed = store.claim(lease=60)
+    assert claimed["id"] == first["id"]
+    assert claimed["status"] == "running" and claimed["attempts"] == 1
+    assert store.claim(lease=60)["id"] == second["id"]
+    assert store.claim(lease=60) is None
+
+
+def test_expired_lease_is_reclaimed(store):
+    job = _submit(store, "a")
+    assert store.claim(lease=-1)["id"] == job["id"]
+
+    reclaimed = store.claim(lease=60)
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["attempts"] == 2
+    # 新租约未过期,不会被再次领取
+    assert store.claim(lease=60) is None
+
+
+def test_requeue_and_finish(store):
+    job = _submit(store, "a")
+    store.claim(lease=60)
+    store.requeue(job["id"], "timeout")
+    requeued = store.get(job["id"])
+    assert requeued["status"] == "pending" and requeued["error"] == "timeout"
+
+    store.claim(lease=60)
+    store.finish(job["id"], cache_key="abc.mp3")
+    done = store.get(job["id"])
+    assert done["status"] == "done" and done["cache_key"] == "abc.mp3" and done["attempts"] == 2
+
+    other = _submit(store, "b")
+    store.claim(lease=60)
+    store.finish(other["id"], error="bad voice")
+    assert store.get(other["id"])["status"] == "failed"
+    assert store.counts() == {"done": 1, "failed": 1}
+
+
+def test_release_orphans_only_touches_jobs_of_dead_processes(store):
+    dead = _submit(store, "dead")
+    alive = _submit(store, "alive")
+    own = _submit(store, "own")
+    for _ in range(3):
+        store.claim(lease=600)
+    _set_owner(store, dead["id"], _dead_pid())
+    _set_owner(store, alive["id"], os.getppid())
+    # 当前进程领取的任务属于重启前的同一 PID,也视为孤儿
+
+    assert store.release_orphans() == 2
+    assert store.get(dead["id"])["status"] == "pending"
+    assert store.get(own["id"])["status"] == "pending"
+    assert store.get(alive["id"])["status"] == "running"
+
+
+def test_cleanup_removes_only_old_finished_jobs(store):
+    old = _submit(store, "old")
+    pending = _submit(store, "pending")
+    store.claim(lease=60)
+    store.finish(old["id"], cache_key="x.mp3")
+    store.conn.execute("UPDATE jobs SET updated = updated - 1000")
+
+    assert store.cleanup(retention=500) == 1
+    assert store.get(old["id"]) is None
+    assert store.get(pending["id"]) is not None
+
+
+def test_worker_retries_failed_job_until_max_attempts(store, settings, monkeypatch):
+    from app.services import job_queue as module
+
+    settings(job_workers=1, job_rate_limit=0, job_max_attempts=2)
+    calls = []
+
+    async def ensure_cached(text, *args, **kwargs):
+        calls.append(text)
+        if text == "bad":
+            raise ConnectionError("reset")
+        return f"{text}.mp3"
+
+    monkeypatch.setattr(module.xf_service, "ensure_cached", ensure_cached)
+    monkeypatch.setattr(module.xf_service.presigner, "schedule", lambda *args, **kwargs: None)
+
+    async def main():
+        queue = module.JobQueue()
+        queue.store = store
+        queue.start()
+        good = await queue.submit("good", "voice", 100, 100, "audio/mp3")
+        bad = await queue.submit("bad", "voice", 100, 100, "audio/mp3")
+        for _ in range(200):
+            if store.counts() == {"done": 1, "failed": 1}:
+                break
+            await asyncio.sleep(0.01)
+        for task in queue._workers:
+            task.cancel()
+        await asyncio.gather(*queue._workers, return_exceptions=True)
+        return good, bad
+
+    good, bad = asyncio.run(main())
+    assert store.get(good["id"])["cache_key"] == "good.mp3"
+    failed = store.get(bad["id"])
+    assert failed["status"] == "failed" and failed["attempts"] == 2 and failed["error"] == "reset"
+    assert calls.count("bad") == 2
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import threading
+
+from app.core.logger import BoundedQueueHandler, LogQueue
+
+
+def _record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_handler_drops_records_when_entry_queue_is_full():
+    handler = BoundedQueueHandler(maxsize=2)
+    for i in range(5):
+        handler.handle(_record("line %d", i))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_prepare_defers_formatting_of_immutable_arguments():
+    handler = BoundedQueueHandler(maxsize=10)
+    record = handler.prepare(_record("%s=%d", "a", 1))
+    # 参数不可变: 原样交给监听线程格式化
+    assert record.msg == "%s=%d" and record.args == ("a", 1)
+    assert record.getMessage() == "a=1"
+
+
+def test_prepare_snapshots_mutable_arguments():
+    handler = BoundedQueueHandler(maxsize=10)
+    items = [1, 2]
+    record = handler.prepare(_record("items=%s", items))
+    items.append(3)
+    assert record.args is None
+    assert record.getMessage() == "items=[1, 2]"
+
+
+def test_subscription_filters_and_drops_oldest_when_full():
+    log_queue = LogQueue(maxlen=100, subscriber_maxsize=3)
+
+    async def main():
+        warnings = log_queue.subscribe(logging.WARNING)
+        keyword = log_queue.subscribe(keyword="CACHE")
+        for i in range(5):
+            log_queue.append(f"warning {i}", logging.WARNING)
+        log_queue.append("[缓存] cache hit", logging.INFO)
+        await asyncio.sleep(0)
+        received = [warnings.queue.get_nowait().text for _ in range(warnings.queue.qsize())]
+        matched = [keyword.queue.get_nowait().text for _ in range(keyword.queue.qsize())]
+        log_queue.unsubscribe(warnings)
+        log_queue.unsubscribe(keyword)
+        return received, warnings.dropped, matched
+
+    received, dropped, matched = asyncio.run(main())
+    assert received == ["warning 2", "warning 3", "warning 4"]
+    assert dropped == 2
+    assert matched == ["[缓存] cache hit"]
+    assert log_queue.stats()["subscriber_dropped"] == 2
+    assert log_queue.stats()["subscribers"] == 0
+
+
+def test_append_from_another_thread_is_delivered_on_the_loop():
+    log_queue = LogQueue(maxlen=100)
+
+    async def main():
+        subscription = log_queue.subscribe()
+        thread = threading.Thread(target=lambda: [log_queue.append(f"line {i}") for i in range(3)])
+        thread.start()
+        thread.join()
+        entries = [await asyncio.wait_for(subscription.queue.get(), 1) for _ in range(3)]
+        log_queue.unsubscribe(subscription)
+        return entries
+
+    entries = asyncio.run(main())
+    assert [entry.seq for entry in entries] == [1, 2, 3]
+    assert entries[0].frame == b'id: 1\ndata: "line 0"\n\n'
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.api import endpoints
+from app.core.logger import LogQueue
+
+
+class FakeRequest:
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture
+def log_queue(monkeypatch):
+    log_queue = LogQueue(maxlen=5)
+    monkeypatch.setattr(endpoints, "log_queue", log_queue)
+    return log_queue
+
+
+def _fill(log_queue, count):
+    for i in range(1, count + 1):
+        log_queue.append(f"line {i}", logging.WARNING if i % 2 == 0 else logging.INFO)
+
+
+def _ids(frame: bytes):
+    return [int(line[4:]) for line in frame.decode("utf-8").splitlines() if line.startswith("id: ")]
+
+
+def _first_frames(count, headers=None, **params):
+    """打开日志流,返回前 count 帧"""
+    params = dict(dict.fromkeys(("level", "q", "tail", "last_event_id")), **params)
+
+    async def main():
+        response = await endpoints.stream_logs(FakeRequest(headers), **params)
+        frames = []
+        iterator = response.body_iterator
+        try:
+            for _ in range(count):
+                frames.append(await asyncio.wait_for(iterator.__anext__(), 1))
+        finally:
+            await iterator.aclose()
+        return frames
+
+    return asyncio.run(main())
+
+
+def test_snapshot_after_returns_only_newer_entries(log_queue):
+    _fill(log_queue, 4)
+    assert [e.seq for e in log_queue.snapshot()] == [1, 2, 3, 4]
+    assert [e.seq for e in log_queue.snapshot(after=2)] == [3, 4]
+    assert log_queue.snapshot(after=4) == []
+
+
+def test_snapshot_after_handles_gap_and_restart(log_queue):
+    _fill(log_queue, 8)
+    # 序号 1~3 已被挤出历史: 返回保留的全部日志,由调用方报告缺口
+    assert [e.seq for e in log_queue.snapshot(after=1)] == [4, 5, 6, 7, 8]
+    # 客户端的序号比当前还大 (服务已重启): 返回全部
+    assert [e.seq for e in log_queue.snapshot(after=100)] == [4, 5, 6, 7, 8]
+
+
+def test_first_connection_sends_history_with_tail(log_queue):
+    _fill(log_queue, 4)
+    assert _ids(_first_frames(1)[0]) == [1, 2, 3, 4]
+    assert _ids(_first_frames(1, tail=2)[0]) == [3, 4]
+
+
+def test_reconnect_resumes_after_last_event_id(log_queue):
+    _fill(log_queue, 4)
+    frames = _first_frames(1, headers={"last-event-id": "2"})
+    assert _ids(frames[0]) == [3, 4]
+    # 查询参数与请求头效果相同
+    assert _ids(_first_frames(1, last_event_id=3)[0]) == [4]
+
+
+def test_reconnect_reports_gap_before_remaining_history(log_queue):
+    _fill(log_queue, 8)
+    gap, history = _first_frames(2, headers={"last-event-id": "1"})
+    assert gap == b"event: gap\ndata: 2\n\n"
+    assert _ids(history) == [4, 5, 6, 7, 8]
+
+
+def test_stream_filters_history_by_level_and_keyword(log_queue):
+    _fill(log_queue, 4)
+    assert _ids(_first_frames(1, level="warning")[0]) == [2, 4]
+    assert _ids(_first_frames(1, q="LINE 3")[0]) == [3]
+
+
+def test_live_entries_follow_history_without_duplicates(log_queue):
+    _fill(log_queue, 2)
+
+    async def main():
+        response = await endpoints.stream_logs(FakeRequest(), level=None, q=None, tail=None, last_event_id=None)
+        iterator = response.body_iterator
+        try:
+            history = await iterator.__anext__()
+            log_queue.append("line 3")
+            log_queue.append("line 4")
+            live = await asyncio.wait_for(iterator.__anext__(), 1)
+        finally:
+            await iterator.aclose()
+        return history, live
+
+    history, live = asyncio.run(main())
+    assert _ids(history) == [1, 2]
+    # 突发的日志合并为一帧
+    assert _ids(live) == [3, 4]
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.services.memory_cache import MemoryCache
+
+
+@pytest.fixture
+def cache(settings):
+    settings(memory_cache_bytes=100, memory_cache_max_item_bytes=60, memory_cache_promote_hits=2)
+    return MemoryCache()
+
+
+def test_promotes_after_repeated_disk_hits(cache):
+    assert not cache.should_promote("a", 10)
+    assert cache.should_promote("a", 10)
+    # 超过单条上限的文件不进入内存
+    assert not cache.should_promote("big", 61)
+    assert not cache.should_promote("big", 61)
+
+
+def test_put_evicts_lru_and_demotes_missing_disk_copies_in_a_thread(cache, tmp_path):
+    demoted = []
+    cache.on_demote = lambda key, size: demoted.append((key, size, threading.current_thread() is threading.main_thread()))
+    kept = tmp_path / "ab" / "kept"
+    kept.parent.mkdir()
+    kept.write_bytes(b"disk")
+
+    async def main():
+        await cache.put("kept", b"k" * 40, str(kept))
+        await cache.put("lost", b"l" * 40, str(tmp_path / "ab" / "lost"))
+        cache.get("kept")
+        await cache.put("new", b"n" * 40, str(tmp_path / "ab" / "new"))
+
+    asyncio.run(main())
+    assert "lost" not in cache and "kept" in cache and "new" in cache
+    assert cache.size == 80
+    # 磁盘副本已不存在的条目写回磁盘,登记回调不在事件循环线程中执行
+    assert (tmp_path / "ab" / "lost").read_bytes() == b"l" * 40
+    assert demoted == [("lost", 40, False)]
+    assert cache.stats()["demotions"] == 1
+
+
+def test_entry_with_disk_copy_is_not_rewritten(cache, tmp_path):
+    path = tmp_path / "a"
+    path.write_bytes(b"disk")
+
+    async def main():
+        await cache.put("a", b"a" * 60, str(path))
+        await cache.put("b", b"b" * 60, str(tmp_path / "b"))
+
+    asyncio.run(main())
+    assert path.read_bytes() == b"disk"
+    assert cache.stats()["demotions"] == 0
+
+
+def test_discard_and_clear(cache, tmp_path):
+    asyncio.run(cache.put("a", b"a" * 10, str(tmp_path / "a")))
+    cache.discard("a")
+    assert cache.get("a") is None and cache.size == 0
+    asyncio.run(cache.put("b", b"b" * 10, str(tmp_path / "b")))
+    cache.clear()
+    assert cache.stats()["entries"] == 0 and not os.path.exists(tmp_path / "b")
@@ -0,0 +1,36 @@
+import pytest
+
+from app.core.config import config
+from app.core.metrics import audio_format, voice_label
+from app.core.speakers import SpeakerIndex
+
+
+@pytest.fixture(autouse=True)
+def speakers(monkeypatch):
+    monkeypatch.setattr(config, "speaker_index", SpeakerIndex([
+        {"name": "聆小糖", "param": "565854553", "code": "xt"},
+    ]))
+
+
+@pytest.mark.parametrize("voice, expected", [
+    ("565854553", "565854553"),
+    ("聆小糖", "565854553"),
+    ("xt", "565854553"),
+    ("<script>", "other"),
+    ("x" * 200, "other"),
+    ("", ""),
+])
+def test_voice_label_resolves_known_speakers_and_folds_the_rest(voice, expected):
+    assert voice_label(voice) == expected
+
+
+@pytest.mark.parametrize("audio_type, expected", [
+    ("audio/mp3", "mp3"),
+    ("audio/mpeg", "mpeg"),
+    ("audio/WAV", "wav"),
+    ("pcm", "pcm"),
+    ("audio/x-anything-else", "other"),
+    ("", ""),
+])
+def test_audio_format_label_is_bounded(audio_type, expected):
+    assert audio_format(audio_type) == expected
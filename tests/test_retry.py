@@ -0,0 +1,120 @@
+import asyncio
+import random
+
+import pytest
+from curl_cffi.requests.exceptions import HTTPError
+
+from app.core.retry import (RetryBudget, RetryBudgetExhausted, RetryPolicy, UpstreamResponseError, is_retryable,
+                            retry_call)
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _http_error(status):
+    return HTTPError(f"HTTP {status}", response=_Response(status))
+
+
+def _flaky(failures, error=None):
+    """前 failures 次调用抛出 error,之后返回尝试序号"""
+    calls = []
+
+    async def func(attempt):
+        calls.append(attempt)
+        if len(calls) <= failures:
+            raise error or ConnectionError("reset")
+        return attempt
+
+    return func, calls
+
+
+def test_backoff_is_full_jitter_within_cap():
+    random.seed(1)
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+    for attempt, cap in [(0, 1.0), (1, 2.0), (2, 4.0), (3, 8.0), (6, 8.0)]:
+        samples = [policy.backoff(attempt) for _ in range(200)]
+        assert all(0 <= s <= cap for s in samples)
+        # 全抖动: 取值分散在整个区间,而不是集中在上限附近
+        assert min(samples) < cap * 0.2 and max(samples) > cap * 0.8
+
+
+def test_budget_allows_min_tokens_then_ratio_of_traffic():
+    budget = RetryBudget(ratio=0.5, min_tokens=2, max_tokens=3)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(100):
+        budget.deposit()
+    assert budget.tokens == 3
+
+
+@pytest.mark.parametrize("error, expected", [
+    (asyncio.TimeoutError(), True),
+    (ConnectionError(), True),
+    (UpstreamResponseError(), True),
+    (_http_error(429), True),
+    (_http_error(503), True),
+    (_http_error(404), False),
+    (RuntimeError(), False),
+])
+def test_is_retryable(error, expected):
+    assert is_retryable(error) is expected
+
+
+def test_retry_call_retries_until_success():
+    func, calls = _flaky(2)
+    result = asyncio.run(retry_call(func, RetryPolicy(max_attempts=5, base_delay=0)))
+    assert result == 2
+    assert calls == [0, 1, 2]
+
+
+def test_retry_call_stops_after_max_attempts():
+    func, calls = _flaky(10)
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_call(func, RetryPolicy(max_attempts=3, base_delay=0)))
+    assert len(calls) == 3
+
+
+def test_retry_call_does_not_retry_client_errors():
+    func, calls = _flaky(10, _http_error(400))
+    with pytest.raises(HTTPError):
+        asyncio.run(retry_call(func, RetryPolicy(max_attempts=5, base_delay=0)))
+    assert len(calls) == 1
+
+
+def test_retry_call_gives_up_when_budget_is_exhausted():
+    budget = RetryBudget(ratio=0, min_tokens=1)
+    func, calls = _flaky(10)
+    with pytest.raises(RetryBudgetExhausted):
+        asyncio.run(retry_call(func, RetryPolicy(max_attempts=5, base_delay=0), budget))
+    # 首次请求 + 预算允许的 1 次重试
+    assert len(calls) == 2
+
+
+def test_retry_call_applies_attempt_timeout():
+    calls = []
+
+    async def func(attempt):
+        calls.append(attempt)
+        if attempt == 0:
+            await asyncio.sleep(1)
+        return attempt
+
+    policy = RetryPolicy(max_attempts=2, base_delay=0, attempt_timeout=0.05)
+    assert asyncio.run(retry_call(func, policy)) == 1
+    assert calls == [0, 1]
+
+
+def test_retry_call_respects_overall_deadline():
+    func, calls = _flaky(10)
+    policy = RetryPolicy(max_attempts=10, base_delay=1.0, max_delay=1.0, deadline=0.01)
+    random.seed(0)
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_call(func, policy))
+    # 退避时间超过剩余的截止时间,不再重试
+    assert len(calls) < 10
@@ -0,0 +1,38 @@
+from app.services.text_splitter import SentenceSegmenter
+
+
+def test_sentence_is_emitted_only_after_following_text_arrives():
+    segmenter = SentenceSegmenter(50)
+    assert segmenter.feed("你好") == []
+    # 句末标点后面可能还有 "！" 或引号,要等到下一个字符才确定句子结束
+    assert segmenter.feed("。") == []
+    assert segmenter.feed("世") == ["你好。"]
+    assert segmenter.feed("界！") == []
+    assert segmenter.feed("”ok") == ["世界！”"]
+    assert segmenter.flush() == ["ok"]
+    assert segmenter.flush() == []
+
+
+def test_english_period_followed_by_space_ends_sentence():
+    segmenter = SentenceSegmenter(50)
+    assert segmenter.feed("Hello world. How") == ["Hello world."]
+    assert segmenter.feed(" are you? ") == ["How are you?"]
+    assert segmenter.flush() == []
+
+
+def test_decimal_point_does_not_end_sentence():
+    segmenter = SentenceSegmenter(50)
+    assert segmenter.feed("价格是3.5元") == []
+    assert segmenter.flush() == ["价格是3.5元"]
+
+
+def test_overlong_sentence_is_cut_at_clause_then_by_length():
+    segmenter = SentenceSegmenter(5)
+    assert segmenter.feed("一二三，四五六七八九") == ["一二三，", "四五六七八"]
+    assert segmenter.flush() == ["九"]
+
+
+def test_punctuation_only_fragments_are_dropped():
+    segmenter = SentenceSegmenter(50)
+    assert segmenter.feed("。！ 好") == []
+    assert segmenter.flush() == ["好"]
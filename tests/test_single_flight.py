@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+import pytest
+
+from app.services.single_flight import InflightDownload
+
+
+class FakeResponse:
+    """按固定大小分块返回数据的上游流式响应"""
+
+    def __init__(self, data: bytes, fail_after: int = None, close_delay: float = 0.0):
+        self.data = data
+        self.fail_after = fail_after
+        self.close_delay = close_delay
+        self.closed = False
+
+    async def aiter_content(self, chunk_size=4096):
+        for i in range(0, len(self.data), 1000):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise ConnectionError("reset")
+            await asyncio.sleep(0.001)
+            yield self.data[i:i + 1000]
+
+    async def aclose(self):
+        await asyncio.sleep(self.close_delay)
+        self.closed = True
+
+
+async def _read(download: InflightDownload) -> bytes:
+    return b"".join([chunk async for chunk in download.aiter_content(chunk_size=4096)])
+
+
+def _start(cache_path, response, **callbacks):
+    opened = []
+
+    async def opener():
+        opened.append(1)
+        return response
+
+    download = InflightDownload(str(cache_path), **callbacks)
+    download.start(opener)
+    return download, opened
+
+
+def test_concurrent_readers_share_one_download(tmp_path):
+    data = os.urandom(50000)
+    saved, done = [], []
+
+    async def main():
+        download, opened = _start(tmp_path / "a.mp3", FakeResponse(data),
+                                  on_saved=lambda d: saved.append(d.size), on_done=done.append)
+        await download.wait_ready()
+        results = await asyncio.gather(*(_read(download) for _ in range(3)))
+        await download.wait_done()
+        return download, opened, results
+
+    download, opened, results = asyncio.run(main())
+    assert opened == [1]
+    assert all(result == data for result in results)
+    assert saved == [len(data)] and done == [download]
+    assert (tmp_path / "a.mp3").read_bytes() == data
+    assert not os.path.exists(download.temp_path)
+
+
+def test_late_reader_reads_renamed_cache_file(tmp_path):
+    data = os.urandom(20000)
+
+    async def main():
+        # 关闭上游响应较慢: 重命名之后、关闭完成之前开始读取
+        download, _ = _start(tmp_path / "a.mp3", FakeResponse(data, close_delay=0.2))
+        await download.wait_ready()
+        while not (tmp_path / "a.mp3").exists():
+            await asyncio.sleep(0.005)
+        during_close = await _read(download)
+        await download.wait_done()
+        after_done = await _read(download)
+        return download, during_close, after_done
+
+    download, during_close, after_done = asyncio.run(main())
+    assert download.done and download.error is None
+    assert during_close == data and after_done == data
+
+
+def test_opener_failure_is_raised_to_waiters(tmp_path):
+    async def main():
+        async def opener():
+            raise ConnectionError("sign failed")
+
+        download = InflightDownload(str(tmp_path / "a.mp3"))
+        download.start(opener)
+        with pytest.raises(ConnectionError):
+            await download.wait_ready()
+        await download.wait_done()
+        return download
+
+    download = asyncio.run(main())
+    assert download.done
+    assert not (tmp_path / "a.mp3").exists()
+
+
+def test_midstream_error_reaches_readers_and_discards_partial_file(tmp_path):
+    saved = []
+
+    async def main():
+        response = FakeResponse(os.urandom(20000), fail_after=5000)
+        download, _ = _start(tmp_path / "a.mp3", response, on_saved=saved.append)
+        await download.wait_ready()
+        with pytest.raises(ConnectionError):
+            await _read(download)
+        await download.wait_done()
+        return download, response
+
+    download, response = asyncio.run(main())
+    assert response.closed
+    assert saved == []
+    assert not (tmp_path / "a.mp3").exists()
+    assert not os.path.exists(download.temp_path)
@@ -0,0 +1,31 @@
+from app.services.text_splitter import split_sentences, split_text
+
+
+def test_split_sentences_keeps_punctuation():
+    assert split_sentences("第一句。第二句！！第三句") == ["第一句。", "第二句！！", "第三句"]
+
+
+def test_split_text_merges_short_sentences_up_to_limit():
+    assert split_text("一。二。三。四。", 4) == ["一。二。", "三。四。"]
+    assert split_text("第一句。第二句！第三句？", 6) == ["第一句。", "第二句！", "第三句？"]
+
+
+def test_split_text_splits_long_sentence_at_clauses_then_by_length():
+    chunks = split_text("一二三四五六七八九十，一二三四五。", 8)
+    assert chunks == ["一二三四五六七八", "九十，", "一二三四五。"]
+    assert all(len(chunk) <= 8 for chunk in chunks)
+
+
+def test_split_text_attaches_punctuation_only_pieces_to_previous_chunk():
+    assert split_text("短句。！？", 3) == ["短句。！？"]
+
+
+def test_split_text_preserves_content():
+    text = "今天天气很好，我们去公园散步吧。你觉得怎么样？好的！" * 5
+    chunks = split_text(text, 20)
+    assert "".join(chunks) == text
+    assert all(0 < len(chunk) <= 20 for chunk in chunks)
+
+
+def test_split_text_drops_blank_chunks():
+    assert split_text("  \n\n ", 10) == []
@@ -0,0 +1,101 @@
+import asyncio
+import gc
+
+import pytest
+from curl_cffi.requests.exceptions import HTTPError
+
+from app.services.xf_service import XFService
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, fail_midway=False):
+        self.status_code = status_code
+        self.fail_midway = fail_midway
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"HTTP {self.status_code}", response=self)
+
+    async def aiter_content(self, chunk_size=4096):
+        for _ in range(3):
+            await asyncio.sleep(0.001)
+            yield b"x" * 10
+        if self.fail_midway:
+            raise ConnectionError("reset")
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+
+    async def aget(self, url, **kwargs):
+        return self.response
+
+
+@pytest.fixture
+def service():
+    return XFService()
+
+
+def _inflight(service):
+    return service.synth_limiter.stats()["inflight"]
+
+
+def test_slot_is_held_until_body_is_read_and_closed(service):
+    async def main():
+        stream = await service._open_stream("http://upstream/synth", FakeClient(FakeResponse()))
+        during = _inflight(service)
+        body = b"".join([chunk async for chunk in stream.aiter_content()])
+        await stream.aclose()
+        return during, body, stream
+
+    during, body, stream = asyncio.run(main())
+    assert during == 1
+    assert body == b"x" * 30 and stream.closed
+    assert _inflight(service) == 0
+    assert service.synth_limiter.successes == 1
+
+
+def test_midstream_error_releases_slot_as_failure(service):
+    async def main():
+        stream = await service._open_stream("http://upstream/synth", FakeClient(FakeResponse(fail_midway=True)))
+        with pytest.raises(ConnectionError):
+            async for _ in stream.aiter_content():
+                pass
+        await stream.aclose()
+
+    asyncio.run(main())
+    assert _inflight(service) == 0
+    assert service.synth_limiter.failures == 1
+    assert service.synth_breaker.stats()["window_failures"] == 1
+
+
+def test_error_status_releases_slot_before_returning(service):
+    response = FakeResponse(status_code=404)
+
+    async def main():
+        with pytest.raises(HTTPError):
+            await service._open_stream("http://upstream/synth", FakeClient(response))
+
+    asyncio.run(main())
+    assert response.closed
+    assert _inflight(service) == 0
+    # 4xx 说明请求本身有误,不计入上游过载
+    assert service.synth_limiter.failures == 0
+
+
+def test_abandoned_stream_releases_slot_when_collected(service):
+    async def main():
+        stream = await service._open_stream("http://upstream/synth", FakeClient(FakeResponse()))
+        held = _inflight(service)
+        # 未读取也未关闭就被丢弃的流
+        del stream
+        gc.collect()
+        return held
+
+    assert asyncio.run(main()) == 1
+    assert _inflight(service) == 0
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.concurrency import AdaptiveLimiter
+from app.services import warmup
+from app.services.warmup import WarmupService
+
+
+@pytest.fixture
+def upstream(monkeypatch, settings):
+    settings(circuit_cooldown=10, circuit_half_open_probes=1)
+    service = warmup.xf_service
+    for stage in ("sign", "synth"):
+        monkeypatch.setattr(service, f"{stage}_limiter", AdaptiveLimiter(stage))
+        monkeypatch.setattr(service, f"{stage}_breaker", CircuitBreaker(stage))
+    return service
+
+
+def test_idle_when_limiters_have_headroom_and_breakers_closed(upstream):
+    assert WarmupService._upstream_idle()
+
+
+def test_waits_while_breaker_cools_down(upstream):
+    upstream.synth_breaker._trip(time.monotonic(), "test")
+    assert not WarmupService._upstream_idle()
+
+
+def test_open_breaker_past_cooldown_lets_warmup_probe(upstream):
+    breaker = upstream.synth_breaker
+    breaker._trip(time.monotonic() - 10, "test")
+    # 没有实时请求时,预热请求作为半开探测请求
+    assert WarmupService._upstream_idle()
+    breaker.before_call()
+    assert breaker.state == breaker.HALF_OPEN
+    assert not WarmupService._upstream_idle()
+    breaker.record(True)
+    assert WarmupService._upstream_idle()